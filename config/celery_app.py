@@ -2,6 +2,8 @@ import os
 
 from celery import Celery
 from celery.signals import setup_logging
+from celery.signals import task_postrun
+from celery.signals import task_prerun
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.local")
@@ -24,5 +26,24 @@ def config_loggers(*args, **kwargs):
     dictConfig(settings.LOGGING)
 
 
+_clock_tokens = {}
+
+
+@task_prerun.connect
+def start_clock_scope(task_id=None, **kwargs):
+    from scaleos.shared import clock
+
+    _clock_tokens[task_id] = clock.start_scope()
+
+
+@task_postrun.connect
+def end_clock_scope(task_id=None, **kwargs):
+    from scaleos.shared import clock
+
+    token = _clock_tokens.pop(task_id, None)
+    if token is not None:
+        clock.end_scope(token)
+
+
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
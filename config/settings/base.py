@@ -6,6 +6,7 @@ import ssl
 from pathlib import Path
 
 import environ
+from celery.schedules import crontab
 from django.utils.translation import gettext_lazy as _
 
 BASE_DIR = Path(__file__).resolve(strict=True).parent.parent.parent
@@ -190,6 +191,7 @@ AUTH_PASSWORD_VALIDATORS = [
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#middleware
 MIDDLEWARE = [
+    "scaleos.shared.middleware.ClockMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
@@ -366,6 +368,25 @@ CELERY_TASK_TIME_LIMIT = 5 * 60
 CELERY_TASK_SOFT_TIME_LIMIT = 60
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#beat-scheduler
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
+# https://docs.celeryq.dev/en/stable/userguide/periodic-tasks.html#beat-entries
+CELERY_BEAT_SCHEDULE = {
+    "relay-notification-outbox": {
+        "task": "scaleos.notifications.tasks.relay_notification_outbox",
+        "schedule": 5.0,
+    },
+    "send-notification-digests": {
+        "task": "scaleos.notifications.tasks.send_notification_digests",
+        "schedule": 60.0,
+    },
+    "send-payment-reminders": {
+        "task": "scaleos.payments.tasks.send_payment_reminders",
+        "schedule": crontab(hour=8, minute=0),
+    },
+    "sync-open-mollie-payments": {
+        "task": "scaleos.payments.tasks.sync_open_mollie_payments",
+        "schedule": crontab(minute="*/15"),
+    },
+}
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#worker-send-task-events
 CELERY_WORKER_SEND_TASK_EVENTS = True
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#std-setting-task_send_sent_event
@@ -451,6 +472,8 @@ WEBPUSH_SETTINGS = {
     "VAPID_PRIVATE_KEY": env("VAPID_PRIVATE_KEY"),
     "VAPID_ADMIN_EMAIL": env("VAPID_ADMIN_EMAIL"),
 }
+# the number of concurrent pushes and pooled connections per worker process
+WEBPUSH_POOL_SIZE = env.int("WEBPUSH_POOL_SIZE", default=10)
 
 SOFTWARE_OWNING_COMPANY_REGISTERED_ID = env(
     "SOFTWARE_OWNING_COMPANY_REGISTERED_ID",
@@ -461,5 +484,13 @@ SOFTWARE_OWNING_COMPANY_REGISTERED_COUNTRY = env(
     default="BE",
 )
 
+# keep the payment revenue summary table up to date for year-to-date figures
+PAYMENTS_REVENUE_SUMMARY = env.bool("PAYMENTS_REVENUE_SUMMARY", default=False)
+
+# the Mollie API, point it to `manage.py mollie_stub_server` to work offline
+MOLLIE_API_ENDPOINT = env("MOLLIE_API_ENDPOINT", default="https://api.mollie.com")
+# the number of pooled connections to the Mollie API per worker process
+MOLLIE_POOL_SIZE = env.int("MOLLIE_POOL_SIZE", default=10)
+
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 5000  # or a number that suits your use case
 ENCRYPTION_KEY = env("DJANGO_ENCRYPTION_KEY", None)
@@ -53,6 +53,10 @@ urlpatterns = [
         "htmx/notification/",
         include("scaleos.notifications.urls_htmx", namespace="notifications_htmx"),
     ),
+    path(
+        "payment/",
+        include("scaleos.payments.urls", namespace="payments"),
+    ),
     path(
         "htmx/payment/",
         include("scaleos.payments.urls_htmx", namespace="payments_htmx"),
@@ -6,7 +6,7 @@ from django.urls import reverse
 from templated_email import send_templated_mail
 
 from scaleos.reservations import models as reservation_models
-from scaleos.shared.mixins import ITS_NOW
+from scaleos.shared import clock
 
 logger = logging.getLogger(__name__)
 
@@ -64,5 +64,5 @@ def send_custom_templated_email(request, emailconfirmation, reservation=None):
         )
 
     if emailconfirmation.sent is None:
-        emailconfirmation.sent = ITS_NOW
+        emailconfirmation.sent = clock.now()
         emailconfirmation.save()
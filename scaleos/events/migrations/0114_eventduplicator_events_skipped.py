@@ -0,0 +1,18 @@
+# Generated by Django 5.0.12 on 2026-10-18 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0113_eventfloor_floor_layout_alter_eventfloor_floor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventduplicator',
+            name='events_skipped',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='events skipped'),
+        ),
+    ]
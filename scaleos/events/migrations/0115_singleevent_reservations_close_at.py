@@ -0,0 +1,52 @@
+# Generated by Django 5.0.12 on 2026-10-18 12:38
+
+from dateutil.relativedelta import relativedelta
+from django.db import migrations, models
+
+
+def calculate_reservations_close_at(event):
+    reservation_settings = event.reservation_settings
+    if reservation_settings is None and event.concept is not None:
+        reservation_settings = event.concept.reservation_settings
+    if event.starting_at is None or reservation_settings is None:
+        return None
+
+    interval = reservation_settings.close_reservation_interval
+    amount = reservation_settings.close_reservation_time_amount
+    if interval == "at_start":
+        return event.starting_at
+    if interval == "on_end":
+        return event.ending_on
+    if amount is None or not interval:
+        return None
+    return event.starting_at - relativedelta(**{interval: amount})
+
+
+def store_reservations_close_at(apps, schema_editor):
+    SingleEvent = apps.get_model("events", "SingleEvent")
+
+    events = list(
+        SingleEvent.objects.filter(starting_at__isnull=False).select_related(
+            "reservation_settings",
+            "concept__reservation_settings",
+        ),
+    )
+    for event in events:
+        event.reservations_close_at = calculate_reservations_close_at(event)
+    SingleEvent.objects.bulk_update(events, ["reservations_close_at"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0114_eventduplicator_events_skipped'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='singleevent',
+            name='reservations_close_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, help_text='calculated from the applicable reservation settings', null=True, verbose_name='reservations close at'),
+        ),
+        migrations.RunPython(store_reservations_close_at, migrations.RunPython.noop),
+    ]
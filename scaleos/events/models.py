@@ -4,22 +4,32 @@ from uuid import uuid4
 
 from dateutil.relativedelta import relativedelta
 from django.contrib.contenttypes.fields import GenericRelation
+from django.core.cache import cache
 from django.db import models
+from django.db import transaction
+from django.db.models import F
+from django.db.models import Max
+from django.db.models import Min
 from django.db.models import Q
 from django.forms import ValidationError
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from polymorphic.models import PolymorphicModel
 
 from scaleos.catering.models import CateringField
+from scaleos.events.querysets import EventManager
 from scaleos.organizations.models import B2BCustomer
 from scaleos.organizations.models import Customer
+from scaleos.payments.models import PriceMatrix
+from scaleos.reservations.models import EventReservation
 from scaleos.reservations.models import EventReservationSettings
 from scaleos.reservations.models import Reservation
+from scaleos.shared import clock
 from scaleos.shared.fields import LogInfoFields
 from scaleos.shared.fields import NameField
 from scaleos.shared.fields import PublicKeyField
 from scaleos.shared.fields import SegmentField
-from scaleos.shared.mixins import ITS_NOW
+from scaleos.shared.functions import bulk_create_multi_table
 from scaleos.shared.mixins import AdminLinkMixin
 from scaleos.shared.models import CardModel
 from scaleos.timetables.models import TimeTable
@@ -31,6 +41,7 @@ logger.setLevel(logging.DEBUG)
 # Create your models here.
 
 MAX_PERCENTAGE = 100
+CURRENT_PRICE_MATRIX_CACHE_TIMEOUT = 60 * 60 * 24
 
 
 class Concept(
@@ -94,34 +105,110 @@ class Concept(
         verbose_name = _("concept")
         verbose_name_plural = _("concepts")
 
+    @property
+    def current_price_matrix_cache_key(self):
+        return f"concept_{self.pk}_current_price_matrix"
+
     @property
     def current_price_matrix(self):
-        logger.debug("Trying to get the current price matrix for concept %s", self.id)
-        if self.price_matrixes.count() == 0:
+        """
+        The cache only holds the id of the current price matrix. Listings use
+        with_listing_data() so the price matrix comes from the prefetched
+        price matrixes, otherwise it is fetched once per concept instance.
+        """
+        resolved = cache.get(self.current_price_matrix_cache_key)
+        if resolved is None or (
+            resolved["valid_until"] is not None
+            and resolved["valid_until"] <= clock.now()
+        ):
+            resolved = self.resolve_current_price_matrix()
+
+        price_matrix_id = resolved["price_matrix_id"]
+        if price_matrix_id is None:
+            return None
+
+        # a prefetched listing already holds the price matrix
+        prefetched = getattr(self, "_prefetched_objects_cache", {}).get(
+            "price_matrixes",
+        )
+        if prefetched is not None:
+            for concept_price_matrix in prefetched:
+                if concept_price_matrix.price_matrix_id == price_matrix_id:
+                    return concept_price_matrix.price_matrix
+
+        fetched = getattr(self, "_current_price_matrix", None)
+        if fetched is None or fetched.pk != price_matrix_id:
+            fetched = PriceMatrix.objects.filter(pk=price_matrix_id).first()
+            self._current_price_matrix = fetched
+        return fetched
+
+    def resolve_current_price_matrix(self):
+        """
+        Find the currently valid price matrix and cache it until the next
+        valid from or valid till moment of one of the price matrixes.
+        """
+        logger.debug("Resolving the current price matrix for concept %s", self.id)
+        concept_price_matrixes = list(self.price_matrixes.all())
+        its_now = clock.now()
+        current = self.find_current_concept_price_matrix(
+            concept_price_matrixes,
+            its_now,
+        )
+
+        boundaries = [
+            cpm.valid_from
+            for cpm in concept_price_matrixes
+            if cpm.valid_from is not None and cpm.valid_from > its_now
+        ] + [
+            cpm.valid_till
+            for cpm in concept_price_matrixes
+            if cpm.valid_till is not None and cpm.valid_till >= its_now
+        ]
+
+        resolved = {
+            "price_matrix_id": current.price_matrix_id if current else None,
+            "valid_until": min(boundaries) if boundaries else None,
+        }
+        cache.set(
+            self.current_price_matrix_cache_key,
+            resolved,
+            CURRENT_PRICE_MATRIX_CACHE_TIMEOUT,
+        )
+        return resolved
+
+    def forget_current_price_matrix(self):
+        cache.delete(self.current_price_matrix_cache_key)
+
+    def find_current_concept_price_matrix(self, concept_price_matrixes, its_now):
+        if len(concept_price_matrixes) == 0:
             logger.info("We cannot find a current price matrix for concept %s", self.id)
             return None
 
         logger.debug("Checking for date-based price matrixes...")
-        results = self.price_matrixes.filter(
-            valid_from__lte=ITS_NOW,
-            valid_till__gte=ITS_NOW,
-        )
-        count_results = results.count()
-        if count_results == 1:
+        results = [
+            cpm
+            for cpm in concept_price_matrixes
+            if cpm.valid_from is not None
+            and cpm.valid_from <= its_now
+            and cpm.valid_till is not None
+            and cpm.valid_till >= its_now
+        ]
+        if len(results) == 1:
             logger.debug("One price matrix found on valid from and till")
-            return results.first().price_matrix
-
-        results = self.price_matrixes.filter(valid_from__lte=ITS_NOW)
-        count_results = results.count()
-        if count_results == 1:
+            return results[0]
+
+        results = [
+            cpm
+            for cpm in concept_price_matrixes
+            if cpm.valid_from is not None and cpm.valid_from <= its_now
+        ]
+        if len(results) == 1:
             logger.debug("One price matrix found ONLY on valid from property")
-            return results.first().price_matrix
+            return results[0]
 
-        results = self.price_matrixes.filter()
-        count_results = results.count()
-        if count_results == 1:
+        if len(concept_price_matrixes) == 1:
             logger.debug("One price matrix found without any date based properties")
-            return results.first().price_matrix
+            return concept_price_matrixes[0]
 
         msg = (
             "We don't know which price matrix is currently valid for concept id %s",
@@ -133,14 +220,24 @@ class Concept(
     @property
     def upcoming_events(self):
         return self.events.filter(
-            singleevent__ending_on__gte=ITS_NOW,
+            singleevent__ending_on__gte=clock.now(),
             allow_reservations=True,
             singleevent__parent__isnull=True,
         )
 
     @property
     def upcoming_events_open_for_reservation(self):
-        return [e for e in self.upcoming_events if e.is_open_for_reservations]
+        return (
+            self.upcoming_events.filter(
+                Q(reservation_settings__isnull=False)
+                | Q(concept__reservation_settings__isnull=False),
+            )
+            .filter(
+                Q(singleevent__reservations_close_at__isnull=True)
+                | Q(singleevent__reservations_close_at__gte=clock.now()),
+            )
+            .with_listing_data()
+        )
 
     @property
     def starting_at(self):
@@ -335,6 +432,8 @@ class Event(PolymorphicModel, NameField, AdminLinkMixin, PublicKeyField, CardMod
         default=True,
     )
 
+    objects = EventManager()
+
     class Meta:
         verbose_name = _("event")
         verbose_name_plural = _("events")
@@ -390,12 +489,16 @@ class Event(PolymorphicModel, NameField, AdminLinkMixin, PublicKeyField, CardMod
         return self.maximum_number_of_guests  # pragma: no cover
 
     def get_reserved_spots(self):
-        logger.debug("calculating the reserved spots")
-        number_of_reserved_spots = sum(
-            r.total_amount for r in self.reservations.all() if r.is_confirmed
-        )
-        logger.debug("Number of reserved spots: %s", number_of_reserved_spots)
-        return number_of_reserved_spots
+        """
+        The stored reserved spots: the spots held for the reservations, claimed
+        and released with conditional updates. They are the one source of the
+        capacity, free_spots and claim_spots read them too. The reservation
+        summary counts the confirmed spots for the dashboards, which are the
+        same once no claim waits for the confirm of its requester.
+        """
+        self.refresh_from_db(fields=["reserved_spots"])
+        logger.debug("Number of reserved spots: %s", self.reserved_spots)
+        return self.reserved_spots
 
     @property
     def free_percentage(self):
@@ -505,13 +608,42 @@ class Event(PolymorphicModel, NameField, AdminLinkMixin, PublicKeyField, CardMod
             return result
         return False
 
+    def claim_spots(self, the_amount):
+        """Claim spots only when they still fit, in one conditional UPDATE.
+
+        The capacity check happens inside the database, so two concurrent
+        claims for the last spots can never both succeed.
+        """
+        logger.debug("Trying to claim %s spots for event %s", the_amount, self.pk)
+        claimed = (
+            Event.objects.filter(pk=self.pk)
+            .filter(
+                Q(maximum_number_of_guests__isnull=True)
+                | Q(maximum_number_of_guests__gte=F("reserved_spots") + the_amount),
+            )
+            .update(reserved_spots=F("reserved_spots") + the_amount)
+        )
+        if claimed:
+            self.refresh_from_db(fields=["reserved_spots"])
+            logger.debug("Claimed, reserved spots: %s", self.reserved_spots)
+            return True
+
+        logger.info("Not enough free spots to claim %s spots", the_amount)
+        return False
+
     def add_reserved_spots(self, the_amount):
-        self.reserved_spots += the_amount
-        self.save(update_fields=["reserved_spots"])
+        Event.objects.filter(pk=self.pk).update(
+            reserved_spots=F("reserved_spots") + the_amount,
+        )
+        self.refresh_from_db(fields=["reserved_spots"])
+
+    def release_spots(self, the_amount):
+        self.add_reserved_spots(-the_amount)
 
     def latest_updates(self):
+        its_now = clock.now()
         return self.updates.filter(
-            Q(visible_from__gte=ITS_NOW, visible_till__lte=ITS_NOW)
+            Q(visible_from__gte=its_now, visible_till__lte=its_now)
             | Q(visible_till__isnull=True),
         ).order_by("-created_at")
 
@@ -569,6 +701,16 @@ class SingleEvent(Event, CateringField):
         null=True,
         blank=True,
     )
+    reservations_close_at = models.DateTimeField(
+        verbose_name=_(
+            "reservations close at",
+        ),
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+        help_text=_("calculated from the applicable reservation settings"),
+    )
     """
     location = models.ForeignKey(
         "geography.Location",
@@ -598,13 +740,60 @@ class SingleEvent(Event, CateringField):
 
         return super().__str__()  # pragma: no cover
 
+    def save(self, *args, **kwargs):
+        self.reservations_close_at = self.calculate_reservations_close_at()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "reservations_close_at" not in update_fields:
+            kwargs["update_fields"] = [*update_fields, "reservations_close_at"]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def refresh_reservation_deadlines(cls, events):
+        """
+        Recalculate the moments the reservations close, and until when the
+        requesters can update their reservations, e.g. after the reservation
+        settings of the events changed.
+        """
+        events = list(
+            events.non_polymorphic().select_related(
+                "reservation_settings",
+                "concept__reservation_settings",
+            ),
+        )
+        for event in events:
+            event.reservations_close_at = event.calculate_reservations_close_at()
+        SingleEvent.objects.bulk_update(events, ["reservations_close_at"])
+
+        event_reservations = list(
+            EventReservation.objects.filter(
+                event_id__in=[event.pk for event in events],
+            ),
+        )
+        events_by_id = {event.pk: event for event in events}
+        for event_reservation in event_reservations:
+            event = events_by_id[event_reservation.event_id]
+            event_reservation.allow_requester_updates_until = (
+                event_reservation.calculate_allow_requester_updates_until(
+                    event.applicable_reservation_settings,
+                )
+            )
+        Reservation.objects.bulk_update(
+            event_reservations,
+            ["allow_requester_updates_until"],
+        )
+        logger.info(
+            "Reservation deadlines refreshed for %s events and %s reservations",
+            len(events),
+            len(event_reservations),
+        )
+
     @property
     def status(self):
         return self.get_status()
 
     def get_status(self, its_now=None):
         if its_now is None:
-            its_now = ITS_NOW
+            its_now = clock.now()
 
         starting_at = self.starting_at
         ending_on = self.ending_on
@@ -631,6 +820,9 @@ class SingleEvent(Event, CateringField):
 
     @property
     def reservations_closed_on(self):
+        return self.reservations_close_at
+
+    def calculate_reservations_close_at(self):
         starting_datetime = self.starting_at
         if starting_datetime is None:
             return None
@@ -650,7 +842,8 @@ class SingleEvent(Event, CateringField):
 
             amount = self.applicable_reservation_settings.close_reservation_time_amount
             interval = self.applicable_reservation_settings.close_reservation_interval
-            starting_datetime = self.starting_at
+            if amount is None or not interval:
+                return None
 
             return starting_datetime - relativedelta(**{interval: amount})
 
@@ -671,7 +864,7 @@ class SingleEvent(Event, CateringField):
             return True
 
         logger.debug("Time based checking if the reservations are open.")
-        return self.reservations_closed_on >= ITS_NOW
+        return self.reservations_closed_on >= clock.now()
 
     @property
     def reservations_are_closed(self):
@@ -684,7 +877,7 @@ class SingleEvent(Event, CateringField):
             return False
 
         logger.debug("Time based checking if the reservations are closed.")
-        return self.reservations_closed_on <= ITS_NOW
+        return self.reservations_closed_on <= clock.now()
 
     @property
     def applicable_reservation_settings(self):
@@ -977,6 +1170,13 @@ class EventDuplicator(models.Model):  # noqa: DJ008
         default=0,
         editable=False,
     )
+    events_skipped = models.PositiveIntegerField(
+        verbose_name=_(
+            "events skipped",
+        ),
+        default=0,
+        editable=False,
+    )
 
     def duplicate(self):  # noqa: C901, PLR0912, PLR0915
         logger.info("Duplicating single event from duplicator: %s", self.pk)
@@ -1020,6 +1220,7 @@ class EventDuplicator(models.Model):  # noqa: DJ008
                 self.interval = "years"
 
         time_interval = relativedelta(**{self.interval: self.amount})
+        occurrences = []
         new_starting_datetime = datetime.datetime.combine(
             self.from_date + time_interval,
             event.starting_at.time(),
@@ -1028,75 +1229,13 @@ class EventDuplicator(models.Model):  # noqa: DJ008
             event.ending_on.date() + time_interval,
             event.ending_on.time(),
         )
-
-        self.events_created = 0
         while new_starting_datetime.date() <= self.target_date:
-            if SingleEvent.objects.filter(
-                concept_id=event.concept_id,
-                starting_at=new_starting_datetime,
-                ending_on=new_ending_datetime,
-            ).exists():
-                logger.info("Event already exists")
-                new_starting_datetime = datetime.datetime.combine(
-                    new_starting_datetime.date() + time_interval,
-                    event.starting_at.time(),
-                )
-                new_ending_datetime = datetime.datetime.combine(
-                    new_ending_datetime + time_interval,
-                    event.ending_on.time(),
-                )
-                continue
-
-            new_event = type(event)()
-            skip_fields = [
-                "danceevent",
-                "birthdayevent",
-                "weddingevent",
-                "dinnerevent",
-                "lunchevent",
-                "meetingevent",
-                "breakfastevent",
-                "liveperformanceevent",
-                "presentationevent",
-                "brunchevent",
-                "teambuildingevent",
-                "ceremonyevent",
-                "receptionevent",
-                "closingevent",
-                "breakevent",
-            ]
-            for field in event._meta.get_fields():  # noqa: SLF001
-                if isinstance(event, SingleEvent) and field.name in skip_fields:
-                    logger.info("skipping field: %s", field.name)
-                    continue
-                logger.debug("Copying field: %s", field.name)
-                value = getattr(event, field.name, None)
-                logger.debug("%s: %s", field.name, value)
-                try:
-                    setattr(new_event, field.name, value)
-                except TypeError:
-                    logger.warning("TypeError")
-                except AttributeError:
-                    logger.warning("AttributeError")
-                except ValueError:
-                    logger.warning("ValueError")
-                except Exception:  # noqa: BLE001
-                    logger.warning("Exception")
-                logger.debug("Ready to copy next field")
-
-            logger.debug("Removing IDS and PK")
-            new_event.pk = None
-            new_event.id = None
-            new_event.public_key = uuid4()
-            new_event.duplicator_id = self.pk
-            new_event.starting_at = new_starting_datetime
-            new_event.ending_on = new_ending_datetime
-            logger.debug("Save with public key: %s", str(new_event.public_key))
-            new_event.save()
-
-            logger.info("New event id: %s", str(new_event.pk) + " saved")
-            self.events_created += 1
-
+            occurrences.append(
+                (
+                    timezone.make_aware(new_starting_datetime),
+                    timezone.make_aware(new_ending_datetime),
+                ),
+            )
             new_starting_datetime = datetime.datetime.combine(
                 new_starting_datetime.date() + time_interval,
                 event.starting_at.time(),
@@ -1106,8 +1245,67 @@ class EventDuplicator(models.Model):  # noqa: DJ008
                 event.ending_on.time(),
             )
 
-        self.save()
-        logger.info("%s events created", str(self.events_created))
+        existing_occurrences = set()
+        if occurrences:
+            existing_occurrences = set(
+                SingleEvent.objects.filter(
+                    concept_id=event.concept_id,
+                    starting_at__range=(occurrences[0][0], occurrences[-1][0]),
+                ).values_list("starting_at", "ending_on"),
+            )
+
+        event_class = type(event)
+        copy_fields = [
+            field
+            for field in event_class._meta.concrete_fields  # noqa: SLF001
+            if not field.primary_key
+        ]
+        new_events = []
+        self.events_skipped = 0
+        for starting_at, ending_on in occurrences:
+            if (starting_at, ending_on) in existing_occurrences:
+                logger.info("Event already exists")
+                self.events_skipped += 1
+                continue
+
+            new_event = event_class()
+            for field in copy_fields:
+                setattr(new_event, field.attname, getattr(event, field.attname))
+            new_event.public_key = uuid4()
+            new_event.duplicator_id = self.pk
+            new_event.starting_at = starting_at
+            new_event.ending_on = ending_on
+            new_event.reserved_spots = 0
+            # the bulk insert skips save(), so the deadline of the copy is set
+            # here, from the settings the copies share with the event
+            new_event.concept = event.concept
+            new_event.reservation_settings = event.reservation_settings
+            new_event.reservations_close_at = (
+                new_event.calculate_reservations_close_at()
+            )
+            new_events.append(new_event)
+
+        with transaction.atomic():
+            bulk_create_multi_table(event_class, new_events)
+            self.events_created = len(new_events)
+            self.save()
+
+            if event.parent_id is not None:
+                # the bulk insert does not send the signal that updates the mix
+                EventMix.objects.filter(pk=event.parent_id).update(
+                    **SingleEvent.objects.filter(
+                        parent_id=event.parent_id,
+                    ).aggregate(
+                        starting_at=Min("starting_at"),
+                        ending_on=Max("ending_on"),
+                    ),
+                )
+
+        logger.info(
+            "%s events created, %s skipped",
+            self.events_created,
+            self.events_skipped,
+        )
 
 
 class EventAttendee(PolymorphicModel, AdminLinkMixin, PublicKeyField):
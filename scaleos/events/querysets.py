@@ -0,0 +1,26 @@
+from polymorphic.managers import PolymorphicManager
+from polymorphic.query import PolymorphicQuerySet
+
+
+class EventQuerySet(PolymorphicQuerySet):
+    def with_listing_data(self):
+        """
+        Everything an event card needs, fetched for the whole page at once:
+        the reservation settings, the price matrixes of the concept
+        and the updates, so the card properties do not query per event.
+        """
+        return self.select_related(
+            "concept",
+            "concept__reservation_settings",
+            "reservation_settings",
+        ).prefetch_related(
+            "concept__price_matrixes__price_matrix",
+            "updates",
+        )
+
+
+class EventManager(PolymorphicManager):
+    queryset_class = EventQuerySet
+
+    def with_listing_data(self):
+        return self.get_queryset().with_listing_data()
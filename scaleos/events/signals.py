@@ -1,9 +1,18 @@
 import logging
 
+from django.db import transaction
 from django.db.models import Max
 from django.db.models import Min
+from django.db.models import Q
+from django.db.models.signals import post_delete
 from django.db.models.signals import post_save
+from django.dispatch import receiver
 
+from scaleos.reservations.models import EventReservationSettings
+
+from .models import Concept
+from .models import ConceptPriceMatrix
+from .models import CustomerConcept
 from .models import EventMix
 from .models import SingleEvent
 
@@ -40,3 +49,41 @@ def update_eventmix_dates(sender, instance, **kwargs):
         starting_at=starting_at,
         ending_on=ending_on,
     )
+
+
+@receiver([post_save, post_delete], sender=ConceptPriceMatrix)
+def resolve_concept_price_matrix(sender, instance, **kwargs):
+    concept = Concept.objects.filter(pk=instance.concept_id).first()
+    if concept is None:
+        logger.debug("The concept is gone, nothing to resolve")
+        return
+
+    logger.debug("Price matrixes changed for concept %s", concept.pk)
+    concept.forget_current_price_matrix()
+    transaction.on_commit(concept.resolve_current_price_matrix)
+
+
+@receiver(post_save, sender=EventReservationSettings)
+def refresh_deadlines_for_reservation_settings(sender, instance, **kwargs):
+    logger.debug("Reservation settings %s changed", instance.pk)
+    SingleEvent.refresh_reservation_deadlines(
+        SingleEvent.objects.filter(
+            Q(reservation_settings_id=instance.pk)
+            | Q(
+                reservation_settings__isnull=True,
+                concept__reservation_settings_id=instance.pk,
+            ),
+        ),
+    )
+
+
+@receiver(post_save, sender=Concept)
+@receiver(post_save, sender=CustomerConcept)
+def refresh_deadlines_for_concept(sender, instance, created, **kwargs):
+    if created:
+        return
+
+    logger.debug("Concept %s changed", instance.pk)
+    SingleEvent.refresh_reservation_deadlines(
+        SingleEvent.objects.filter(concept_id=instance.pk),
+    )
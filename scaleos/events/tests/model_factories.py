@@ -6,7 +6,7 @@ from factory.django import DjangoModelFactory
 from factory.fuzzy import FuzzyDate
 
 from scaleos.events import models as event_models
-from scaleos.shared.mixins import ITS_NOW
+from scaleos.shared import clock
 
 
 class EventFactory(DjangoModelFactory[event_models.Event]):
@@ -22,8 +22,8 @@ class ConceptFactory(DjangoModelFactory[event_models.Concept]):
 class SingleEventFactory(DjangoModelFactory[event_models.SingleEvent]):
     concept = SubFactory(ConceptFactory)
     starting_at = FuzzyDate(
-        datetime.datetime(ITS_NOW.year, 1, 1, 13, 00),
-        datetime.datetime(ITS_NOW.year, 12, 31, 20, 00),
+        datetime.datetime(clock.now().year, 1, 1, 13, 00),
+        datetime.datetime(clock.now().year, 12, 31, 20, 00),
     )
     ending_on = LazyAttribute(lambda obj: obj.starting_at + datetime.timedelta(hours=4))
 
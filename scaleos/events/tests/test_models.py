@@ -13,7 +13,7 @@ from scaleos.organizations.tests import model_factories as organization_factorie
 from scaleos.payments.tests import model_factories as payment_factories
 from scaleos.reservations.models import EventReservationSettings
 from scaleos.reservations.tests import model_factories as reservation_factories
-from scaleos.shared.mixins import ITS_NOW
+from scaleos.shared import clock
 
 
 # Add the new test class for CustomerConcept
@@ -388,7 +388,7 @@ class TestSingleEvent:
         )
         birthday_event = event_factories.BirthdayEventFactory.create(
             reservation_settings_id=settings.pk,
-            starting_at=ITS_NOW,
+            starting_at=clock.now(),
         )
         assert birthday_event.reservations_are_closed is True
 
@@ -582,7 +582,7 @@ def test_event_reservations_closed_on(faker):
     )
     single_event = event_factories.SingleEventFactory.create(
         reservation_settings_id=event_reservation_settings.pk,
-        starting_at=ITS_NOW,
+        starting_at=clock.now(),
     )
     assert single_event.reservations_closed_on
 
@@ -628,3 +628,213 @@ def test_event_duplicator(faker):
         ).count()
         == 1
     )
+
+
+@pytest.mark.django_db
+def test_event_claim_spots_only_when_they_fit(faker):
+    event = event_factories.EventFactory.create(maximum_number_of_guests=10)
+    assert event.claim_spots(6) is True
+    assert event.reserved_spots == 6
+    assert event.claim_spots(5) is False
+    assert event.claim_spots(4) is True
+    event.refresh_from_db()
+    assert event.reserved_spots == 10
+    assert event.is_full is True
+
+    event.release_spots(3)
+    assert event.reserved_spots == 7
+
+    unlimited_event = event_factories.EventFactory.create()
+    assert unlimited_event.claim_spots(1000) is True
+    assert unlimited_event.reserved_spots == 1000
+
+
+@pytest.mark.django_db
+def test_event_listing_data_does_not_query_per_event(
+    faker,
+    django_assert_num_queries,
+):
+    settings = reservation_factories.EventReservationSettingsFactory.create()
+    concept = event_factories.ConceptFactory.create(
+        reservation_settings_id=settings.pk,
+    )
+    price_matrix = payment_factories.PriceMatrixFactory.create()
+    event_factories.ConceptPriceMatrixFactory.create(
+        concept_id=concept.pk,
+        price_matrix_id=price_matrix.pk,
+    )
+    event_factories.BrunchEventFactory.create_batch(
+        5,
+        concept=concept,
+        maximum_number_of_guests=10,
+        starting_at=clock.now() + datetime.timedelta(days=10),
+    )
+
+    events = list(event_models.Event.objects.with_listing_data())
+    assert len(events) == 5
+
+    with django_assert_num_queries(0):
+        for event in events:
+            assert event.current_price_matrix.pk == price_matrix.pk
+            assert event.applicable_reservation_settings == settings
+            assert event.is_open_for_reservations is True
+            assert event.free_spots == 10
+            assert event.updates.count() == 0
+
+
+@pytest.mark.django_db
+def test_concept_current_price_matrix_is_resolved_until_the_next_boundary(
+    faker,
+    django_assert_num_queries,
+):
+    its_now = clock.now()
+    concept = event_factories.ConceptFactory.create()
+    price_matrixes = payment_factories.PriceMatrixFactory.create_batch(2)
+    event_factories.ConceptPriceMatrixFactory.create(
+        concept_id=concept.pk,
+        price_matrix_id=price_matrixes[0].pk,
+        valid_from=its_now - relativedelta(years=1),
+        valid_till=its_now + datetime.timedelta(days=1),
+    )
+    event_factories.ConceptPriceMatrixFactory.create(
+        concept_id=concept.pk,
+        price_matrix_id=price_matrixes[1].pk,
+        valid_from=its_now + datetime.timedelta(days=1, seconds=1),
+        valid_till=its_now + relativedelta(years=1),
+    )
+
+    with clock.freeze(its_now):
+        assert concept.current_price_matrix.pk == price_matrixes[0].pk
+        resolved = concept.resolve_current_price_matrix()
+        assert resolved["valid_until"] == its_now + datetime.timedelta(days=1)
+
+        concept = event_models.Concept.objects.prefetch_related(
+            "price_matrixes__price_matrix",
+        ).get(pk=concept.pk)
+        with django_assert_num_queries(0):
+            assert concept.current_price_matrix.pk == price_matrixes[0].pk
+
+    with clock.freeze(its_now + datetime.timedelta(days=2)):
+        assert concept.current_price_matrix.pk == price_matrixes[1].pk
+
+    # without prefetched price matrixes the price matrix is fetched once
+    concept = event_models.Concept.objects.get(pk=concept.pk)
+    with clock.freeze(its_now + datetime.timedelta(days=2)):
+        assert concept.current_price_matrix.pk == price_matrixes[1].pk
+        with django_assert_num_queries(0):
+            assert concept.current_price_matrix.pk == price_matrixes[1].pk
+
+
+@pytest.mark.django_db
+def test_event_duplicator_skips_existing_occurrences(faker):
+    starting_at = timezone.make_aware(
+        datetime.datetime(year=2025, month=3, day=30, hour=12, minute=00),
+    )
+    brunch_event = event_factories.BrunchEventFactory.create(
+        starting_at=starting_at,
+        ending_on=starting_at + datetime.timedelta(hours=4),
+        reserved_spots=25,
+    )
+    event_duplicator = event_factories.EventDuplicatorFactory.create(
+        event_id=brunch_event.pk,
+        target_date=datetime.date(year=2025, month=4, day=27),
+        amount=1,
+        every_interval=event_models.EventDuplicator.DuplicateInterval.EVERY_WEEK,
+    )
+
+    event_duplicator.duplicate()
+    assert event_duplicator.events_created == 4
+    assert event_duplicator.events_skipped == 0
+
+    duplicates = event_models.SingleEvent.objects.filter(
+        duplicator_id=event_duplicator.pk,
+    )
+    assert duplicates.count() == 4
+    for duplicate in duplicates:
+        assert isinstance(duplicate, event_models.BrunchEvent)
+        assert duplicate.concept_id == brunch_event.concept_id
+        assert duplicate.public_key != brunch_event.public_key
+        assert duplicate.reserved_spots == 0
+
+    event_duplicator.target_date = datetime.date(year=2025, month=5, day=4)
+    event_duplicator.duplicate()
+    assert event_duplicator.events_created == 1
+    assert event_duplicator.events_skipped == 4
+    assert (
+        event_models.BrunchEvent.objects.filter(
+            concept_id=brunch_event.concept_id,
+        ).count()
+        == 6
+    )
+
+
+@pytest.mark.django_db
+def test_reservations_close_at_follows_the_reservation_settings(faker):
+    settings = reservation_factories.EventReservationSettingsFactory.create(
+        close_reservation_interval=EventReservationSettings.CloseReservationInterval.DAYS,
+        close_reservation_time_amount=2,
+    )
+    concept = event_factories.ConceptFactory.create(
+        reservation_settings_id=settings.pk,
+    )
+    tomorrow_event = event_factories.BrunchEventFactory.create(
+        concept=concept,
+        starting_at=clock.now() + datetime.timedelta(days=1),
+    )
+    later_event = event_factories.BrunchEventFactory.create(
+        concept=concept,
+        starting_at=clock.now() + datetime.timedelta(days=10),
+    )
+    assert later_event.reservations_close_at == (
+        later_event.starting_at - datetime.timedelta(days=2)
+    )
+    assert list(concept.upcoming_events_open_for_reservation) == [later_event]
+
+    settings.close_reservation_interval = (
+        EventReservationSettings.CloseReservationInterval.HOURS
+    )
+    settings.save()
+
+    tomorrow_event.refresh_from_db()
+    assert tomorrow_event.reservations_close_at == (
+        tomorrow_event.starting_at - datetime.timedelta(hours=2)
+    )
+    assert set(concept.upcoming_events_open_for_reservation) == {
+        tomorrow_event,
+        later_event,
+    }
+
+
+@pytest.mark.django_db
+def test_event_duplicator_sets_the_reservation_deadline_of_every_copy(faker):
+    settings = reservation_factories.EventReservationSettingsFactory.create(
+        close_reservation_interval=EventReservationSettings.CloseReservationInterval.DAYS,
+        close_reservation_time_amount=2,
+    )
+    concept = event_factories.ConceptFactory.create(
+        reservation_settings_id=settings.pk,
+    )
+    starting_at = clock.now() + datetime.timedelta(days=10)
+    brunch_event = event_factories.BrunchEventFactory.create(
+        concept=concept,
+        starting_at=starting_at,
+        ending_on=starting_at + datetime.timedelta(hours=4),
+    )
+    event_duplicator = event_factories.EventDuplicatorFactory.create(
+        event_id=brunch_event.pk,
+        target_date=(starting_at + datetime.timedelta(weeks=3)).date(),
+        amount=1,
+        every_interval=event_models.EventDuplicator.DuplicateInterval.EVERY_WEEK,
+    )
+
+    event_duplicator.duplicate()
+
+    duplicates = event_models.SingleEvent.objects.filter(
+        duplicator_id=event_duplicator.pk,
+    )
+    assert duplicates.count() == 3
+    for duplicate in duplicates:
+        assert duplicate.reservations_close_at == (
+            duplicate.starting_at - datetime.timedelta(days=2)
+        )
+        assert duplicate.reservations_close_at != brunch_event.reservations_close_at
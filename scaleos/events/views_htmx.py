@@ -164,7 +164,7 @@ def event_filter(request):
     logger.debug("Template used: %s", template_used)
     html_fragment = get_template(template_used).render(
         context={
-            "cards": results,
+            "cards": results.with_listing_data(),
         },
         request=request,
     )
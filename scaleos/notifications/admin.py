@@ -15,13 +15,23 @@ class MailNotificationInlineAdmin(admin.StackedInline):
     model = notification_models.MailNotification
     extra = 0
     show_change_link = True
+    readonly_fields = ["sent_on", "result", "error"]
 
 
 class WebPushNotificationInlineAdmin(admin.StackedInline):
     model = notification_models.WebPushNotification
     extra = 0
     show_change_link = True
-    readonly_fields = ["user", "title", "message", "icon_url", "show_notification_url"]
+    readonly_fields = [
+        "user",
+        "title",
+        "message",
+        "icon_url",
+        "show_notification_url",
+        "sent_on",
+        "result",
+        "error",
+    ]
 
 
 class NotificationInlineAdmin(StackedPolymorphicInline):
@@ -119,3 +129,9 @@ class OrganizationNotificationAdmin(PolymorphicChildModelAdmin, LogInfoAdminMixi
 @admin.register(notification_models.UserNotificationSettings)
 class UserNotificationSettingsAdmin(admin.ModelAdmin):
     pass
+
+
+@admin.register(notification_models.NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ["notification", "available_on", "created_on"]
+    readonly_fields = ["notification", "available_on", "created_on"]
@@ -0,0 +1,248 @@
+"""
+Merge the notifications a user receives within a digest window.
+
+A user notification of a user with a digest window waits until the window of
+the user ends. The scheduler then locks the due notifications, merges them
+per user and sending organization into one mail and one web push, rendered
+once. The mails and the pushes of a run are sent as one batch each, and the
+merged notifications are marked as sent from the results of their digest.
+"""
+
+import datetime
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from django.urls import reverse
+from django.utils import translation
+from django.utils.translation import ngettext
+from webpush.models import PushInformation
+
+from scaleos.notifications import models as notification_models
+from scaleos.notifications.mail import render_mail
+from scaleos.notifications.mail import send_mail_notifications
+from scaleos.notifications.push import send_webpush_notifications
+from scaleos.shared import clock
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200
+DIGEST_TEMPLATE = "notification/digest.email"
+# a merged digest that is not delivered within this time is merged again
+SEND_TIMEOUT = datetime.timedelta(minutes=15)
+MAIL_FIELDS = ["user", "subject", "body", "html_body"]
+WEBPUSH_FIELDS = ["user", "title", "message", "icon_url", "show_notification_url"]
+
+
+def digest_due_on(user_id, minutes, moment=None):
+    """the end of the running window of the user, or of a new one"""
+    moment = moment or clock.now()
+    running = (
+        notification_models.UserNotification.objects.filter(
+            to_user_id=user_id,
+            sent_on__isnull=True,
+            digest_on__gt=moment,
+        )
+        .order_by("digest_on")
+        .values_list("digest_on", flat=True)
+        .first()
+    )
+    return running or moment + datetime.timedelta(minutes=minutes)
+
+
+def hold_for_digest(user_notification, minutes):
+    """let the notification wait for the digest of its user"""
+    user_notification.digest_on = digest_due_on(user_notification.to_user_id, minutes)
+    notification_models.UserNotification.objects.filter(
+        pk=user_notification.pk,
+    ).update(digest_on=user_notification.digest_on)
+    logger.debug(
+        "User notification %s waits for the digest on %s",
+        user_notification.pk,
+        user_notification.digest_on,
+    )
+    return user_notification.digest_on
+
+
+def build_digest(user_notifications):
+    """
+    The mail and the web push of a digest. A single notification is sent as
+    it is, more are rendered into one digest.
+    """
+    head = user_notifications[-1]
+    mail_notification = notification_models.MailNotification(
+        notification_id=head.pk,
+        user_id=head.to_user_id,
+    )
+    webpush_notification = notification_models.WebPushNotification(
+        notification_id=head.pk,
+        user_id=head.to_user_id,
+    )
+    if len(user_notifications) == 1:
+        return mail_notification, webpush_notification
+
+    language = head.language
+    parts = render_mail(
+        DIGEST_TEMPLATE,
+        language,
+        {"notification": head, "notifications": user_notifications},
+    )
+    mail_notification.subject = parts["subject"]
+    mail_notification.body = parts["plain"]
+    mail_notification.html_body = parts["html"]
+
+    with translation.override(language or None):
+        webpush_notification.title = ngettext(
+            "%(count)d new notification",
+            "%(count)d new notifications",
+            len(user_notifications),
+        ) % {"count": len(user_notifications)}
+    webpush_notification.message = "\n".join(
+        str(user_notification.title) for user_notification in user_notifications
+    )
+    webpush_notification.icon_url = head.icon_url
+    webpush_notification.show_notification_url = head.base_url + reverse(
+        "notifications:notification",
+    )
+    return mail_notification, webpush_notification
+
+
+def mark_delivered(digests):
+    """
+    Mark the merged notifications of the delivered digests as sent and the
+    others as failed, from the results of their mail and web push.
+    Returns the number of delivered digests.
+    """
+    heads = list(digests)
+    failed_heads = set()
+    for model in (
+        notification_models.MailNotification,
+        notification_models.WebPushNotification,
+    ):
+        failed_heads.update(
+            model.objects.filter(
+                notification_id__in=heads,
+                sent_on__isnull=True,
+            ).values_list("notification_id", flat=True),
+        )
+
+    results = notification_models.Notification.NotificationResult
+    delivered = [head for head in heads if head not in failed_heads]
+    notification_models.UserNotification.objects.filter(
+        pk__in=[pk for head in delivered for pk in digests[head]],
+    ).update(sent_on=clock.now(), result=results.SENT)
+    notification_models.UserNotification.objects.filter(
+        pk__in=[pk for head in failed_heads for pk in digests[head]],
+    ).update(digest_on=None, result=results.FAILED)
+    return len(delivered)
+
+
+def merge_batch(due, batch_size=BATCH_SIZE):
+    """
+    Merge the due notifications of a batch of users. Returns the mail and
+    the web push notifications to send, the merged notifications per digest
+    head and the number of users.
+    The merged notifications are due again after the send timeout, so a
+    digest that is not delivered because the worker stopped is merged again.
+    """
+    with transaction.atomic():
+        user_ids = list(
+            due.order_by("to_user_id")
+            .values_list("to_user_id", flat=True)
+            .distinct()[:batch_size],
+        )
+        if not user_ids:
+            return [], [], {}, 0
+
+        groups = defaultdict(list)
+        for user_notification in (
+            due.filter(to_user_id__in=user_ids)
+            .select_for_update(skip_locked=True, of=("self",))
+            .select_related("to_user__person", "sending_organization__styling")
+            .order_by("pk")
+        ):
+            groups[
+                user_notification.to_user_id,
+                user_notification.sending_organization_id,
+            ].append(user_notification)
+
+        notification_settings = {
+            user_settings.user_id: user_settings
+            for user_settings in (
+                notification_models.UserNotificationSettings.objects.filter(
+                    user_id__in=user_ids,
+                )
+            )
+        }
+        push_users = set(
+            PushInformation.objects.filter(user_id__in=user_ids).values_list(
+                "user_id",
+                flat=True,
+            ),
+        )
+
+        mail_notifications = []
+        webpush_notifications = []
+        digests = {}
+        for (user_id, _), user_notifications in groups.items():
+            user_settings = notification_settings.get(user_id)
+            mail_notification, webpush_notification = build_digest(user_notifications)
+            digests[user_notifications[-1].pk] = [
+                user_notification.pk for user_notification in user_notifications
+            ]
+            if (
+                user_settings is None
+                or user_settings.disabled_email_notifications_on is None
+            ):
+                mail_notifications.append(mail_notification)
+            if user_id in push_users and (
+                user_settings is None
+                or user_settings.disabled_webpush_notifications_on is None
+            ):
+                webpush_notifications.append(webpush_notification)
+
+        # a head merged before keeps its unsent rows, with the new content
+        notification_models.MailNotification.objects.bulk_create(
+            mail_notifications,
+            update_conflicts=True,
+            unique_fields=["notification"],
+            update_fields=MAIL_FIELDS,
+        )
+        notification_models.WebPushNotification.objects.bulk_create(
+            webpush_notifications,
+            update_conflicts=True,
+            unique_fields=["notification"],
+            update_fields=WEBPUSH_FIELDS,
+        )
+        notification_models.UserNotification.objects.filter(
+            pk__in=[pk for merged in digests.values() for pk in merged],
+        ).update(digest_on=clock.now() + SEND_TIMEOUT)
+    return mail_notifications, webpush_notifications, digests, len(user_ids)
+
+
+def send_digests(moment=None, batch_size=BATCH_SIZE):
+    """merge and send the due digests batch by batch, returns the digests"""
+    due = notification_models.UserNotification.objects.filter(
+        sent_on__isnull=True,
+        digest_on__lte=moment or clock.now(),
+    )
+    digests = 0
+    while True:
+        mail_notifications, webpush_notifications, merged, users = merge_batch(
+            due,
+            batch_size,
+        )
+        send_mail_notifications(
+            [mail_notification.pk for mail_notification in mail_notifications],
+        )
+        send_webpush_notifications(
+            [webpush_notification.pk for webpush_notification in webpush_notifications],
+        )
+        digests += mark_delivered(merged)
+        # the notifications another worker has locked are left to that worker
+        if not merged or users < batch_size:
+            break
+
+    if digests:
+        logger.info("%s notification digests sent", digests)
+    return digests
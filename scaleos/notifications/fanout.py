@@ -0,0 +1,319 @@
+"""
+Fan an organization notification out to its recipients.
+
+The recipients are resolved in one query over the members and the customers
+of the organization, with the opt-outs of their notification settings
+filtered in SQL. The user notifications and their mail and web push rows are
+created in bulk, chunk by chunk, and every chunk is sent by its own task,
+its mails and its web pushes as one batch each.
+"""
+
+import logging
+import uuid
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BooleanField
+from django.db.models import Exists
+from django.db.models import ExpressionWrapper
+from django.db.models import OuterRef
+from django.db.models import Q
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.db.models.functions import NullIf
+from django.urls import reverse
+from webpush.models import PushInformation
+
+from scaleos.notifications import models as notification_models
+from scaleos.notifications.mail import send_mail_notifications
+from scaleos.notifications.push import send_webpush_notifications
+from scaleos.organizations import models as organization_models
+from scaleos.shared import clock
+from scaleos.shared.functions import bulk_create_multi_table
+from scaleos.users import models as user_models
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+
+COPIED_FIELDS = (
+    "sending_organization_id",
+    "title",
+    "message",
+    "button_text",
+    "notification_type",
+    "about_content_type_id",
+    "about_object_id",
+    "redirect_to_content_type_id",
+    "redirect_to_object_id",
+    "redirect_url",
+    "expires_on",
+)
+
+
+class Recipient:
+    __slots__ = ("email", "language", "mail", "pk", "webpush")
+
+    FIELDS = ("pk", "email", "recipient_language", "mail_allowed", "webpush_allowed")
+
+    def __init__(self, pk, email, language, mail, webpush):
+        self.pk = pk
+        self.email = email
+        self.language = language
+        self.mail = mail
+        self.webpush = webpush
+
+
+def _member_users(member_model, organizations):
+    return (
+        member_model.objects.non_polymorphic()
+        .filter(organization_id__in=organizations, person__user__isnull=False)
+        .values("person__user_id")
+    )
+
+
+def recipient_filter(organization_id, to):
+    """the users a notification to these recipients of the organization reaches"""
+    to_choices = notification_models.OrganizationNotification.NotificationTo
+    organization = [organization_id]
+    b2b_customers = organization_models.B2BCustomer.objects.filter(
+        organization_id=organization_id,
+    ).values("b2b_id")
+    suppliers = organization_models.B2BCustomer.objects.filter(
+        b2b_id=organization_id,
+    ).values("organization_id")
+
+    match to:
+        case to_choices.ORGANIZATION_OWNERS:
+            return Q(
+                pk__in=_member_users(
+                    organization_models.OrganizationOwner,
+                    organization,
+                ),
+            )
+        case to_choices.ORGANIZATION_EMPLOYEES:
+            return Q(
+                pk__in=_member_users(
+                    organization_models.OrganizationEmployee,
+                    organization,
+                ),
+            )
+        case to_choices.ORGANIZATION_SUPPLIERS:
+            return Q(
+                pk__in=_member_users(
+                    organization_models.OrganizationMember,
+                    suppliers,
+                ),
+            )
+        case to_choices.ORGANIZATION_CUSTOMERS:
+            return Q(
+                pk__in=organization_models.B2CCustomer.objects.filter(
+                    organization_id=organization_id,
+                    person__user__isnull=False,
+                ).values("person__user_id"),
+            ) | Q(
+                pk__in=_member_users(
+                    organization_models.OrganizationMember,
+                    b2b_customers,
+                ),
+            )
+    return Q(
+        pk__in=_member_users(organization_models.OrganizationMember, organization),
+    )
+
+
+def get_recipients(organization_notification):
+    """the reachable users, with the channels their settings allow"""
+    return (
+        user_models.User.objects.filter(
+            recipient_filter(
+                organization_notification.sending_organization_id,
+                organization_notification.to,
+            ),
+            is_active=True,
+        )
+        .filter(
+            Q(notification_settings__isnull=True)
+            | Q(notification_settings__disabled_all_notifications_on__isnull=True),
+        )
+        .annotate(
+            recipient_language=Coalesce(
+                NullIf("person__mother_tongue", Value("")),
+                NullIf("website_language", Value("")),
+                Value(settings.LANGUAGES[0][0]),
+            ),
+            mail_allowed=ExpressionWrapper(
+                Q(notification_settings__disabled_email_notifications_on__isnull=True)
+                & ~Q(email=""),
+                output_field=BooleanField(),
+            ),
+            webpush_allowed=ExpressionWrapper(
+                Q(notification_settings__disabled_webpush_notifications_on__isnull=True)
+                & Q(Exists(PushInformation.objects.filter(user_id=OuterRef("pk")))),
+                output_field=BooleanField(),
+            ),
+        )
+        .order_by("pk")
+    )
+
+
+def iter_recipient_chunks(organization_notification, chunk_size=CHUNK_SIZE):
+    """Yield lists of recipients, every chunk continues after the last id"""
+    recipients = get_recipients(organization_notification)
+    last_pk = None
+    while True:
+        queryset = recipients
+        if last_pk is not None:
+            queryset = queryset.filter(pk__gt=last_pk)
+        chunk = [
+            Recipient(*row)
+            for row in queryset.values_list(*Recipient.FIELDS)[:chunk_size]
+        ]
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1].pk
+
+
+def build_user_notification(organization_notification, recipient, base_url):
+    user_notification = notification_models.UserNotification(
+        organization_notification=organization_notification,
+        to_user_id=recipient.pk,
+        language=recipient.language,
+        public_key=uuid.uuid4(),
+        **{field: getattr(organization_notification, field) for field in COPIED_FIELDS},
+    )
+    user_notification.button_link = base_url + reverse(
+        "notifications:open_notification",
+        kwargs={"notification_public_key": user_notification.public_key},
+    )
+    return user_notification
+
+
+def fan_out_chunk(organization_notification, recipients, icon_url=""):
+    """create the notifications of a chunk, returns the number created"""
+    existing = set(
+        notification_models.UserNotification.objects.filter(
+            organization_notification=organization_notification,
+            to_user_id__in=[recipient.pk for recipient in recipients],
+        ).values_list("to_user_id", flat=True),
+    )
+    recipients = [recipient for recipient in recipients if recipient.pk not in existing]
+    if not recipients:
+        return 0
+
+    base_url = organization_notification.base_url
+    user_notifications = [
+        build_user_notification(organization_notification, recipient, base_url)
+        for recipient in recipients
+    ]
+    with transaction.atomic():
+        bulk_create_multi_table(
+            notification_models.UserNotification,
+            user_notifications,
+        )
+        notification_models.MailNotification.objects.bulk_create(
+            [
+                notification_models.MailNotification(
+                    notification_id=user_notification.pk,
+                    user_id=recipient.pk,
+                    to_email_addresses=recipient.email,
+                )
+                for user_notification, recipient in zip(
+                    user_notifications,
+                    recipients,
+                    strict=True,
+                )
+                if recipient.mail
+            ],
+        )
+        notification_models.WebPushNotification.objects.bulk_create(
+            [
+                notification_models.WebPushNotification(
+                    notification_id=user_notification.pk,
+                    user_id=recipient.pk,
+                    title=user_notification.title,
+                    message=user_notification.message,
+                    icon_url=icon_url,
+                    show_notification_url=user_notification.redirect_url,
+                )
+                for user_notification, recipient in zip(
+                    user_notifications,
+                    recipients,
+                    strict=True,
+                )
+                if recipient.webpush
+            ],
+        )
+
+        from scaleos.notifications.tasks import send_fanned_out_notifications
+
+        transaction.on_commit(
+            partial(
+                send_fanned_out_notifications.delay,
+                [user_notification.pk for user_notification in user_notifications],
+            ),
+        )
+    return len(user_notifications)
+
+
+def fan_out(organization_notification, chunk_size=CHUNK_SIZE):
+    """
+    Create a user notification for every recipient and dispatch them chunk by
+    chunk. A retried fan out skips the recipients that already have one.
+    Returns the number of user notifications created.
+    """
+    icon_url = organization_notification.icon_url
+    created = 0
+    for recipients in iter_recipient_chunks(organization_notification, chunk_size):
+        created += fan_out_chunk(organization_notification, recipients, icon_url)
+
+    notification_models.OrganizationNotification.objects.filter(
+        pk=organization_notification.pk,
+    ).update(
+        sent_on=clock.now(),
+        result=notification_models.Notification.NotificationResult.SENT,
+    )
+    logger.info(
+        "Organization notification %s fanned out to %s users",
+        organization_notification.pk,
+        created,
+    )
+    return created
+
+
+def send_user_notifications(user_notification_ids):
+    """
+    Send the mail and the web push rows of fanned out user notifications,
+    every channel as one batch. Returns the number of user notifications sent.
+    """
+    user_notification_ids = list(
+        notification_models.UserNotification.objects.filter(
+            pk__in=user_notification_ids,
+            sent_on__isnull=True,
+        ).values_list("pk", flat=True),
+    )
+    channels = (
+        (notification_models.MailNotification, send_mail_notifications),
+        (notification_models.WebPushNotification, send_webpush_notifications),
+    )
+    failed = set()
+    for model, send in channels:
+        unsent = model.objects.filter(
+            notification_id__in=user_notification_ids,
+            sent_on__isnull=True,
+        )
+        send(list(unsent.values_list("pk", flat=True)))
+        failed.update(unsent.values_list("notification_id", flat=True))
+
+    sent = [pk for pk in user_notification_ids if pk not in failed]
+    results = notification_models.Notification.NotificationResult
+    notification_models.UserNotification.objects.filter(pk__in=sent).update(
+        sent_on=clock.now(),
+        result=results.SENT,
+    )
+    notification_models.UserNotification.objects.filter(pk__in=failed).update(
+        result=results.FAILED,
+    )
+    return len(sent)
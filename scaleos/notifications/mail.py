@@ -0,0 +1,179 @@
+"""
+Send the mail notifications in batches.
+
+A batch is sent over one SMTP connection. The templated email templates are
+compiled once per template and language, and every message gets its own
+result, so one refused address does not stop the rest of the batch.
+"""
+
+import logging
+import smtplib
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.core.mail import get_connection
+from django.template import Context
+from django.template import loader
+from django.utils import translation
+from render_block import BlockNotFound
+from render_block.django import django_render_block
+
+from scaleos.notifications import models as notification_models
+from scaleos.shared import clock
+from scaleos.shared.functions import is_blank
+
+logger = logging.getLogger(__name__)
+
+PARTS = ("subject", "plain", "html")
+RESULT_FIELDS = ["to_email_addresses", "sent_on", "result", "error", "modified_on"]
+
+
+@lru_cache(maxsize=128)
+def get_mail_template(template_name, language):
+    """
+    The compiled templated email, a variant for the language like
+    "notification/notification.nl.email" is used when it exists.
+    """
+    template_dir = getattr(settings, "TEMPLATED_EMAIL_TEMPLATE_DIR", "")
+    extension = f".{getattr(settings, 'TEMPLATED_EMAIL_FILE_EXTENSION', 'email')}"
+    template_name = template_name.removesuffix(extension)
+    names = [f"{template_dir}{template_name}{extension}"]
+    if language:
+        names.insert(0, f"{template_dir}{template_name}.{language}{extension}")
+    return loader.select_template(names)
+
+
+def render_mail(template_name, language, context):
+    """the subject, plain and html part of a templated email"""
+    template = get_mail_template(template_name, language)
+    parts = {}
+    with translation.override(language or None):
+        for part in PARTS:
+            try:
+                parts[part] = django_render_block(
+                    template,
+                    part,
+                    Context(context, autoescape=(part == "html")),
+                )
+            except BlockNotFound:
+                parts[part] = ""
+    parts["subject"] = " ".join(parts["subject"].split())
+    return parts
+
+
+def _addresses(value):
+    return [address.strip() for address in value.split(",") if address.strip()]
+
+
+def build_message(mail_notification, connection=None):
+    notification = mail_notification.notification
+    if is_blank(mail_notification.to_email_addresses) and mail_notification.user:
+        mail_notification.to_email_addresses = mail_notification.user.email
+
+    parts = render_mail(
+        notification.mail_template,
+        getattr(notification, "language", ""),
+        {"notification": notification},
+    )
+    message = EmailMultiAlternatives(
+        subject=mail_notification.subject or parts["subject"],
+        body=mail_notification.body or parts["plain"],
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=_addresses(mail_notification.to_email_addresses),
+        cc=_addresses(mail_notification.cc_email_addresses),
+        bcc=_addresses(mail_notification.bcc_email_addresses),
+        connection=connection,
+    )
+    html_body = mail_notification.html_body or parts["html"]
+    if html_body:
+        message.attach_alternative(html_body, "text/html")
+    return message
+
+
+def get_mail_notifications(mail_notification_ids):
+    """the unsent mail notifications with their notifications, in few queries"""
+    mail_notifications = list(
+        notification_models.MailNotification.objects.filter(
+            pk__in=mail_notification_ids,
+            sent_on__isnull=True,
+        ).select_related("user"),
+    )
+    notification_ids = [
+        mail_notification.notification_id for mail_notification in mail_notifications
+    ]
+    notifications = {
+        notification.pk: notification
+        for notification in notification_models.UserNotification.objects.filter(
+            pk__in=notification_ids,
+        ).select_related("sending_organization", "to_user__person")
+    }
+    notifications.update(
+        {
+            notification.pk: notification
+            for notification in notification_models.Notification.objects.filter(
+                pk__in=set(notification_ids) - set(notifications),
+            ).select_related("sending_organization")
+        },
+    )
+    for mail_notification in mail_notifications:
+        mail_notification.notification = notifications.get(
+            mail_notification.notification_id,
+        )
+    return mail_notifications
+
+
+def _send(connection, message):
+    try:
+        return connection.send_messages([message])
+    except smtplib.SMTPServerDisconnected:
+        logger.info("The mail server disconnected, connecting again")
+        connection.close()
+        return connection.send_messages([message])
+
+
+def send_mail_notifications(mail_notification_ids, connection=None):
+    """
+    Send the unsent mail notifications over one connection and store the
+    result of every message. Returns the number of messages sent.
+    """
+    mail_notifications = get_mail_notifications(mail_notification_ids)
+    if not mail_notifications:
+        return 0
+
+    results = notification_models.Notification.NotificationResult
+    connection = connection or get_connection()
+    sent = 0
+    connection.open()
+    try:
+        for mail_notification in mail_notifications:
+            mail_notification.modified_on = clock.now()
+            try:
+                message = build_message(mail_notification, connection)
+                if not message.recipients():
+                    mail_notification.result = results.FAILED
+                    mail_notification.error = "no recipients"
+                    continue
+                _send(connection, message)
+            except Exception as error:  # noqa: BLE001
+                logger.warning(
+                    "Could not send mail notification %s",
+                    mail_notification.pk,
+                    exc_info=True,
+                )
+                mail_notification.result = results.FAILED
+                mail_notification.error = str(error)
+            else:
+                mail_notification.result = results.SENT
+                mail_notification.error = ""
+                mail_notification.sent_on = mail_notification.modified_on
+                sent += 1
+    finally:
+        connection.close()
+        notification_models.MailNotification.objects.bulk_update(
+            mail_notifications,
+            RESULT_FIELDS,
+        )
+
+    logger.info("%s of %s mail notifications sent", sent, len(mail_notifications))
+    return sent
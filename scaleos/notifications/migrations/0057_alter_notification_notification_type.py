@@ -0,0 +1,18 @@
+# Generated by Django 5.0.12 on 2026-10-18 12:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0056_alter_notification_redirect_url'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='notification_type',
+            field=models.CharField(blank=True, choices=[('resengo_import_ready', 'Resengo import ready'), ('organization_confirmed_event_reservation', 'organization confirmed event reservation'), ('payment_due_reminder', 'payment due reminder'), ('unknown', 'unknown')], default='unknown', max_length=50),
+        ),
+    ]
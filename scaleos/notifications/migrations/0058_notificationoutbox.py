@@ -0,0 +1,28 @@
+# Generated by Django 5.0.12 on 2026-10-18 13:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0057_alter_notification_notification_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('available_on', models.DateTimeField(verbose_name='available on')),
+                ('created_on', models.DateTimeField(auto_now_add=True, verbose_name='created on')),
+                ('notification', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to='notifications.notification', verbose_name='notification')),
+            ],
+            options={
+                'verbose_name': 'notification outbox',
+                'verbose_name_plural': 'notification outbox',
+                'indexes': [models.Index(fields=['available_on', 'id'], name='notification_outbox_due')],
+            },
+        ),
+    ]
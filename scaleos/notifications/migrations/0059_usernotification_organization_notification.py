@@ -0,0 +1,29 @@
+# Generated by Django 5.0.12 on 2026-10-18 13:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0058_notificationoutbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='usernotification',
+            options={'verbose_name': 'user notification', 'verbose_name_plural': 'user notifications'},
+        ),
+        migrations.AddField(
+            model_name='usernotification',
+            name='organization_notification',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='user_notifications', to='notifications.organizationnotification', verbose_name='organization notification'),
+        ),
+        migrations.AddConstraint(
+            model_name='usernotification',
+            constraint=models.UniqueConstraint(fields=('organization_notification', 'to_user'), name='unique_organization_notification_user'),
+        ),
+    ]
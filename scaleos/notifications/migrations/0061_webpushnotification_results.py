@@ -0,0 +1,28 @@
+# Generated by Django 5.0.12 on 2026-10-18 13:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0060_mailnotification_results'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webpushnotification',
+            name='error',
+            field=models.TextField(blank=True, default='', verbose_name='error'),
+        ),
+        migrations.AddField(
+            model_name='webpushnotification',
+            name='result',
+            field=models.CharField(blank=True, choices=[('CREATED', 'created'), ('SENT', 'sent'), ('DISMISSED', 'dismissed'), ('MODIFIED', 'modified'), ('READ', 'read'), ('SEEN', 'seen'), ('CONFIRMED', 'confirmed'), ('CANCELED', 'canceled'), ('COMPLETED', 'completed'), ('error', 'error'), ('SUCCESS', 'success'), ('FAILED', 'failed'), ('UNKNOWN', 'unknown')], default='UNKNOWN', max_length=50, verbose_name='result'),
+        ),
+        migrations.AddField(
+            model_name='webpushnotification',
+            name='sent_on',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='sent on'),
+        ),
+    ]
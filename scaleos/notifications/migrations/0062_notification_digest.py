@@ -0,0 +1,23 @@
+# Generated by Django 5.0.12 on 2026-10-18 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0061_webpushnotification_results'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usernotification',
+            name='digest_on',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='digest on'),
+        ),
+        migrations.AddField(
+            model_name='usernotificationsettings',
+            name='digest_minutes',
+            field=models.PositiveIntegerField(default=0, help_text='merge the notifications of this window into one mail and one push, 0 sends every notification right away', verbose_name='digest every (minutes)'),
+        ),
+    ]
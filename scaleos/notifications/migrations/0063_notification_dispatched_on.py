@@ -0,0 +1,18 @@
+# Generated by Django 5.0.12 on 2026-10-18 13:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0062_notification_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='dispatched_on',
+            field=models.DateTimeField(blank=True, editable=False, help_text='the moment a worker started to prepare the sending', null=True, verbose_name='dispatched on'),
+        ),
+    ]
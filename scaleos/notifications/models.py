@@ -1,3 +1,4 @@
+import datetime
 import logging
 import uuid
 from enum import Enum
@@ -9,6 +10,7 @@ from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
+from django.db import transaction
 from django.forms import ValidationError
 from django.urls import NoReverseMatch
 from django.urls import reverse
@@ -17,18 +19,15 @@ from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 from kombu.exceptions import OperationalError
 from polymorphic.models import PolymorphicModel
-from templated_email import send_templated_mail
-from webpush import send_user_notification
 
 from config import celery_app
-from scaleos.notifications import tasks as notification_tasks
 from scaleos.organizations import models as organization_models
 from scaleos.organizations.functions import get_software_owner
+from scaleos.shared import clock
 from scaleos.shared.fields import LogInfoFields
 from scaleos.shared.fields import PublicKeyField
 from scaleos.shared.functions import get_base_url_from_string
 from scaleos.shared.functions import is_blank
-from scaleos.shared.mixins import ITS_NOW
 from scaleos.shared.mixins import AdminLinkMixin
 from scaleos.users import models as user_models
 
@@ -43,6 +42,7 @@ class Notification(PolymorphicModel, LogInfoFields, AdminLinkMixin, PublicKeyFie
             "organization_confirmed_event_reservation",
             _("organization confirmed event reservation"),
         )
+        PAYMENT_DUE_REMINDER = "payment_due_reminder", _("payment due reminder")
 
         UNKNOWN = "unknown", _("unknown")
 
@@ -90,6 +90,13 @@ class Notification(PolymorphicModel, LogInfoFields, AdminLinkMixin, PublicKeyFie
         default=ToBeSendInterval.SECONDS,
     )
     sent_on = models.DateTimeField(verbose_name=_("sent on"), null=True, blank=True)
+    dispatched_on = models.DateTimeField(
+        verbose_name=_("dispatched on"),
+        null=True,
+        blank=True,
+        editable=False,
+        help_text=_("the moment a worker started to prepare the sending"),
+    )
     seen_on = models.DateTimeField(null=True, blank=True)
     expires_on = models.DateTimeField(null=True, blank=True)
     dismissed_on = models.DateTimeField(null=True, blank=True)
@@ -230,6 +237,15 @@ class Notification(PolymorphicModel, LogInfoFields, AdminLinkMixin, PublicKeyFie
 
         return {}  # should return an empty dict for apply_async
 
+    @property
+    def dispatch_on(self):
+        """the moment the outbox hands the notification to the broker"""
+        if self.send_on:
+            return self.send_on
+        return clock.now() + datetime.timedelta(
+            seconds=self.send_in_amount_in_seconds,
+        )
+
     @cached_property
     def first_allowed_host(self):
         return settings.ALLOWED_HOSTS[0]
@@ -253,6 +269,18 @@ class Notification(PolymorphicModel, LogInfoFields, AdminLinkMixin, PublicKeyFie
         else:
             return f"https://{self.first_allowed_host}"
 
+    @cached_property
+    def icon_url(self):
+        """the logo, or else the favicon, of the sending organization"""
+        organization = self.sending_organization
+        styling = getattr(organization, "styling", None) if organization else None
+        if styling is None:
+            return ""
+        icon = styling.logo or styling.fav_icon
+        if not icon:
+            return ""
+        return f"{self.base_url}{icon.url}"
+
     @cached_property
     def show_notification_url(self):
         relative_url = reverse(
@@ -286,23 +314,28 @@ class Notification(PolymorphicModel, LogInfoFields, AdminLinkMixin, PublicKeyFie
 
         translation.deactivate()
 
-        super().save(*args, **kwargs)
+        dispatch = is_new and self.sent_on is None
+        if is_new and not dispatch:
+            logger.info(
+                "This notification has already been sent on %s",
+                self.sent_on,
+            )
 
-        if is_new:
-            logger.debug("Trying to send notification %s", self.pk)
-            if self.sent_on:
-                logger.info(
-                    "This notification has already been sent on %s",
-                    self.sent_on,
+        # the outbox row is committed together with the notification, the
+        # relay hands it to the broker afterwards
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if dispatch:
+                NotificationOutbox.objects.create(
+                    notification=self,
+                    available_on=self.dispatch_on,
                 )
-                return
-            logger.debug("Prepare notification sending")
 
-        notification_tasks.prepare_notification_sending.apply_async(
-            (self.id,),
-            **self.delay_options,
-            task_id=str(self.public_key),
-        )
+        if dispatch and getattr(settings, "CELERY_TASK_ALWAYS_EAGER", False):
+            from scaleos.notifications.outbox import relay_notifications
+
+            logger.debug("Prepare notification sending")
+            relay_notifications([self.pk])
 
     def clean(self):
         if self.send_in_amount > 0 and self.send_on:
@@ -313,6 +346,28 @@ class Notification(PolymorphicModel, LogInfoFields, AdminLinkMixin, PublicKeyFie
             msg = _("please choose one of both options")
             raise ValidationError({"about_content_object": msg, "redirect_url": msg})
 
+    def claim_dispatch(self):
+        """mark the notification as dispatched, False when a task already did"""
+        dispatched_on = clock.now()
+        claimed = bool(
+            Notification.objects.non_polymorphic()
+            .filter(pk=self.pk, dispatched_on__isnull=True)
+            .update(dispatched_on=dispatched_on),
+        )
+        if claimed:
+            self.dispatched_on = dispatched_on
+        return claimed
+
+    def release_dispatch(self):
+        """undo the claim of a task that failed, so a retry can send it"""
+        if self.dispatched_on is None:
+            return
+        Notification.objects.non_polymorphic().filter(
+            pk=self.pk,
+            dispatched_on=self.dispatched_on,
+        ).update(dispatched_on=None)
+        self.dispatched_on = None
+
     @property
     def celery_task_result(self):
         return AsyncResult(self.celery_task_id)
@@ -471,12 +526,47 @@ class UserNotification(Notification):
         default="",
         blank=True,
     )
+    organization_notification = models.ForeignKey(
+        "notifications.OrganizationNotification",
+        verbose_name=_("organization notification"),
+        on_delete=models.CASCADE,
+        related_name="user_notifications",
+        null=True,
+        blank=True,
+    )
+    # the end of the digest window this notification waits for
+    digest_on = models.DateTimeField(
+        verbose_name=_("digest on"),
+        null=True,
+        blank=True,
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = _("user notification")
+        verbose_name_plural = _("user notifications")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["organization_notification", "to_user"],
+                name="unique_organization_notification_user",
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         if self.to_user:
             self.language = self.to_user.get_primary_language()
         return super().save(*args, **kwargs)
 
+    @property
+    def can_be_digested(self):
+        """account mails, like a confirmation or a password reset, never wait"""
+        if self.about_content_type is None:
+            return True
+        return self.about_content_type.model_class() not in (
+            EmailConfirmation,
+            user_models.User,
+        )
+
     def send_webpush(self, notification_settings, to_user_id):
         if not self.to_user.has_webpush:
             logger.info("The user has no webpush")
@@ -546,6 +636,12 @@ class UserNotification(Notification):
             )
             return False
 
+        if notification_settings.digest_minutes and self.can_be_digested:
+            from scaleos.notifications.digest import hold_for_digest
+
+            hold_for_digest(self, notification_settings.digest_minutes)
+            return True
+
         self.send_webpush(notification_settings, to_user_id)
         self.send_mail(notification_settings, to_user_id)
         return True
@@ -566,6 +662,11 @@ class OrganizationNotification(Notification):
         blank=True,
     )
 
+    def send(self):
+        from scaleos.notifications.fanout import fan_out
+
+        return fan_out(self)
+
 
 class WebPushNotification(LogInfoFields):
     notification = models.OneToOneField(
@@ -586,70 +687,20 @@ class WebPushNotification(LogInfoFields):
     icon_url = models.URLField(blank=True, default="")
     show_notification_url = models.URLField(blank=True, default="")
 
-    def send(self):
-        logger.debug("Trying to send a push notification to %s", self.user)
-
-        notification_title = self.notification.title
-        if is_blank(self.title) and notification_title is not None:
-            self.title = notification_title
-            self.save(update_fields=["title"])
-
-        notification_message = self.notification.message
-        if is_blank(self.message) and notification_message:
-            self.message = notification_message
-            self.save(update_fields=["message"])
-
-        notification_redirect_url = self.notification.redirect_url
-        if is_blank(self.show_notification_url):
-            if notification_redirect_url is not None:
-                self.show_notification_url = notification_redirect_url
-            if self.notification and hasattr(
-                self.notification,
-                "show_notification_url",
-            ):
-                self.show_open_notification_url = (
-                    self.notification.show_notification_url
-                )
-            self.save(update_fields=["show_notification_url"])
-
-        if (
-            is_blank(self.icon_url)
-            and self.notification is not None
-            and hasattr(self.notification, "sending_organization")
-            and self.notification.sending_organization is not None
-        ):
-            if (
-                self.notification.sending_organization.styling
-                and self.notification.sending_organization.styling.fav_icon
-            ):
-                relative_icon_url = (
-                    self.notification.sending_organization.styling.fav_icon.url
-                )
-                self.icon_url = f"{self.notification.base_url}{relative_icon_url}"
-
-            if (
-                self.notification.sending_organization.styling
-                and self.notification.sending_organization.styling.logo
-            ):
-                relative_icon_url = (
-                    self.notification.sending_organization.styling.logo.url
-                )
-                self.icon_url = f"{self.notification.base_url}{relative_icon_url}"
+    sent_on = models.DateTimeField(verbose_name=_("sent on"), null=True, blank=True)
+    result = models.CharField(
+        verbose_name=_("result"),
+        max_length=50,
+        choices=Notification.NotificationResult.choices,
+        default=Notification.NotificationResult.UNKNOWN,
+        blank=True,
+    )
+    error = models.TextField(verbose_name=_("error"), blank=True, default="")
 
-            self.save(update_fields=["icon_url"])
+    def send(self):
+        from scaleos.notifications.push import send_webpush_notifications
 
-        payload = {
-            "head": str(self.title),
-            "body": str(self.message),
-            "icon": str(self.icon_url),
-            "url": str(self.show_notification_url),
-        }
-        logger.debug("Payload: %s", payload)
-        ttl = 10227000
-        if self.notification.expires_on:
-            ttl = (self.notification.expires_on - ITS_NOW).total_seconds()
-        send_user_notification(user=self.user, payload=payload, ttl=ttl)
-        logger.info("Push notification sent")
+        return send_webpush_notifications([self.pk]) == 1
 
 
 class MailNotification(LogInfoFields):
@@ -686,42 +737,20 @@ class MailNotification(LogInfoFields):
     body = models.TextField(blank=True, default="")
     html_body = models.TextField(blank=True, default="")
 
+    sent_on = models.DateTimeField(verbose_name=_("sent on"), null=True, blank=True)
+    result = models.CharField(
+        verbose_name=_("result"),
+        max_length=50,
+        choices=Notification.NotificationResult.choices,
+        default=Notification.NotificationResult.UNKNOWN,
+        blank=True,
+    )
+    error = models.TextField(verbose_name=_("error"), blank=True, default="")
+
     def send(self):
-        if is_blank(self.to_email_addresses):
-            logger.debug("To addresses is empty")
-            if self.user and self.user.email:
-                logger.debug("Getting email from user")
-                self.to_email_addresses = self.user.email
-
-            elif hasattr(self, "to_user"):
-                logger.debug("Getting email from TO-user")
-                self.to_email_addresses = self.to_user.email
-
-            self.save(update_fields=["to_email_addresses"])
-
-        recipient_list = self.to_email_addresses.split(",")
-        cc_list = self.cc_email_addresses.split(",")
-        bcc_list = self.bcc_email_addresses.split(",")
-
-        logger.debug("Trying to send a mail notification TO: %s", recipient_list)
-        logger.debug("Trying to send a mail notification CC: %s", cc_list)
-        logger.debug("Trying to send a mail notification BCC: %s", bcc_list)
-
-        # https://pypi.org/project/django-templated-email/
-        send_templated_mail(
-            template_name=self.notification.mail_template,
-            context={
-                "notification": self.notification,
-            },
-            subject=self.subject,
-            message=self.body,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=recipient_list,
-            cc=cc_list,
-            bcc=bcc_list,
-            html_message=self.html_body,
-        )
-        logger.info("Mail notification sent.")
+        from scaleos.notifications.mail import send_mail_notifications
+
+        return send_mail_notifications([self.pk]) == 1
 
 
 class UserNotificationSettings(AdminLinkMixin, LogInfoFields, PublicKeyField):
@@ -736,7 +765,38 @@ class UserNotificationSettings(AdminLinkMixin, LogInfoFields, PublicKeyField):
 
     webpush_only_during_working_hours = models.BooleanField(default=False)
     email_only_during_working_hours = models.BooleanField(default=False)
+    digest_minutes = models.PositiveIntegerField(
+        verbose_name=_("digest every (minutes)"),
+        default=0,
+        help_text=_(
+            "merge the notifications of this window into one mail and one push, "
+            "0 sends every notification right away",
+        ),
+    )
 
     class Meta:
         verbose_name = _("user notification settings")
         verbose_name_plural = _("user notification settings")
+
+
+class NotificationOutbox(models.Model):  # noqa: DJ008
+    """A created notification that still has to be handed to the broker"""
+
+    notification = models.OneToOneField(
+        Notification,
+        verbose_name=_("notification"),
+        on_delete=models.CASCADE,
+        related_name="outbox",
+    )
+    available_on = models.DateTimeField(verbose_name=_("available on"))
+    created_on = models.DateTimeField(verbose_name=_("created on"), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("notification outbox")
+        verbose_name_plural = _("notification outbox")
+        indexes = [
+            models.Index(
+                fields=["available_on", "id"],
+                name="notification_outbox_due",
+            ),
+        ]
@@ -0,0 +1,84 @@
+"""
+Hand the notifications to the broker through a transactional outbox.
+
+A notification is saved together with its outbox row, so it is only
+dispatched once it is committed. The relay drains the due rows in batches,
+publishes a task for each of them and deletes them in the same transaction.
+When that transaction does not commit, a later run publishes the rows again,
+and the broker does not drop a task with an id it has seen before. The task
+therefore claims the notification by setting its dispatched moment, so a
+notification that is published twice is still sent once.
+"""
+
+import logging
+
+from django.db import transaction
+from django.db.models import F
+
+from scaleos.notifications import models as notification_models
+from scaleos.shared import clock
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+def publish(rows):
+    from scaleos.notifications.tasks import prepare_notification_sending
+
+    for notification_id, public_key in rows:
+        prepare_notification_sending.apply_async(
+            (notification_id,),
+            task_id=str(public_key),
+        )
+
+
+def relay_batch(outbox, batch_size=BATCH_SIZE):
+    """publish and delete one batch of the outbox rows, returns the size"""
+    with transaction.atomic():
+        rows = dict(
+            outbox.select_for_update(skip_locked=True, of=("self",))
+            .order_by("available_on", "pk")
+            .values_list("pk", "notification_id")[:batch_size],
+        )
+        if not rows:
+            return 0
+
+        notifications = list(
+            notification_models.Notification.objects.non_polymorphic()
+            .filter(pk__in=rows.values())
+            .values_list("pk", "public_key"),
+        )
+        publish(notifications)
+        notification_models.NotificationOutbox.objects.filter(pk__in=rows).delete()
+        notification_models.Notification.objects.filter(
+            pk__in=rows.values(),
+        ).update(celery_task_id=F("public_key"))
+    return len(rows)
+
+
+def relay_outbox(moment=None, batch_size=BATCH_SIZE):
+    """relay the due notifications batch by batch, returns the number"""
+    due = notification_models.NotificationOutbox.objects.filter(
+        available_on__lte=moment or clock.now(),
+    )
+    relayed = 0
+    while batch := relay_batch(due, batch_size):
+        relayed += batch
+        if batch < batch_size:
+            break
+
+    if relayed:
+        logger.info("%s notifications relayed to the broker", relayed)
+    return relayed
+
+
+def relay_notifications(notification_ids):
+    """relay these notifications right away, due or not"""
+    notification_ids = list(notification_ids)
+    return relay_batch(
+        notification_models.NotificationOutbox.objects.filter(
+            notification_id__in=notification_ids,
+        ),
+        len(notification_ids),
+    )
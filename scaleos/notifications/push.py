@@ -0,0 +1,276 @@
+"""
+Send the web push notifications in batches.
+
+The payload of a notification is completed in memory and stored together with
+the result, in one update for the whole batch. The VAPID headers are signed
+once per push service and reused while they are valid. The messages are
+posted concurrently over the pooled connections of the process, and the
+subscriptions the push service no longer knows are deleted in one query.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from http import HTTPStatus
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from django.forms.models import model_to_dict
+from py_vapid import Vapid
+from pywebpush import WebPusher
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+from webpush.models import PushInformation
+from webpush.models import SubscriptionInfo
+
+from scaleos.notifications import models as notification_models
+from scaleos.shared import clock
+from scaleos.shared.functions import is_blank
+
+logger = logging.getLogger(__name__)
+
+# the push service keeps an undelivered message this long, about 4 months
+DEFAULT_TTL = 10227000
+TIMEOUT = (2, 10)
+# a VAPID token may be valid for at most 24 hours
+VAPID_VALIDITY = 12 * 60 * 60
+# a cached token is signed again when it expires within this time
+VAPID_RENEW = 60 * 60
+EXPIRED_STATUSES = (HTTPStatus.NOT_FOUND, HTTPStatus.GONE)
+
+PAYLOAD_FIELDS = ["title", "message", "icon_url", "show_notification_url"]
+RESULT_FIELDS = ["sent_on", "result", "error", "modified_on"]
+
+_vapid_headers = {}
+_vapid_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def get_session():
+    """
+    The connection pool of the process. A push is not idempotent, so only
+    the connections that could not be made are retried.
+    """
+    adapter = HTTPAdapter(
+        pool_connections=8,
+        pool_maxsize=settings.WEBPUSH_POOL_SIZE,
+        max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2),
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+@lru_cache(maxsize=4)
+def get_vapid(private_key):
+    return Vapid.from_string(private_key=private_key)
+
+
+def get_vapid_headers(endpoint):
+    """the signed VAPID headers for the push service of the endpoint"""
+    webpush_settings = getattr(settings, "WEBPUSH_SETTINGS", {})
+    private_key = webpush_settings.get("VAPID_PRIVATE_KEY")
+    if not private_key:
+        return {}
+
+    url = urlparse(endpoint)
+    audience = f"{url.scheme}://{url.netloc}"
+    key = (private_key, audience)
+    now = int(time.time())
+    with _vapid_lock:
+        expires_at, headers = _vapid_headers.get(key, (0, None))
+        if expires_at - now > VAPID_RENEW:
+            return headers
+
+        expires_at = now + VAPID_VALIDITY
+        headers = get_vapid(private_key).sign(
+            {
+                "sub": f"mailto:{webpush_settings.get('VAPID_ADMIN_EMAIL')}",
+                "aud": audience,
+                "exp": expires_at,
+            },
+        )
+        _vapid_headers[key] = (expires_at, headers)
+        return headers
+
+
+def clear_vapid_headers():
+    with _vapid_lock:
+        _vapid_headers.clear()
+
+
+def build_payload(webpush_notification):
+    """
+    Complete the empty fields from the notification, in memory, and return
+    the payload the service worker shows.
+    """
+    notification = webpush_notification.notification
+    if notification is not None:
+        defaults = {
+            "title": notification.title,
+            "message": notification.message,
+            "icon_url": notification.icon_url,
+            "show_notification_url": notification.redirect_url,
+        }
+        for field, value in defaults.items():
+            if is_blank(getattr(webpush_notification, field)) and value:
+                setattr(webpush_notification, field, value)
+
+    return {
+        "head": str(webpush_notification.title),
+        "body": str(webpush_notification.message),
+        "icon": str(webpush_notification.icon_url),
+        "url": str(webpush_notification.show_notification_url),
+    }
+
+
+def get_ttl(webpush_notification):
+    notification = webpush_notification.notification
+    if notification is None or notification.expires_on is None:
+        return DEFAULT_TTL
+    return max(0, int((notification.expires_on - clock.now()).total_seconds()))
+
+
+def subscription_info(subscription):
+    data = model_to_dict(subscription, fields=["endpoint", "p256dh", "auth"])
+    return {
+        "endpoint": data["endpoint"],
+        "keys": {"p256dh": data["p256dh"], "auth": data["auth"]},
+    }
+
+
+def push(subscription, data, ttl):
+    """post one encrypted message, returns the status of the push service"""
+    response = WebPusher(
+        subscription_info(subscription),
+        requests_session=get_session(),
+    ).send(
+        data,
+        get_vapid_headers(subscription.endpoint),
+        ttl=ttl,
+        timeout=TIMEOUT,
+    )
+    return response.status_code
+
+
+def get_webpush_notifications(webpush_notification_ids):
+    """the unsent web push notifications with the subscriptions of their users"""
+    webpush_notifications = list(
+        notification_models.WebPushNotification.objects.filter(
+            pk__in=webpush_notification_ids,
+            sent_on__isnull=True,
+        ).select_related("notification__sending_organization__styling"),
+    )
+    subscriptions = defaultdict(list)
+    for push_information in PushInformation.objects.filter(
+        user_id__in={
+            webpush_notification.user_id
+            for webpush_notification in webpush_notifications
+        },
+    ).select_related("subscription"):
+        subscriptions[push_information.user_id].append(push_information.subscription)
+    return webpush_notifications, subscriptions
+
+
+def dispatch(jobs):
+    """
+    Post the messages concurrently, returns the status or the error of every
+    job in the same order.
+    """
+    if not jobs:
+        return []
+
+    def run(job):
+        subscription, data, ttl = job
+        try:
+            return push(subscription, data, ttl)
+        except Exception as error:  # noqa: BLE001
+            logger.warning(
+                "Could not push to subscription %s",
+                subscription.pk,
+                exc_info=True,
+            )
+            return error
+
+    workers = min(settings.WEBPUSH_POOL_SIZE, len(jobs))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run, jobs))
+
+
+def send_webpush_notifications(webpush_notification_ids):
+    """
+    Push the unsent web push notifications to all the subscriptions of their
+    users and store the payload and result of every notification. Returns
+    the number of notifications delivered to at least one subscription.
+    """
+    webpush_notifications, subscriptions = get_webpush_notifications(
+        webpush_notification_ids,
+    )
+    if not webpush_notifications:
+        return 0
+
+    jobs = []
+    owners = []
+    for webpush_notification in webpush_notifications:
+        data = json.dumps(build_payload(webpush_notification))
+        ttl = get_ttl(webpush_notification)
+        for subscription in subscriptions[webpush_notification.user_id]:
+            jobs.append((subscription, data, ttl))
+            owners.append(webpush_notification.pk)
+
+    outcomes = defaultdict(list)
+    expired = set()
+    for (subscription, _, _), owner, outcome in zip(
+        jobs,
+        owners,
+        dispatch(jobs),
+        strict=True,
+    ):
+        if outcome in EXPIRED_STATUSES:
+            expired.add(subscription.pk)
+        outcomes[owner].append(outcome)
+
+    results = notification_models.Notification.NotificationResult
+    its_now = clock.now()
+    sent = 0
+    for webpush_notification in webpush_notifications:
+        webpush_notification.modified_on = its_now
+        delivered = [
+            outcome
+            for outcome in outcomes[webpush_notification.pk]
+            if isinstance(outcome, int) and outcome < HTTPStatus.MULTIPLE_CHOICES
+        ]
+        if delivered:
+            webpush_notification.sent_on = its_now
+            webpush_notification.result = results.SENT
+            webpush_notification.error = ""
+            sent += 1
+            continue
+
+        webpush_notification.result = results.FAILED
+        webpush_notification.error = (
+            ", ".join(str(outcome) for outcome in outcomes[webpush_notification.pk])
+            or "no subscriptions"
+        )
+
+    notification_models.WebPushNotification.objects.bulk_update(
+        webpush_notifications,
+        PAYLOAD_FIELDS + RESULT_FIELDS,
+    )
+    if expired:
+        # the push information of the subscriptions cascades
+        SubscriptionInfo.objects.filter(pk__in=expired).delete()
+        logger.info("%s expired push subscriptions deleted", len(expired))
+
+    logger.info(
+        "%s of %s web push notifications sent",
+        sent,
+        len(webpush_notifications),
+    )
+    return sent
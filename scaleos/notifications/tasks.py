@@ -19,10 +19,18 @@ def prepare_notification_sending(self, notification_id):
         notification_id,
     )
 
+    notification = None
     try:
         # This will return the correct subclass!
         notification = notification_models.Notification.objects.get(id=notification_id)
         model_name = notification.verbose_name.upper()
+        if not notification.claim_dispatch():
+            logger.info(
+                "[%s] #%s is already dispatched, skipping",
+                model_name,
+                notification_id,
+            )
+            return
         if hasattr(notification, "send"):
             logger.debug("[SEND %s] #%s", model_name, notification_id)
             notification.send()
@@ -41,4 +49,43 @@ def prepare_notification_sending(self, notification_id):
 
     except Exception as e:
         logger.exception("[RETRY] Task failed, retrying...")
+        if notification is not None:
+            # the retry has to claim the notification again
+            notification.release_dispatch()
         raise self.retry(exc=e, countdown=60 * (self.request.retries + 1)) from e
+
+
+@celery_app.task(bind=True, soft_time_limit=60, max_retries=3)
+def relay_notification_outbox(self):
+    from scaleos.notifications.outbox import relay_outbox
+
+    try:
+        relay_outbox()
+
+    except SoftTimeLimitExceeded:
+        # the relayed batches are committed, the next run continues
+        logger.warning("[TIMEOUT] Task exceeded soft time limit.")
+
+
+@celery_app.task(bind=True, soft_time_limit=60 * 10, max_retries=3)
+def send_fanned_out_notifications(self, user_notification_ids):
+    from scaleos.notifications.fanout import send_user_notifications
+
+    try:
+        send_user_notifications(user_notification_ids)
+
+    except SoftTimeLimitExceeded:
+        # the unsent notifications of the chunk keep an empty sent_on
+        logger.warning("[TIMEOUT] Task exceeded soft time limit.")
+
+
+@celery_app.task(bind=True, soft_time_limit=60 * 5, max_retries=3)
+def send_notification_digests(self):
+    from scaleos.notifications.digest import send_digests
+
+    try:
+        send_digests()
+
+    except SoftTimeLimitExceeded:
+        # the digests that were not delivered are merged again by a later run
+        logger.warning("[TIMEOUT] Task exceeded soft time limit.")
@@ -0,0 +1,149 @@
+"""
+A local stand-in for a web push service.
+
+A subscription of the stub has real keys, so the stub decrypts the messages
+it receives and keeps them per subscription. It checks the VAPID headers,
+answers 410 for the subscriptions it expired, and can answer the next
+requests with an error.
+"""
+
+import base64
+import logging
+import secrets
+import threading
+from collections import defaultdict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import http_ece
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+logger = logging.getLogger(__name__)
+
+PUSH_PATH = "/push/"
+
+
+def b64url(data):
+    return base64.urlsafe_b64encode(data).strip(b"=").decode()
+
+
+class PushStubHandler(BaseHTTPRequestHandler):
+    server_version = "PushStub/1.0"
+
+    @property
+    def stub(self):
+        return self.server.stub
+
+    def log_message(self, format, *args):  # noqa: A002
+        logger.debug(format, *args)
+
+    def answer(self, status):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):  # noqa: N802
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        path = urlparse(self.path).path
+        self.stub.requests.append((path, dict(self.headers)))
+
+        failure = self.stub.pop_failure()
+        if failure is not None:
+            self.answer(failure)
+            return
+
+        token = path.removeprefix(PUSH_PATH)
+        if not path.startswith(PUSH_PATH) or token not in self.stub.keys:
+            self.answer(HTTPStatus.NOT_FOUND)
+            return
+        if token in self.stub.expired:
+            self.answer(HTTPStatus.GONE)
+            return
+        if not self.headers.get("Authorization", "").startswith("vapid "):
+            self.answer(HTTPStatus.UNAUTHORIZED)
+            return
+
+        self.stub.receive(token, body)
+        self.answer(HTTPStatus.CREATED)
+
+
+class PushStubServer:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.keys = {}
+        self.messages = defaultdict(list)
+        self.expired = set()
+        self.failures = []
+        self.requests = []
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), PushStubHandler)
+        self.httpd.stub = self
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def subscribe(self):
+        """the endpoint and keys of a new subscription, as a browser sends them"""
+        token = secrets.token_hex(8)
+        private_key = ec.generate_private_key(ec.SECP256R1())
+        auth = secrets.token_bytes(16)
+        with self.lock:
+            self.keys[token] = (private_key, auth)
+        public_key = private_key.public_key().public_bytes(
+            serialization.Encoding.X962,
+            serialization.PublicFormat.UncompressedPoint,
+        )
+        return {
+            "endpoint": f"{self.url}{PUSH_PATH}{token}",
+            "p256dh": b64url(public_key),
+            "auth": b64url(auth),
+        }
+
+    def expire(self, endpoint):
+        """answer 410 for this subscription from now on"""
+        with self.lock:
+            self.expired.add(endpoint.rsplit("/", 1)[-1])
+
+    def fail_next(self, *statuses):
+        with self.lock:
+            self.failures.extend(statuses)
+
+    def pop_failure(self):
+        with self.lock:
+            return self.failures.pop(0) if self.failures else None
+
+    def receive(self, token, body):
+        private_key, auth = self.keys[token]
+        message = http_ece.decrypt(
+            body,
+            private_key=private_key,
+            auth_secret=auth,
+            version="aes128gcm",
+        )
+        with self.lock:
+            self.messages[token].append(message)
+
+    def received(self, endpoint):
+        """the decrypted messages of a subscription"""
+        return self.messages[endpoint.rsplit("/", 1)[-1]]
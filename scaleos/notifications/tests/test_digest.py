@@ -0,0 +1,114 @@
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+from django.core import mail
+from django.utils import timezone
+
+from scaleos.notifications import digest
+from scaleos.notifications import models as notification_models
+from scaleos.notifications.digest import DIGEST_TEMPLATE
+from scaleos.notifications.digest import send_digests
+from scaleos.notifications.mail import render_mail
+from scaleos.notifications.tests import model_factories as notification_factories
+from scaleos.organizations.tests import model_factories as organization_factories
+from scaleos.users.tests import model_factories as user_factories
+
+
+def test_digest_mail_lists_every_notification():
+    organization = SimpleNamespace(name="ScaleOS", styling=None)
+    to_user = SimpleNamespace(email="user@example.com", person=None)
+    notifications = [
+        SimpleNamespace(
+            sending_organization=organization,
+            to_user=to_user,
+            title=f"Reservation {index}",
+            message="Confirmed",
+            button_link=f"https://example.com/{index}/",
+            button_text="open",
+        )
+        for index in range(3)
+    ]
+    parts = render_mail(
+        DIGEST_TEMPLATE,
+        "en",
+        {"notification": notifications[-1], "notifications": notifications},
+    )
+
+    assert parts["subject"] == "3 new notifications from ScaleOS"
+    for index in range(3):
+        assert f"Reservation {index}" in parts["plain"]
+        assert f"https://example.com/{index}/" in parts["html"]
+
+
+@pytest.mark.django_db
+def test_notifications_within_the_window_are_sent_as_one_digest():
+    user = user_factories.UserFactory()
+    notification_factories.UserNotificationSettingsFactory(
+        user=user,
+        digest_minutes=10,
+    )
+    organization = organization_factories.OrganizationFactory()
+    user_notifications = [
+        notification_factories.UserNotificationFactory(
+            to_user=user,
+            sending_organization=organization,
+            title=f"Reservation {index}",
+        )
+        for index in range(3)
+    ]
+
+    assert len(mail.outbox) == 0
+    digest_on = {
+        user_notification.digest_on
+        for user_notification in notification_models.UserNotification.objects.filter(
+            to_user=user,
+        )
+    }
+    assert len(digest_on) == 1
+    assert send_digests() == 0
+
+    assert send_digests(timezone.now() + timedelta(minutes=11)) == 1
+    assert len(mail.outbox) == 1
+    assert mail.outbox[0].subject.startswith("3 ")
+    assert mail.outbox[0].to == [user.email]
+    for user_notification in user_notifications:
+        user_notification.refresh_from_db()
+        assert user_notification.sent_on is not None
+
+    assert send_digests(timezone.now() + timedelta(minutes=11)) == 0
+    assert len(mail.outbox) == 1
+
+
+@pytest.mark.django_db
+def test_a_digest_is_only_marked_sent_once_it_is_delivered(monkeypatch):
+    user = user_factories.UserFactory()
+    notification_factories.UserNotificationSettingsFactory(
+        user=user,
+        digest_minutes=10,
+    )
+    organization = organization_factories.OrganizationFactory()
+    for index in range(2):
+        notification_factories.UserNotificationFactory(
+            to_user=user,
+            sending_organization=organization,
+            title=f"Reservation {index}",
+        )
+    user_notifications = notification_models.UserNotification.objects.filter(
+        to_user=user,
+    )
+
+    monkeypatch.setattr(digest, "send_mail_notifications", lambda ids: 0)
+    assert send_digests(timezone.now() + timedelta(minutes=11)) == 0
+    assert not user_notifications.filter(sent_on__isnull=False).exists()
+    assert set(user_notifications.values_list("result", flat=True)) == {
+        notification_models.Notification.NotificationResult.FAILED,
+    }
+
+    # merged again, the unsent mail of the digest is reused
+    monkeypatch.undo()
+    user_notifications.update(digest_on=timezone.now())
+    assert send_digests(timezone.now() + timedelta(minutes=11)) == 1
+    assert len(mail.outbox) == 1
+    assert notification_models.MailNotification.objects.filter(user=user).count() == 1
+    assert not user_notifications.filter(sent_on__isnull=True).exists()
@@ -0,0 +1,97 @@
+import pytest
+from django.core import mail
+from django.utils import timezone
+
+from scaleos.hr.tests import model_factories as hr_factories
+from scaleos.notifications import models as notification_models
+from scaleos.notifications.fanout import fan_out
+from scaleos.notifications.fanout import get_recipients
+from scaleos.notifications.tests import model_factories as notification_factories
+from scaleos.organizations.tests import model_factories as organization_factories
+from scaleos.users.tests import model_factories as user_factories
+
+NotificationTo = notification_models.OrganizationNotification.NotificationTo
+
+
+def a_person():
+    return hr_factories.PersonFactory(user=user_factories.UserFactory())
+
+
+@pytest.mark.django_db
+def test_organization_notification_fan_out(django_capture_on_commit_callbacks):
+    organization = organization_factories.OrganizationFactory()
+    owner = organization_factories.OrganizationOwnerFactory(
+        organization=organization,
+        person=a_person(),
+    )
+    employee = organization_factories.OrganizationEmployeeFactory(
+        organization=organization,
+        person=a_person(),
+    )
+    customer = organization_factories.B2CCustomerFactory(
+        organization=organization,
+        person=a_person(),
+    )
+    b2b_customer = organization_factories.B2BCustomerFactory(
+        organization=organization,
+    )
+    b2b_member = organization_factories.OrganizationMemberFactory(
+        organization=b2b_customer.b2b,
+        person=a_person(),
+    )
+    supplier = organization_factories.B2BCustomerFactory(b2b=organization)
+    supplier_member = organization_factories.OrganizationMemberFactory(
+        organization=supplier.organization,
+        person=a_person(),
+    )
+    opted_out = organization_factories.B2CCustomerFactory(
+        organization=organization,
+        person=a_person(),
+    )
+    notification_models.UserNotificationSettings.objects.create(
+        user=opted_out.person.user,
+        disabled_all_notifications_on=timezone.now(),
+    )
+
+    def recipients(to):
+        return set(
+            get_recipients(
+                notification_models.OrganizationNotification(
+                    sending_organization=organization,
+                    to=to,
+                ),
+            ).values_list("pk", flat=True),
+        )
+
+    assert recipients(NotificationTo.ORGANIZATION_OWNERS) == {owner.person.user_id}
+    assert recipients(NotificationTo.ORGANIZATION_EMPLOYEES) == {
+        employee.person.user_id,
+    }
+    assert recipients(NotificationTo.FULL_ORGANIZATION) == {
+        owner.person.user_id,
+        employee.person.user_id,
+    }
+    assert recipients(NotificationTo.ORGANIZATION_SUPPLIERS) == {
+        supplier_member.person.user_id,
+    }
+    assert recipients(NotificationTo.ORGANIZATION_CUSTOMERS) == {
+        customer.person.user_id,
+        b2b_member.person.user_id,
+    }
+
+    with django_capture_on_commit_callbacks(execute=True):
+        notification = notification_factories.OrganizationNotificationFactory(
+            sending_organization=organization,
+            to=NotificationTo.ORGANIZATION_CUSTOMERS,
+            title="news",
+            message="hello",
+        )
+
+    user_notifications = notification.user_notifications.all()
+    assert {
+        user_notification.to_user_id for user_notification in user_notifications
+    } == {customer.person.user_id, b2b_member.person.user_id}
+    assert all(user_notification.sent_on for user_notification in user_notifications)
+    assert len(mail.outbox) == 2
+
+    assert fan_out(notification) == 0
@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+import pytest
+from django.core import mail
+
+from scaleos.notifications import models as notification_models
+from scaleos.notifications.mail import get_mail_template
+from scaleos.notifications.mail import render_mail
+from scaleos.notifications.mail import send_mail_notifications
+from scaleos.notifications.tests import model_factories as notification_factories
+
+
+def test_mail_template_is_compiled_once():
+    get_mail_template.cache_clear()
+    template = get_mail_template("notification/notification.email", "nl")
+
+    assert get_mail_template("notification/notification.email", "nl") is template
+    assert get_mail_template.cache_info().hits == 1
+
+
+def test_render_mail_parts():
+    notification = SimpleNamespace(
+        sending_organization=SimpleNamespace(name="ScaleOS"),
+        to_user=SimpleNamespace(email="user@example.com", person=None),
+        message="The <message>",
+        button_link="https://example.com/open/",
+    )
+    parts = render_mail(
+        notification_models.Notification.mail_template,
+        "en",
+        {"notification": notification},
+    )
+
+    assert parts["subject"].endswith("ScaleOS")
+    assert "\n" not in parts["subject"]
+    assert "user@example.com" in parts["plain"]
+    assert "https://example.com/open/" in parts["html"]
+
+
+@pytest.mark.django_db
+def test_mail_notifications_are_sent_in_one_batch(monkeypatch):
+    mail_notifications = [
+        notification_factories.MailNotificationFactory(
+            to_email_addresses=f"user{index}@example.com",
+        )
+        for index in range(3)
+    ]
+    failing = notification_factories.MailNotificationFactory(
+        to_email_addresses="",
+        user=None,
+    )
+    opened = []
+    monkeypatch.setattr(
+        "django.core.mail.backends.locmem.EmailBackend.open",
+        lambda backend: opened.append(backend),
+        raising=False,
+    )
+
+    ids = [mail_notification.pk for mail_notification in mail_notifications]
+    assert send_mail_notifications([*ids, failing.pk]) == 3
+    assert len(mail.outbox) == 3
+    assert len(opened) == 1
+
+    results = notification_models.Notification.NotificationResult
+    for mail_notification in mail_notifications:
+        mail_notification.refresh_from_db()
+        assert mail_notification.result == results.SENT
+        assert mail_notification.sent_on is not None
+    failing.refresh_from_db()
+    assert failing.result == results.FAILED
+    assert failing.sent_on is None
+
+    # a retried batch only sends what is still unsent
+    assert send_mail_notifications(ids) == 0
+    assert len(mail.outbox) == 3
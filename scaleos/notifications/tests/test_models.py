@@ -1,5 +1,4 @@
 import logging
-from unittest.mock import MagicMock
 from unittest.mock import patch
 
 import pytest
@@ -14,13 +13,13 @@ logger = logging.getLogger(__name__)
 
 @pytest.mark.django_db
 class TestUserNotification:
-    @patch("webpush.utils._send_notification")
+    @patch("scaleos.notifications.push.push")
     def test_user_notification_should_create_webpush_notification(
         self,
-        mock_send_notification,
+        mock_push,
         webpush_user,
     ):
-        mock_send_notification.return_value = MagicMock(status=200, success=True)
+        mock_push.return_value = 201
         organization = organization_factories.OrganizationFactory.create()
 
         notification = notification_factories.UserNotificationFactory.create(
@@ -0,0 +1,75 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from scaleos.notifications import models as notification_models
+from scaleos.notifications import tasks as notification_tasks
+from scaleos.notifications.outbox import relay_outbox
+from scaleos.notifications.tests import model_factories as notification_factories
+
+
+@pytest.mark.django_db
+def test_notifications_are_relayed_once_after_commit(settings, monkeypatch):
+    settings.CELERY_TASK_ALWAYS_EAGER = False
+    published = []
+    monkeypatch.setattr(
+        notification_tasks.prepare_notification_sending,
+        "apply_async",
+        lambda args, **kwargs: published.append((args, kwargs["task_id"])),
+    )
+
+    notification = notification_factories.UserNotificationFactory(title="hi")
+    notification.title = "hello"
+    notification.save()
+    later = notification_factories.UserNotificationFactory(
+        send_on=timezone.now() + timedelta(hours=1),
+    )
+    assert published == []
+    assert notification_models.NotificationOutbox.objects.count() == 2
+
+    assert relay_outbox(batch_size=1) == 1
+    assert published == [((notification.pk,), str(notification.public_key))]
+    assert relay_outbox() == 0
+    notification.refresh_from_db()
+    assert notification.celery_task_id == notification.public_key
+
+    assert relay_outbox(timezone.now() + timedelta(hours=2)) == 1
+    assert published[-1] == ((later.pk,), str(later.public_key))
+    assert not notification_models.NotificationOutbox.objects.exists()
+
+
+@pytest.mark.django_db
+def test_a_notification_published_twice_is_sent_once(monkeypatch):
+    sent = []
+    monkeypatch.setattr(
+        notification_models.UserNotification,
+        "send",
+        lambda notification: sent.append(notification.pk),
+    )
+
+    notification = notification_factories.UserNotificationFactory()
+    assert sent == [notification.pk]
+
+    notification_tasks.prepare_notification_sending.apply(args=(notification.pk,))
+    assert sent == [notification.pk]
+    notification.refresh_from_db()
+    assert notification.dispatched_on is not None
+
+
+@pytest.mark.django_db
+def test_a_notification_that_failed_to_send_is_retried(monkeypatch):
+    attempts = []
+
+    def send(notification):
+        attempts.append(notification.pk)
+        if len(attempts) == 1:
+            msg = "the mail server is down"
+            raise ConnectionError(msg)
+
+    monkeypatch.setattr(notification_models.UserNotification, "send", send)
+
+    notification = notification_factories.UserNotificationFactory()
+    assert attempts == [notification.pk, notification.pk]
+    notification.refresh_from_db()
+    assert notification.dispatched_on is not None
@@ -0,0 +1,93 @@
+import json
+
+import pytest
+from py_vapid import Vapid
+from py_vapid import b64urlencode
+from webpush.models import PushInformation
+from webpush.models import SubscriptionInfo
+
+from scaleos.notifications import models as notification_models
+from scaleos.notifications import push
+from scaleos.notifications.tests import model_factories as notification_factories
+from scaleos.notifications.tests.push_stub import PushStubServer
+
+
+@pytest.fixture
+def vapid_settings(settings):
+    vapid = Vapid()
+    vapid.generate_keys()
+    private_key = vapid.private_key.private_numbers().private_value.to_bytes(32, "big")
+    settings.WEBPUSH_SETTINGS = {
+        "VAPID_PUBLIC_KEY": "",
+        "VAPID_PRIVATE_KEY": b64urlencode(private_key),
+        "VAPID_ADMIN_EMAIL": "admin@example.com",
+    }
+    push.clear_vapid_headers()
+    yield settings.WEBPUSH_SETTINGS
+    push.clear_vapid_headers()
+
+
+@pytest.fixture
+def push_stub(vapid_settings):
+    with PushStubServer() as stub:
+        yield stub
+
+
+def test_vapid_headers_are_signed_once_per_push_service(vapid_settings):
+    headers = push.get_vapid_headers("https://fcm.googleapis.com/fcm/send/a")
+
+    assert headers["Authorization"].startswith("vapid ")
+    assert push.get_vapid_headers("https://fcm.googleapis.com/fcm/send/b") is headers
+    assert push.get_vapid_headers("https://updates.push.services.mozilla.com/x") != (
+        headers
+    )
+
+
+def test_push_to_the_stub_service(push_stub):
+    subscription = SubscriptionInfo(pk=1, **push_stub.subscribe())
+    expired = SubscriptionInfo(pk=2, **push_stub.subscribe())
+    push_stub.expire(expired.endpoint)
+    data = json.dumps({"head": "Hello", "body": "World"})
+
+    assert push.dispatch([(subscription, data, 60), (expired, data, 60)]) == [201, 410]
+    assert push_stub.received(subscription.endpoint) == [data.encode()]
+    assert push_stub.received(expired.endpoint) == []
+
+
+@pytest.mark.django_db
+def test_webpush_notifications_are_sent_and_expired_subscriptions_pruned(push_stub):
+    webpush_notification = notification_factories.WebPushNotificationFactory(
+        notification=notification_factories.UserNotificationFactory(
+            title="Hello",
+            message="World",
+        ),
+    )
+    subscriptions = [
+        SubscriptionInfo.objects.create(browser="Chrome", **push_stub.subscribe())
+        for _ in range(3)
+    ]
+    for subscription in subscriptions:
+        PushInformation.objects.create(
+            user=webpush_notification.user,
+            subscription=subscription,
+        )
+    push_stub.expire(subscriptions[0].endpoint)
+
+    assert push.send_webpush_notifications([webpush_notification.pk]) == 1
+
+    webpush_notification.refresh_from_db()
+    assert webpush_notification.title == "Hello"
+    assert webpush_notification.message == "World"
+    assert webpush_notification.sent_on is not None
+    assert (
+        webpush_notification.result
+        == notification_models.Notification.NotificationResult.SENT
+    )
+    payload = json.loads(push_stub.received(subscriptions[1].endpoint)[0])
+    assert payload["head"] == "Hello"
+    assert not SubscriptionInfo.objects.filter(pk=subscriptions[0].pk).exists()
+    assert PushInformation.objects.filter(user=webpush_notification.user).count() == 2
+
+    # a sent notification is not pushed again
+    assert push.send_webpush_notifications([webpush_notification.pk]) == 0
+    assert len(push_stub.received(subscriptions[1].endpoint)) == 1
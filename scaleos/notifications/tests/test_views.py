@@ -12,8 +12,6 @@ from django.utils import timezone
 
 from scaleos.notifications.tests import model_factories as notification_factories
 from scaleos.organizations.tests import model_factories as organization_factories
-
-# Assuming ITS_NOW is accessible or mock it if needed
 from scaleos.users.tests.model_factories import UserFactory
 
 logger = logging.getLogger(__name__)
@@ -12,7 +12,7 @@ from django.views.decorators.cache import never_cache
 from templated_email import get_templated_mail
 
 from scaleos.notifications import models as notification_models
-from scaleos.shared.mixins import ITS_NOW
+from scaleos.shared import clock
 
 logger = logging.getLogger(__name__)
 
@@ -36,7 +36,7 @@ def notification(request, notification_public_key=None):
     if notification.seen_on is None:
         notification_models.Notification.objects.filter(
             public_key=notification_public_key,
-        ).update(seen_on=ITS_NOW)
+        ).update(seen_on=clock.now())
 
     request.session["active_organization_id"] = notification.sending_organization.pk
 
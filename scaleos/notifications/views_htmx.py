@@ -4,7 +4,7 @@ from django.http import HttpResponse
 from django.views.decorators.cache import never_cache
 
 from scaleos.notifications.models import UserNotificationSettings
-from scaleos.shared.mixins import ITS_NOW
+from scaleos.shared import clock
 
 logger = logging.getLogger("scaleos")
 
@@ -14,6 +14,6 @@ def disable(request, user_notification_settings_public_key):
     notification_settings = UserNotificationSettings.objects.get(
         public_key=user_notification_settings_public_key,
     )
-    notification_settings.disabled_all_notifications_on = ITS_NOW
+    notification_settings.disabled_all_notifications_on = clock.now()
     notification_settings.save()
     return HttpResponse("OK")
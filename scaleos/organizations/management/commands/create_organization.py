@@ -19,7 +19,7 @@ from scaleos.hr import models as hr_models
 from scaleos.organizations import models as organization_models
 from scaleos.payments import models as payment_models
 from scaleos.reservations import models as reservation_models
-from scaleos.shared.mixins import ITS_NOW
+from scaleos.shared import clock
 from scaleos.timetables.functions import get_date_of_next
 from scaleos.users import models as user_models
 from scaleos.websites import models as website_models
@@ -1145,7 +1145,7 @@ Maak van jouw viering een herinnering om te koesteren."""  # noqa: E501, RUF001
             slug="home",
         )
         if created:
-            home_page.publish_from = ITS_NOW
+            home_page.publish_from = clock.now()
             home_page.ordering = 1
         home_page.banner_title = "Waerboom"
         home_page.banner_slogan = (
@@ -1167,7 +1167,7 @@ Maak van jouw viering een herinnering om te koesteren."""  # noqa: E501, RUF001
         concepts_page.website_id = wb_website.pk
 
         if concepts_page_created:
-            concepts_page.publish_from = ITS_NOW
+            concepts_page.publish_from = clock.now()
             concepts_page.ordering = 2
 
         concepts_page.banner_title = "Concepten"
@@ -1189,7 +1189,7 @@ Maak van jouw viering een herinnering om te koesteren."""  # noqa: E501, RUF001
             )
         )
         if concept_intro_block_created:
-            concept_intro_block.publish_from = ITS_NOW
+            concept_intro_block.publish_from = clock.now()
         concept_intro_block.website_id = wb_website.pk
         concept_intro_block.background_color = "#FF9C35FF"
         concept_intro_block.rotate = -2
@@ -1223,7 +1223,7 @@ Met onze jarenlange ervaring en persoonlijke aanpak maken we van elk moment een
             )
         )
         if events_block_created:
-            concepts_block.publish_from = ITS_NOW
+            concepts_block.publish_from = clock.now()
 
         concepts_block.website_id = wb_website.pk
         concepts_block.save()
@@ -1243,7 +1243,7 @@ Met onze jarenlange ervaring en persoonlijke aanpak maken we van elk moment een
 
         if events_page_created:
             events_page.ordering = 3
-            events_page.publish_from = ITS_NOW
+            events_page.publish_from = clock.now()
 
         events_page.banner_title = "Onze Evenementen"
         events_page.banner_slogan = (
@@ -1261,7 +1261,7 @@ Met onze jarenlange ervaring en persoonlijke aanpak maken we van elk moment een
             )
         )
         if events_block_created:
-            events_block.publish_from = ITS_NOW
+            events_block.publish_from = clock.now()
             events_block.save()
 
         website_models.PageBlock.objects.get_or_create(
@@ -1378,7 +1378,7 @@ Met onze jarenlange ervaring en persoonlijke aanpak maken we van elk moment een
 <b>Ontdek wat er mogelijk is – welkom bij de Waerboom.</b>
 """  # noqa: E501, RUF001
         waerboom.slug = "waerboom"
-        waerboom.published_on = ITS_NOW
+        waerboom.published_on = clock.now()
         waerboom.save()
 
         upload_files(waerboom, organization_file_dir="waerboom")
@@ -1459,7 +1459,7 @@ Met onze jarenlange ervaring en persoonlijke aanpak maken we van elk moment een
 
         lane_c.name = "Lane Consulting"
         lane_c.slug = "lane-c"
-        lane_c.published_on = ITS_NOW
+        lane_c.published_on = clock.now()
         lane_c.save()
 
         self.create_styling(
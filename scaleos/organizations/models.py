@@ -12,10 +12,10 @@ from modeltranslation.translator import translator
 from polymorphic.models import PolymorphicModel
 
 from scaleos.hr.models import Person
+from scaleos.shared import clock
 from scaleos.shared.fields import LogInfoFields
 from scaleos.shared.fields import NameField
 from scaleos.shared.fields import PublicKeyField
-from scaleos.shared.mixins import ITS_NOW
 from scaleos.shared.mixins import AdminLinkMixin
 from scaleos.shared.models import CardModel
 
@@ -139,7 +139,7 @@ class Organization(
         from scaleos.events.models import SingleEvent
 
         return SingleEvent.objects.filter(
-            starting_at__gte=ITS_NOW,
+            starting_at__gte=clock.now(),
             concept__organizer_id=self.pk,
         )
 
@@ -30,6 +30,16 @@ class PaymentProposalInlineAdmin(
     show_change_link = True
 
 
+class PaymentRequestBalanceInlineAdmin(admin.TabularInline):
+    model = payment_models.PaymentRequestBalance
+    extra = 0
+    can_delete = False
+    readonly_fields = ["currency", "to_pay", "paid", "remaining", "modified_on"]
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 class PaymentInlineAdmin(
     StackedPolymorphicInline,
     LogInfoInlineAdminMixin,
@@ -54,10 +64,18 @@ class PaymentInlineAdmin(
         model = payment_models.EPCMoneyTransferPayment
         show_change_link = True
 
+    class MolliePaymentInlineAdmin(
+        StackedPolymorphicInline.Child,
+        LogInfoInlineAdminMixin,
+    ):
+        model = payment_models.MolliePayment
+        show_change_link = True
+
     model = payment_models.Payment
     child_inlines = (
         PaymentInlineAdmin,
         EPCMoneyTransferPaymentInlineAdmin,
+        MolliePaymentInlineAdmin,
     )
 
 class PaymentMethodInlineAdmin(
@@ -200,6 +218,7 @@ class PaymentAdmin(PolymorphicParentModelAdmin, LogInfoAdminMixin):
     child_models = [
         payment_models.Payment,  # Delete once a submodel has been added.
         payment_models.EPCMoneyTransferPayment,
+        payment_models.MolliePayment,
     ]
     list_filter = [PolymorphicChildModelFilter]
 
@@ -213,12 +232,34 @@ class EPCMoneyTransferPaymentAdmin(
     # define custom features here
 
 
+@admin.register(payment_models.MolliePayment)
+class MolliePaymentAdmin(
+    PolymorphicChildModelAdmin,
+    LogInfoAdminMixin,
+):
+    base_model = payment_models.MolliePayment  # Explicitly set here!
+    list_display = ["mollie_id", "status", "amount", "paid_on"]
+    list_filter = ["status"]
+    search_fields = ["mollie_id"]
+    readonly_fields = [
+        *LogInfoAdminMixin.readonly_fields,
+        "mollie_id",
+        "status",
+        "status_changed_on",
+        "checkout_url",
+    ]
+
+
 @admin.register(payment_models.PaymentRequest)
 class PaymentRequestAdmin(
     PolymorphicInlineSupportMixin,
     LogInfoAdminMixin,
 ):
-    inlines = [PaymentProposalInlineAdmin, PaymentInlineAdmin]
+    inlines = [
+        PaymentRequestBalanceInlineAdmin,
+        PaymentProposalInlineAdmin,
+        PaymentInlineAdmin,
+    ]
     readonly_fields = [
         "to_pay",
         "already_paid",
@@ -240,6 +281,9 @@ class PaymentRequestAdmin(
     ]
     list_filter = ["to_organization", "to_person"]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related("balances")
+
 
 @admin.register(payment_models.PriceMatrixItem)
 class PriceMatrixItemAdmin(admin.ModelAdmin):
@@ -7,4 +7,6 @@ class PaymentsConfig(AppConfig):
 
     def ready(self):
         # Ensure signals get loaded after the app is ready
-        import scaleos.payments.signals  # noqa: F401
+        import scaleos.payments.signals as s
+
+        s.register_signals_for_all_payment_subclasses()
@@ -0,0 +1,351 @@
+"""
+Evaluate the payment conditions of event reservation payment settings.
+
+The conditions of a settings object are compiled once into a
+PaymentConditionPlan, cached per settings, modification time and language.
+A ReservationSnapshot holds everything the conditions need to know about one
+event reservation, so evaluating a plan never touches the database.
+"""
+
+import logging
+
+from dateutil.relativedelta import relativedelta
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.utils import translation
+from moneyed import Money
+
+from scaleos.shared import clock
+
+logger = logging.getLogger(__name__)
+
+PLAN_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+class ReservationSnapshot:
+    """The figures of an event reservation that the conditions depend on"""
+
+    __slots__ = (
+        "already_paid",
+        "event_ending_on",
+        "event_starting_at",
+        "has_event",
+        "has_payment_request",
+        "to_pay",
+        "total_amount",
+        "total_price_value",
+    )
+
+    def __init__(  # noqa: PLR0913
+        self,
+        *,
+        has_event=True,
+        event_starting_at=None,
+        event_ending_on=None,
+        total_amount=None,
+        total_price_value=None,
+        has_payment_request=False,
+        to_pay=None,
+        already_paid=None,
+    ):
+        self.has_event = has_event
+        self.event_starting_at = event_starting_at
+        self.event_ending_on = event_ending_on
+        self.total_amount = total_amount
+        self.total_price_value = total_price_value
+        self.has_payment_request = has_payment_request
+        self.to_pay = to_pay
+        self.already_paid = already_paid
+
+    @classmethod
+    def from_event_reservation(
+        cls,
+        event_reservation,
+        *,
+        total_price_value=None,
+        plan=None,
+    ):
+        """
+        Read the figures once. With a plan, only the figures its conditions
+        need are read.
+        """
+        event = getattr(event_reservation, "event", None)
+        if event is None:
+            return cls(has_event=False)
+
+        snapshot = cls(
+            event_starting_at=event.starting_at,
+            event_ending_on=event.ending_on,
+        )
+        if plan is None or plan.needs_total_amount:
+            snapshot.total_amount = event_reservation.total_amount
+        if plan is None or plan.needs_total_price:
+            if total_price_value is None:
+                total_price_value = event_reservation.get_total_price_value()
+            snapshot.total_price_value = total_price_value
+        if plan is None or plan.needs_payment_request:
+            payment_request = event_reservation.payment_request
+            snapshot.has_payment_request = payment_request is not None
+            if payment_request is not None and payment_request.to_pay is not None:
+                snapshot.to_pay = payment_request.to_pay.vat_included
+                snapshot.already_paid = payment_request.already_paid
+        return snapshot
+
+
+class ConditionProposal:
+    """The due date and the price one condition asks for"""
+
+    __slots__ = ("condition_id", "content_type_id", "due_datetime", "price")
+
+    def __init__(self, condition_id, content_type_id, due_datetime, price):
+        self.condition_id = condition_id
+        self.content_type_id = content_type_id
+        self.due_datetime = due_datetime
+        self.price = price
+
+    def to_price(self):
+        """a new, unsaved Price, also when the condition asks for an amount"""
+        if isinstance(self.price, Money):
+            from scaleos.payments.models import Price
+
+            return Price(vat_included=self.price)
+        return self.price.to_price()
+
+
+class CompiledCondition:
+    """An EventReservationPaymentCondition without the ORM"""
+
+    __slots__ = (
+        "condition_id",
+        "content_type_id",
+        "fixed_price",
+        "interval",
+        "only_when_group_exceeds",
+        "payment_moment",
+        "percentage",
+        "prepayment_type",
+        "text",
+        "time_amount",
+    )
+
+    def __init__(self, condition):
+        current_price = condition.current_price
+        self.condition_id = condition.pk
+        self.content_type_id = ContentType.objects.get_for_model(condition).pk
+        self.text = str(condition)
+        self.payment_moment = condition.payment_moment
+        self.prepayment_type = condition.prepayment_type
+        self.interval = condition.to_be_paid_interval
+        self.time_amount = condition.to_be_paid_time_amount
+        self.only_when_group_exceeds = condition.only_when_group_exceeds
+        self.percentage = condition.percentage_of_total_price
+        self.fixed_price = current_price.value if current_price else None
+
+    @property
+    def moment(self):
+        from scaleos.payments.models import EventReservationPaymentCondition
+
+        return EventReservationPaymentCondition.PaymentMoment
+
+    @property
+    def prepayment(self):
+        from scaleos.payments.models import EventReservationPaymentCondition
+
+        return EventReservationPaymentCondition.PrepaymentType
+
+    def due_date(self, snapshot):
+        if not snapshot.has_event:
+            return None
+
+        match self.payment_moment:
+            case self.moment.AT_START_OF_EVENT:
+                return snapshot.event_starting_at
+            case self.moment.AT_END_OF_EVENT:
+                return snapshot.event_ending_on
+            case self.moment.BEFORE_START_OF_EVENT:
+                the_date, before_the_event = snapshot.event_starting_at, True
+            case self.moment.AFTER_START_OF_EVENT:
+                the_date, before_the_event = snapshot.event_starting_at, False
+            case self.moment.BEFORE_END_OF_EVENT:
+                the_date, before_the_event = snapshot.event_ending_on, True
+            case self.moment.AFTER_END_OF_EVENT:
+                the_date, before_the_event = snapshot.event_ending_on, False
+            case _:
+                the_date, before_the_event = clock.now(), True
+
+        if the_date is None:
+            logger.info("The date is NONE, so we cannot calculate the due date.")
+            return None
+
+        interval = relativedelta(**{self.interval: self.time_amount})
+        if before_the_event:
+            return the_date - interval
+        return the_date + interval
+
+    def applicable(self, snapshot):
+        if not self.only_when_group_exceeds:
+            return True
+
+        if not snapshot.total_amount:
+            logger.info("The total amount of the reservation is 0 or None")
+            return False
+        return snapshot.total_amount >= self.only_when_group_exceeds
+
+    def price(self, snapshot):  # noqa: PLR0911
+        """a PriceValue, the remaining Money, or None when not applicable"""
+        if not snapshot.has_event or not self.applicable(snapshot):
+            return None
+
+        match self.prepayment_type:
+            case self.prepayment.FULL_PRICE:
+                return snapshot.total_price_value
+            case self.prepayment.FIXED_PRICE:
+                return self.fixed_price
+            case self.prepayment.FIXED_PRICE_PER_PERSON:
+                if self.fixed_price is None:
+                    return None
+                return self.fixed_price.multiply(snapshot.total_amount)
+            case self.prepayment.PERCENTAGE_OF_TOTAL_PRICE:
+                if self.percentage is None:
+                    return None
+                return snapshot.total_price_value.percentage(self.percentage)
+            case self.prepayment.REMAINING_PRICE:
+                return self.remaining_price(snapshot)
+        return None
+
+    def remaining_price(self, snapshot):
+        if not snapshot.has_payment_request or snapshot.to_pay is None:
+            logger.info("we cannot calculate the remaining price")
+            return None
+
+        if snapshot.already_paid is None:
+            logger.info("Nothing is paid yet, returning the total price")
+            return snapshot.total_price_value
+
+        already_paid = snapshot.already_paid[snapshot.to_pay.currency.code]
+        if already_paid >= snapshot.to_pay:
+            logger.info("There is already more paid than needed")
+            return Money(0, snapshot.to_pay.currency.code)
+        return snapshot.to_pay - already_paid
+
+
+class PaymentConditionPlan:
+    """The compiled conditions of one payment settings object"""
+
+    __slots__ = ("conditions",)
+
+    def __init__(self, conditions):
+        self.conditions = tuple(conditions)
+
+    @classmethod
+    def from_conditions(cls, conditions):
+        return cls(CompiledCondition(condition) for condition in conditions)
+
+    @classmethod
+    def compile(cls, payment_settings):
+        return cls.from_conditions(
+            payment_settings.conditions.prefetch_related("price"),
+        )
+
+    def get(self, condition_id):
+        """the compiled condition with this id, None when it is not in the plan"""
+        for condition in self.conditions:
+            if condition.condition_id == condition_id:
+                return condition
+        return None
+
+    def _uses(self, *prepayment_types):
+        return any(
+            condition.prepayment_type in prepayment_types
+            for condition in self.conditions
+        )
+
+    @property
+    def needs_total_amount(self):
+        from scaleos.payments.models import EventReservationPaymentCondition
+
+        return self._uses(
+            EventReservationPaymentCondition.PrepaymentType.FIXED_PRICE_PER_PERSON,
+        ) or any(condition.only_when_group_exceeds for condition in self.conditions)
+
+    @property
+    def needs_total_price(self):
+        from scaleos.payments.models import EventReservationPaymentCondition
+
+        return self._uses(
+            EventReservationPaymentCondition.PrepaymentType.FULL_PRICE,
+            EventReservationPaymentCondition.PrepaymentType.PERCENTAGE_OF_TOTAL_PRICE,
+            EventReservationPaymentCondition.PrepaymentType.REMAINING_PRICE,
+        )
+
+    @property
+    def needs_payment_request(self):
+        from scaleos.payments.models import EventReservationPaymentCondition
+
+        return self._uses(
+            EventReservationPaymentCondition.PrepaymentType.REMAINING_PRICE,
+        )
+
+    def snapshot(self, event_reservation, total_price_value=None):
+        return ReservationSnapshot.from_event_reservation(
+            event_reservation,
+            total_price_value=total_price_value,
+            plan=self,
+        )
+
+    def evaluate(self, snapshot):
+        """the proposals of all the applicable conditions, in one pass"""
+        proposals = []
+        for condition in self.conditions:
+            price = condition.price(snapshot)
+            if price is None:
+                logger.info("The condition is not applicable.")
+                continue
+            proposals.append(
+                ConditionProposal(
+                    condition.condition_id,
+                    condition.content_type_id,
+                    condition.due_date(snapshot),
+                    price,
+                ),
+            )
+        return proposals
+
+    def conditions_text(self, snapshot):
+        """the description of every condition with a due date, by due date"""
+        conditions = {}
+        for condition in self.conditions:
+            due_date = condition.due_date(snapshot)
+            if due_date is not None:
+                conditions[due_date] = condition.text
+        return dict(sorted(conditions.items()))
+
+
+def get_payment_condition_plan(payment_settings):
+    """the compiled plan of the settings, from the cache when possible"""
+    modified_on = payment_settings.modified_on
+    cache_key = ":".join(
+        [
+            "payment_condition_plan",
+            str(payment_settings.pk),
+            str(modified_on.timestamp() if modified_on else 0),
+            translation.get_language() or "",
+        ],
+    )
+    plan = cache.get(cache_key)
+    if plan is None:
+        logger.debug("Compiling the payment conditions of %s", payment_settings.pk)
+        plan = PaymentConditionPlan.compile(payment_settings)
+        cache.set(cache_key, plan, PLAN_CACHE_TIMEOUT)
+    return plan
+
+
+def touch_payment_settings(payment_settings_ids):
+    """a new modification time, so the cached plans are compiled again"""
+    from scaleos.payments.models import PaymentSettings
+
+    payment_settings_ids = {pk for pk in payment_settings_ids if pk is not None}
+    if payment_settings_ids:
+        PaymentSettings.objects.filter(pk__in=payment_settings_ids).update(
+            modified_on=clock.now(),
+        )
@@ -32,6 +32,46 @@ class ReferenceGenerator:
             return f"+++{formatted}+++"
         return formatted
 
+    @staticmethod
+    def generate_structured_references(base_numbers, *, decorated=False):
+        """
+        Generate the Belgian structured references of many integer base
+        numbers at once, e.g. for bulk imports.
+        """
+        max_base_number = 10_000_000_000
+        references = []
+        for base_number in base_numbers:
+            if not 0 <= base_number < max_base_number:
+                msg = _("base number must be max 10 digits.")
+                raise ValueError(msg)
+
+            digits = f"{base_number:010}{97 - base_number % 97:02}"
+            references.append(f"{digits[:3]}/{digits[3:7]}/{digits[7:]}")
+
+        if decorated:
+            return [f"+++{reference}+++" for reference in references]
+        return references
+
+    @staticmethod
+    def invalid_structured_references(references):
+        """
+        Validate many Belgian structured references at once, returns the
+        references that are invalid instead of raising for the first one.
+        """
+        exact_length = 12
+        invalid = []
+        for reference in references:
+            clean_reference = "".join(filter(str.isdigit, reference))
+            if len(clean_reference) != exact_length:
+                invalid.append(reference)
+                continue
+
+            checksum = 97 - (int(clean_reference[:-2]) % 97)
+            if int(clean_reference[-2:]) != checksum:
+                invalid.append(reference)
+
+        return invalid
+
     @staticmethod
     def validate_structured_reference(reference):
         """
@@ -65,6 +105,17 @@ class ReferenceGenerator:
         """
         return "".join(filter(str.isalnum, reference))
 
+    @staticmethod
+    def generate_iso11649_references(base_numbers):
+        """
+        Generate the ISO 11649 creditor references of many integer base
+        numbers at once. "RF00" translates to the digits 271500.
+        """
+        return [
+            f"RF{98 - int(f'{base_number}271500') % 97:02}{base_number}"
+            for base_number in base_numbers
+        ]
+
     @staticmethod
     def generate_iso11649_reference(base_number):
         """
@@ -0,0 +1,30 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from scaleos.payments.mollie_stub import MollieStubServer
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Run a local stand-in for the Mollie API to test the payments offline"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+
+    def handle(self, *args, **options):
+        server = MollieStubServer(options["host"], options["port"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Mollie stub server on {server.url}, "
+                f"set MOLLIE_API_ENDPOINT={server.url}",
+            ),
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.httpd.server_close()
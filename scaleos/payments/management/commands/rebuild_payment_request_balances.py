@@ -0,0 +1,77 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from scaleos.payments.models import PaymentRequest
+from scaleos.payments.models import PaymentRequestBalance
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = "Rebuild the balances of the payment requests from scratch"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="only report the balances that drifted, without rebuilding them",
+        )
+
+    def handle(self, *args, **options):
+        check_only = options.get("check")
+        payment_request_ids = list(
+            PaymentRequest.objects.order_by("pk").values_list("pk", flat=True),
+        )
+
+        drifted = 0
+        for start in range(0, len(payment_request_ids), CHUNK_SIZE):
+            chunk = payment_request_ids[start : start + CHUNK_SIZE]
+            drifted += self.report_drift(chunk)
+            if not check_only:
+                PaymentRequestBalance.refresh_for_payment_requests(chunk)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{len(payment_request_ids)} payment requests checked, "
+                f"{drifted} drifted",
+            ),
+        )
+
+    def report_drift(self, payment_request_ids):
+        totals = PaymentRequestBalance.calculate(payment_request_ids)
+        stored = {
+            (balance.payment_request_id, balance.currency): balance
+            for balance in PaymentRequestBalance.objects.filter(
+                payment_request_id__in=payment_request_ids,
+            )
+        }
+        expected = {
+            (payment_request_id, currency): amounts
+            for payment_request_id, currencies in totals.items()
+            for currency, amounts in currencies.items()
+        }
+
+        drifted = 0
+        for key in sorted(set(stored) | set(expected)):
+            balance = stored.get(key)
+            amounts = expected.get(key)
+            if balance is None or amounts is None:
+                drifted_fields = ["missing balance" if balance is None else "currency"]
+            else:
+                drifted_fields = [
+                    field_name
+                    for field_name in PaymentRequestBalance.AMOUNT_FIELDS
+                    if getattr(balance, field_name) != amounts[field_name]
+                ]
+            if drifted_fields:
+                drifted += 1
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"Payment request {key[0]} ({key[1]}) drifted: "
+                        f"{', '.join(drifted_fields)}",
+                    ),
+                )
+        return drifted
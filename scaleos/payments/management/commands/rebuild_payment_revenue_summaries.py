@@ -0,0 +1,49 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db.models.functions import TruncDate
+
+from scaleos.payments.models import Payment
+from scaleos.payments.models import PaymentRevenueSummary
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = "Rebuild the payment revenue summaries from scratch"
+
+    def handle(self, *args, **options):
+        if not PaymentRevenueSummary.enabled():
+            self.stdout.write(
+                self.style.WARNING(
+                    "PAYMENTS_REVENUE_SUMMARY is off, the summaries will not be "
+                    "kept up to date after this rebuild",
+                ),
+            )
+
+        organization_days = set(
+            Payment.objects.paid()
+            .annotate(day=TruncDate("paid_on"))
+            .order_by()
+            .values_list("payment_request__to_organization_id", "day")
+            .distinct(),
+        )
+        organization_days |= set(
+            PaymentRevenueSummary.objects.values_list("organization_id", "day"),
+        )
+
+        organization_days = sorted(
+            (organization_id, day)
+            for organization_id, day in organization_days
+            if organization_id is not None
+        )
+        for start in range(0, len(organization_days), CHUNK_SIZE):
+            PaymentRevenueSummary.refresh(organization_days[start : start + CHUNK_SIZE])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{len(organization_days)} organization days summarized",
+            ),
+        )
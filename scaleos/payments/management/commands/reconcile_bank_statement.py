@@ -0,0 +1,47 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from scaleos.payments.statements import iter_statement_lines
+from scaleos.payments.statements import reconcile_statement
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Match the lines of CAMT.053 or CODA bank statements with payment requests"
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="the statement files on disk")
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="only report the matches, without creating the payments",
+        )
+
+    def handle(self, *args, **options):
+        for path in options["paths"]:
+            report = reconcile_statement(
+                iter_statement_lines(path),
+                dry_run=options.get("dry_run"),
+            )
+            self.stdout.write(self.style.SUCCESS(f"{path}: {report}"))
+
+            for title, count, lines in (
+                ("ambiguous", report.ambiguous, report.ambiguous_lines),
+                ("unmatched", report.unmatched, report.unmatched_lines),
+            ):
+                for line in lines:
+                    self.stdout.write(
+                        self.style.WARNING(
+                            f"{title}: {line.booked_on} {line.money} "
+                            f"{line.counterparty_name} "
+                            f"{line.structured_reference or line.communication}",
+                        ),
+                    )
+                if count > len(lines):
+                    self.stdout.write(
+                        self.style.WARNING(
+                            f"{title}: {count - len(lines)} more lines",
+                        ),
+                    )
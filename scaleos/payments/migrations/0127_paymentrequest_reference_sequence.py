@@ -0,0 +1,24 @@
+# Generated by Django 5.0.12 on 2026-10-18 13:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0126_alter_epcmoneytransferpaymentmethod_options'),
+    ]
+
+    operations = [
+        # The references used to be derived from the primary key, so the
+        # sequence starts after the highest primary key to stay unique.
+        migrations.RunSQL(
+            sql=[
+                "CREATE SEQUENCE payments_paymentrequest_reference_seq",
+                "SELECT setval('payments_paymentrequest_reference_seq', "
+                "COALESCE((SELECT MAX(id) FROM payments_paymentrequest), 0) + 1, "
+                "false)",
+            ],
+            reverse_sql="DROP SEQUENCE payments_paymentrequest_reference_seq",
+        ),
+    ]
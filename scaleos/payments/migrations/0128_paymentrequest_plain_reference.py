@@ -0,0 +1,44 @@
+# Generated by Django 5.0.12 on 2026-10-18 12:49
+
+from django.db import migrations, models
+
+
+def store_plain_references(apps, schema_editor):
+    PaymentRequest = apps.get_model("payments", "PaymentRequest")
+
+    payment_requests = list(
+        PaymentRequest.objects.exclude(structured_reference_be="").only(
+            "pk",
+            "structured_reference_be",
+        ),
+    )
+    for payment_request in payment_requests:
+        payment_request.plain_reference = "".join(
+            filter(str.isalnum, payment_request.structured_reference_be),
+        )
+    PaymentRequest.objects.bulk_update(
+        payment_requests,
+        ["plain_reference"],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0127_paymentrequest_reference_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='epcmoneytransferpayment',
+            name='bank_reference',
+            field=models.CharField(blank=True, db_index=True, help_text='the reference of the bank statement line', max_length=100, verbose_name='bank reference'),
+        ),
+        migrations.AddField(
+            model_name='paymentrequest',
+            name='plain_reference',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='the digits of the structured reference, to match bank lines', max_length=12, verbose_name='plain reference'),
+        ),
+        migrations.RunPython(store_plain_references, migrations.RunPython.noop),
+    ]
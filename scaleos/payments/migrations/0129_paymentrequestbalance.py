@@ -0,0 +1,99 @@
+# Generated by Django 5.0.12 on 2026-10-18 12:52
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_payment_request_balances(apps, schema_editor):
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    Price = apps.get_model("payments", "Price")
+    Payment = apps.get_model("payments", "Payment")
+    PaymentRequest = apps.get_model("payments", "PaymentRequest")
+    PaymentRequestBalance = apps.get_model("payments", "PaymentRequestBalance")
+
+    totals = {}
+    content_type = ContentType.objects.filter(
+        app_label="payments",
+        model="paymentrequest",
+    ).first()
+    if content_type is not None:
+        for payment_request_id, vat_included, currency in Price.objects.filter(
+            unique_origin_content_type=content_type,
+            unique_origin_object_id__in=PaymentRequest.objects.values("pk"),
+            vat_included__isnull=False,
+        ).values_list(
+            "unique_origin_object_id",
+            "vat_included",
+            "vat_included_currency",
+        ):
+            amounts = totals.setdefault((payment_request_id, currency), [0, 0])
+            amounts[0] += vat_included
+
+    for row in (
+        Payment.objects.filter(
+            payment_request__isnull=False,
+            paid_amount__isnull=False,
+        )
+        .values("payment_request_id", "paid_amount_currency")
+        .annotate(paid=Sum("paid_amount"))
+        .order_by()
+    ):
+        amounts = totals.setdefault(
+            (row["payment_request_id"], row["paid_amount_currency"]),
+            [0, 0],
+        )
+        amounts[1] += row["paid"]
+
+    PaymentRequestBalance.objects.bulk_create(
+        [
+            PaymentRequestBalance(
+                payment_request_id=payment_request_id,
+                currency=currency,
+                to_pay=to_pay,
+                paid=paid,
+                remaining=to_pay - paid,
+            )
+            for (payment_request_id, currency), (to_pay, paid) in totals.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('payments', '0128_paymentrequest_plain_reference'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paymentproposal',
+            name='due_datetime',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='due date & time'),
+        ),
+        migrations.CreateModel(
+            name='PaymentRequestBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=3, verbose_name='currency')),
+                ('to_pay', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=15, verbose_name='to pay')),
+                ('paid', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=15, verbose_name='paid')),
+                ('remaining', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=15, verbose_name='remaining')),
+                ('modified_on', models.DateTimeField(auto_now=True, verbose_name='modified on')),
+                ('payment_request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='payments.paymentrequest', verbose_name='payment request')),
+            ],
+            options={
+                'verbose_name': 'payment request balance',
+                'verbose_name_plural': 'payment request balances',
+                'indexes': [models.Index(condition=models.Q(('remaining__gt', 0)), fields=['payment_request', 'currency'], name='payment_balance_outstanding')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='paymentrequestbalance',
+            constraint=models.UniqueConstraint(fields=('payment_request', 'currency'), name='unique_payment_request_balance_currency'),
+        ),
+        migrations.RunPython(fill_payment_request_balances, migrations.RunPython.noop),
+    ]
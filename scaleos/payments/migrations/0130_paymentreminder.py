@@ -0,0 +1,52 @@
+# Generated by Django 5.0.12 on 2026-10-18 12:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('notifications', '0057_alter_notification_notification_type'),
+        ('payments', '0129_paymentrequestbalance'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reminded_on', models.DateField(verbose_name='reminded on')),
+            ],
+            options={
+                'verbose_name': 'payment reminder',
+                'verbose_name_plural': 'payment reminders',
+            },
+        ),
+        migrations.AlterField(
+            model_name='paymentproposal',
+            name='due_datetime',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='due date & time'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentproposal',
+            index=models.Index(fields=['due_datetime', 'id'], name='payment_proposal_due'),
+        ),
+        migrations.AddField(
+            model_name='paymentreminder',
+            name='notification',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payment_reminders', to='notifications.usernotification', verbose_name='notification'),
+        ),
+        migrations.AddField(
+            model_name='paymentreminder',
+            name='payment_proposal',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='payments.paymentproposal', verbose_name='payment proposal'),
+        ),
+        migrations.AddConstraint(
+            model_name='paymentreminder',
+            constraint=models.UniqueConstraint(fields=('payment_proposal', 'reminded_on'), name='unique_payment_reminder_per_day'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.12 on 2026-10-18 13:00
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('organizations', '0055_remove_organization_primary_website_and_more'),
+        ('payments', '0130_paymentreminder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentRevenueSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='day')),
+                ('currency', models.CharField(max_length=3, verbose_name='currency')),
+                ('received', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=15, verbose_name='received')),
+                ('refunded', models.DecimalField(decimal_places=2, default=Decimal('0'), help_text='the sum of the negative payments, as a positive amount', max_digits=15, verbose_name='refunded')),
+                ('payments', models.PositiveIntegerField(default=0, verbose_name='payments')),
+                ('modified_on', models.DateTimeField(auto_now=True, verbose_name='modified on')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payment_revenue_summaries', to='organizations.organization', verbose_name='organization')),
+                ('payment_method', models.ForeignKey(help_text='the kind of payment', on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype', verbose_name='payment method')),
+            ],
+            options={
+                'verbose_name': 'payment revenue summary',
+                'verbose_name_plural': 'payment revenue summaries',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='paymentrevenuesummary',
+            constraint=models.UniqueConstraint(fields=('organization', 'day', 'currency', 'payment_method'), name='unique_payment_revenue_summary'),
+        ),
+    ]
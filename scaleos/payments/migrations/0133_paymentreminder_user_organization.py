@@ -0,0 +1,32 @@
+# Generated by Django 5.0.12 on 2026-10-18 13:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0063_notification_dispatched_on'),
+        ('organizations', '0055_remove_organization_primary_website_and_more'),
+        ('payments', '0132_molliepayment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentreminder',
+            name='organization',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='payment_reminders', to='organizations.organization', verbose_name='organization'),
+        ),
+        migrations.AddField(
+            model_name='paymentreminder',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='payment_reminders', to=settings.AUTH_USER_MODEL, verbose_name='user'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentreminder',
+            index=models.Index(fields=['reminded_on', 'user', 'organization', 'id'], name='payment_reminder_group'),
+        ),
+    ]
@@ -1,15 +1,21 @@
 import logging
+import uuid
+from decimal import Decimal
 
 from admin_ordering.models import OrderableModel
-from dateutil.relativedelta import relativedelta
+from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.fields import GenericRelation
 from django.contrib.contenttypes.models import ContentType
+from django.db import connection
 from django.db import models
+from django.db import transaction
+from django.db.models import Q
 from django.db.models import Sum
 from django.db.models import Value
 from django.db.models.functions import Coalesce
 from django.forms import ValidationError
+from django.utils import timezone
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 from djmoney.models.fields import MoneyField
@@ -20,12 +26,16 @@ from moneyed import Money
 from polymorphic.models import PolymorphicModel
 
 from scaleos.payments.functions import ReferenceGenerator
+from scaleos.payments.querysets import PaymentManager
+from scaleos.payments.querysets import PaymentRequestBalanceManager
+from scaleos.payments.querysets import PaymentRequestManager
+from scaleos.payments.values import PriceValue
+from scaleos.shared import clock
 from scaleos.shared.fields import EncryptedTextField
 from scaleos.shared.fields import LogInfoFields
 from scaleos.shared.fields import NameField
 from scaleos.shared.fields import OriginFields
 from scaleos.shared.fields import PublicKeyField
-from scaleos.shared.mixins import ITS_NOW
 from scaleos.shared.mixins import AdminLinkMixin
 from scaleos.shared.validators import validate_percentage
 
@@ -91,43 +101,113 @@ class Price(PriceModel):
         verbose_name_plural = _("prices")
         ordering = ["-created_on"]
 
-    def create_history_record(self):
-        item = PriceHistory.objects.create(
-            created_by=self.created_by,
+    PRICE_FIELDS = ("vat", "vat_included", "vat_excluded")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if not set(cls.PRICE_FIELDS) & instance.get_deferred_fields():
+            instance._loaded_price_state = instance.price_state  # noqa: SLF001
+        return instance
+
+    @property
+    def price_state(self):
+        return tuple(getattr(self, field_name) for field_name in self.PRICE_FIELDS)
+
+    def price_changed(self, update_fields=None) -> bool:
+        """compare the price with the state it was loaded with from the db"""
+        if update_fields is not None and not set(self.PRICE_FIELDS) & set(
+            update_fields,
+        ):
+            return False
+
+        loaded_price_state = getattr(self, "_loaded_price_state", None)
+        if loaded_price_state is None:
+            logger.debug("a new price or not loaded from the db")
+            return True
+
+        return loaded_price_state != self.price_state
+
+    def build_history_record(self):
+        return PriceHistory(
+            created_by_id=self.created_by_id,
             vat=self.vat,
             vat_included=self.vat_included,
             vat_excluded=self.vat_excluded,
             price_id=self.id,
             modified_by_id=self.modified_by_id,
+            public_key=uuid.uuid4(),
         )
 
+    def set_value(self, value: PriceValue):
+        self.vat_included = value.vat_included
+        self.vat_excluded = value.vat_excluded
+        self.vat = value.vat
+
+    @classmethod
+    def bulk_store(cls, prices, modified_by_id=None):
+        """
+        Save many prices with a fixed number of queries. The new prices are
+        created, the loaded prices are only updated when their amounts
+        changed, and both get a history record.
+        """
+        its_now = clock.now()
+        new_prices = []
+        changed_prices = []
+        for price in prices:
+            if price.pk is None:
+                price.created_by_id = price.created_by_id or modified_by_id
+                if price.public_key is None:
+                    price.public_key = uuid.uuid4()
+                new_prices.append(price)
+            elif price.price_changed():
+                price.modified_by_id = modified_by_id
+                price.modified_on = its_now
+                changed_prices.append(price)
+
+        with transaction.atomic():
+            cls.objects.bulk_create(new_prices)
+            cls.objects.bulk_update(
+                changed_prices,
+                [
+                    "vat_included",
+                    "vat_included_currency",
+                    "vat_excluded",
+                    "vat_excluded_currency",
+                    "vat",
+                    "vat_currency",
+                    "modified_by",
+                    "modified_on",
+                ],
+            )
+            PriceHistory.objects.bulk_create(
+                [price.build_history_record() for price in new_prices + changed_prices],
+            )
+
+        for price in new_prices + changed_prices:
+            price._loaded_price_state = price.price_state  # noqa: SLF001
+
+        return new_prices, changed_prices
+
+    def create_history_record(self):
+        item = self.build_history_record()
+        item.save()
+
         msg = f"new PriceHistory record created with id: {item.pk}"
         logger.debug(msg)
 
     def save(self, *args, **kwargs):
-        create_history_record = False
-
-        if self.pk is None:
-            msg = "no history needs to be created, because it is a new price"
-            logger.debug(msg)
+        price_changed = self.price_changed(kwargs.get("update_fields"))
 
-        if (
-            self.previous_price
-            and self.vat_included != self.previous_price.vat_included
-        ):
-            msg = "The price changed, so make a historization record"
-            logger.debug(msg)
-            create_history_record = True
-
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
-        if self.previous_price is None:
-            msg = "no historical record yet, create one..."
-            logger.debug(msg)
-            create_history_record = True
+            if price_changed:
+                msg = "The price changed, so make a historization record"
+                logger.debug(msg)
+                self.create_history_record()
 
-        if create_history_record:
-            self.create_history_record()
+        self._loaded_price_state = self.price_state
 
     def __str__(self):
         logger.debug("Getting price string")
@@ -163,17 +243,15 @@ class Price(PriceModel):
 
         return None
 
+    @property
+    def value(self) -> PriceValue:
+        return PriceValue.from_price(self)
+
     def multiply(self, amount):
         """As we do not want to change the origingal price in the database,
         we are creating a new price instance and return this"""
         logger.debug("Multiplying %s by %s", self, amount)
-        multiplied_price = Price()
-
-        multiplied_price.vat_included = self.vat_included * amount
-        multiplied_price.vat_excluded = self.vat_excluded * amount
-        multiplied_price.vat = (
-            multiplied_price.vat_included - multiplied_price.vat_excluded
-        )
+        multiplied_price = self.value.multiply(amount).to_price()
         logger.debug("Returning multiplied price: %s", multiplied_price)
         return multiplied_price
 
@@ -207,31 +285,33 @@ class Price(PriceModel):
 
     def get_percentage(self, percentage):
         logger.debug("Getting percentage %s from %s", percentage, self)
-        percentage_price = Price()
-        percentage_price.vat_included = self.vat_included * percentage / 100
-        percentage_price.vat_excluded = self.vat_excluded * percentage / 100
-        percentage_price.vat = (
-            percentage_price.vat_included - percentage_price.vat_excluded
-        )
-
+        percentage_price = self.value.percentage(percentage).to_price()
         logger.debug("Returning percentage price: %s", percentage_price)
         return percentage_price
 
     def recalculate_vat_totals(self):
-        vat_included_total = sum(
-            (line.vat_included for line in self.vat_lines.all() if line.vat_included),
-            start=Money(0, EUR),
+        totals = self.vat_lines.aggregate(
+            vat_included=Coalesce(Sum("vat_included"), Value(Decimal(0))),
+            vat_excluded=Coalesce(Sum("vat_excluded"), Value(Decimal(0))),
         )
-        self.vat_included = vat_included_total
+        self.vat_included = Money(totals["vat_included"], EUR)
+        self.vat_excluded = Money(totals["vat_excluded"], EUR)
+        self.vat = self.vat_included - self.vat_excluded
 
-        vat_excluded_total = sum(
-            (line.vat_excluded for line in self.vat_lines.all() if line.vat_excluded),
-            start=Money(0, EUR),
-        )
-        self.vat_excluded = vat_excluded_total
-        self.vat = vat_included_total - vat_excluded_total
+        if not self.price_changed():
+            logger.debug("The VAT totals did not change")
+            return
 
-        self.save(update_fields=["vat_included", "vat_excluded", "vat"])
+        self.save(
+            update_fields=[
+                "vat_included",
+                "vat_included_currency",
+                "vat_excluded",
+                "vat_excluded_currency",
+                "vat",
+                "vat_currency",
+            ],
+        )
 
 
 class VATPriceLine(PriceModel):
@@ -366,6 +446,55 @@ class PriceMatrix(
 ):
     show_matrix_name_in_item_name = models.BooleanField(default=True)
 
+    def update_prices(self, prices, modified_by=None) -> int:
+        """
+        Re-price the items of this matrix at once, with a fixed number of
+        queries. prices maps the pk of a price matrix item to a PriceValue.
+        Only the prices that change get a history record.
+        """
+        items = dict(
+            PriceMatrixItem.objects.non_polymorphic()
+            .filter(
+                Q(agepricematrixitem__age_price_matrix_id=self.pk)
+                | Q(bulkpricematrixitem__bulk_price_matrix_id=self.pk),
+                pk__in=prices,
+            )
+            .values_list("pk", "polymorphic_ctype_id"),
+        )
+        existing_prices = {
+            (price.unique_origin_content_type_id, price.unique_origin_object_id): price
+            for price in Price.objects.filter(
+                unique_origin_content_type_id__in=set(items.values()),
+                unique_origin_object_id__in=items,
+            )
+        }
+
+        matrix_prices = []
+        for item_id, content_type_id in items.items():
+            value = prices[item_id]
+            price = existing_prices.get((content_type_id, item_id))
+            if price is None:
+                price = value.to_price(
+                    unique_origin_content_type_id=content_type_id,
+                    unique_origin_object_id=item_id,
+                )
+            else:
+                price.set_value(value)
+            matrix_prices.append(price)
+
+        new_prices, changed_prices = Price.bulk_store(
+            matrix_prices,
+            modified_by_id=modified_by.pk if modified_by else None,
+        )
+
+        logger.info(
+            "Price matrix %s: %s prices created, %s prices changed",
+            self.pk,
+            len(new_prices),
+            len(changed_prices),
+        )
+        return len(new_prices) + len(changed_prices)
+
 
 class AgePriceMatrix(PriceMatrix):
     pass
@@ -399,6 +528,24 @@ class PriceMatrixItem(PolymorphicModel, AdminLinkMixin, PublicKeyField, NameFiel
 
         return self.price.first()
 
+    @classmethod
+    def get_current_prices(cls, item_ids):
+        """the current price of each of the items, in two queries"""
+        content_types = dict(
+            cls.objects.non_polymorphic()
+            .filter(pk__in=item_ids)
+            .values_list("pk", "polymorphic_ctype_id"),
+        )
+        return {
+            price.unique_origin_object_id: price
+            for price in Price.objects.filter(
+                unique_origin_content_type_id__in=set(content_types.values()),
+                unique_origin_object_id__in=content_types,
+            )
+            if content_types[price.unique_origin_object_id]
+            == price.unique_origin_content_type_id
+        }
+
 
 class AgePriceMatrixItem(PriceMatrixItem):
     age_price_matrix = models.ForeignKey(
@@ -548,6 +695,16 @@ class PaymentRequest(AdminLinkMixin, LogInfoFields, OriginFields, PublicKeyField
         blank=True,  # Allow blank at first (can generate later)
         editable=False,  # Optional: hide in Django admin forms
     )
+    plain_reference = models.CharField(
+        verbose_name=_("plain reference"),
+        max_length=12,
+        blank=True,
+        db_index=True,
+        editable=False,
+        help_text=_("the digits of the structured reference, to match bank lines"),
+    )
+
+    objects = PaymentRequestManager()
 
     @property
     def to_pay(self) -> Price | None:
@@ -558,12 +715,18 @@ class PaymentRequest(AdminLinkMixin, LogInfoFields, OriginFields, PublicKeyField
 
     @property
     def already_paid(self):
-        if self.to_pay and self.to_pay.vat_included:
-            result = self.get_paid_payments([self.to_pay.vat_included.currency.code])
-            if result:
-                return result
+        balances = self.get_balances()
+        if any(balance.to_pay for balance in balances):
+            return {
+                balance.currency: Money(balance.paid, balance.currency)
+                for balance in balances
+            }
         return None
 
+    def get_balances(self):
+        """the ledger rows, prefetched rows are used when they are present"""
+        return list(self.balances.all())
+
     def get_paid_payments(self, expected_currencies=None):
         grouped = self.payments.values(
             "paid_amount_currency",
@@ -595,7 +758,13 @@ class PaymentRequest(AdminLinkMixin, LogInfoFields, OriginFields, PublicKeyField
 
     @property
     def still_to_pay(self):
-        return self.get_remaining_to_pay()
+        """the remaining amount in the currency of the price, from the ledger"""
+        remaining = {
+            balance.currency: balance.remaining_money
+            for balance in self.get_balances()
+            if balance.to_pay
+        }
+        return remaining or None
 
     def get_remaining_to_pay(self, expected_currencies=None):
         if self.to_pay and self.to_pay.vat_included:
@@ -612,12 +781,9 @@ class PaymentRequest(AdminLinkMixin, LogInfoFields, OriginFields, PublicKeyField
 
     @property
     def fully_paid(self):
-        if self.still_to_pay:
-            if self.to_pay and self.to_pay.vat_included:
-                to_pay = self.still_to_pay[
-                    self.to_pay.vat_included.currency.code
-                ].amount
-                return to_pay <= 0.0
+        still_to_pay = self.still_to_pay
+        if still_to_pay:
+            return all(remaining.amount <= 0 for remaining in still_to_pay.values())
         return None
 
     @property
@@ -632,6 +798,97 @@ class PaymentRequest(AdminLinkMixin, LogInfoFields, OriginFields, PublicKeyField
     def __str__(self):
         return f"Payment Request #{self.pk}"
 
+    REFERENCE_SEQUENCE = "payments_paymentrequest_reference_seq"
+
+    @classmethod
+    def allocate_reference_numbers(cls, count):
+        """
+        Reserve base numbers for the structured references from a database
+        sequence, so the references are known before the insert.
+        """
+        if count <= 0:
+            return []
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(%s) FROM generate_series(1, %s)",
+                [cls.REFERENCE_SEQUENCE, count],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def set_structured_references(self, base_number=None) -> bool:
+        """generate the references that are still missing"""
+        if self.structured_reference_be:
+            ReferenceGenerator.validate_structured_reference(
+                self.structured_reference_be,
+            )
+            if self.structured_reference_sepa:
+                plain_reference = ReferenceGenerator.to_plain(
+                    self.structured_reference_be,
+                )
+                if self.plain_reference == plain_reference:
+                    return False
+                self.plain_reference = plain_reference
+                return True
+
+            base_number = int(
+                ReferenceGenerator.to_plain(self.structured_reference_be)[:10],
+            )
+
+        if base_number is None:
+            base_number = self.allocate_reference_numbers(1)[0]
+
+        if not self.structured_reference_be:
+            self.structured_reference_be = (
+                ReferenceGenerator.generate_structured_reference(
+                    base_number=base_number,
+                    decorated=True,
+                )
+            )
+
+        self.structured_reference_sepa = ReferenceGenerator.generate_iso11649_reference(
+            base_number=base_number,
+        )
+        self.plain_reference = ReferenceGenerator.to_plain(
+            self.structured_reference_be,
+        )
+        return True
+
+    @classmethod
+    def set_structured_references_in_bulk(cls, payment_requests):
+        """give the new payment requests their references with one query"""
+        payment_requests = [
+            payment_request
+            for payment_request in payment_requests
+            if not payment_request.structured_reference_be
+            and not payment_request.structured_reference_sepa
+        ]
+        base_numbers = cls.allocate_reference_numbers(len(payment_requests))
+        for payment_request, structured_reference_be, structured_reference_sepa in zip(
+            payment_requests,
+            ReferenceGenerator.generate_structured_references(
+                base_numbers,
+                decorated=True,
+            ),
+            ReferenceGenerator.generate_iso11649_references(base_numbers),
+            strict=True,
+        ):
+            payment_request.structured_reference_be = structured_reference_be
+            payment_request.structured_reference_sepa = structured_reference_sepa
+            payment_request.plain_reference = ReferenceGenerator.to_plain(
+                structured_reference_be,
+            )
+
+    def save(self, *args, **kwargs):
+        if self.set_structured_references() and kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {
+                *kwargs["update_fields"],
+                "structured_reference_be",
+                "structured_reference_sepa",
+                "plain_reference",
+            }
+        super().save(*args, **kwargs)
+
     def set_price_to_pay(self, price_to_pay: Price):
         logger.debug("setting price to pay")
         ct = ContentType.objects.get_for_model(
@@ -700,6 +957,76 @@ class PaymentProposal(AdminLinkMixin, OriginFields, LogInfoFields):
     class Meta:
         verbose_name = _("payment proposal")
         verbose_name_plural = _("payment proposals")
+        indexes = [
+            models.Index(
+                fields=["due_datetime", "id"],
+                name="payment_proposal_due",
+            ),
+        ]
+
+
+class PaymentReminder(models.Model):  # noqa: DJ008
+    """A payment proposal is reminded at most once a day"""
+
+    payment_proposal = models.ForeignKey(
+        PaymentProposal,
+        verbose_name=_(
+            "payment proposal",
+        ),
+        related_name="reminders",
+        on_delete=models.CASCADE,
+    )
+    reminded_on = models.DateField(
+        verbose_name=_(
+            "reminded on",
+        ),
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name=_(
+            "user",
+        ),
+        related_name="payment_reminders",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+    )
+    organization = models.ForeignKey(
+        "organizations.Organization",
+        verbose_name=_(
+            "organization",
+        ),
+        related_name="payment_reminders",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+    )
+    notification = models.ForeignKey(
+        "notifications.UserNotification",
+        verbose_name=_(
+            "notification",
+        ),
+        related_name="payment_reminders",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = _("payment reminder")
+        verbose_name_plural = _("payment reminders")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["payment_proposal", "reminded_on"],
+                name="unique_payment_reminder_per_day",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["reminded_on", "user", "organization", "id"],
+                name="payment_reminder_group",
+            ),
+        ]
 
 
 class Payment(
@@ -725,9 +1052,481 @@ class Payment(
     )
     paid_on = models.DateTimeField(null=True, blank=True)
 
+    objects = PaymentManager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.set_loaded_state()
+        return instance
+
+    def set_loaded_state(self):
+        """remember what the balances and summaries were calculated with"""
+        self._loaded_payment_request_id = self.__dict__.get("payment_request_id")
+        self._loaded_paid_on = self.__dict__.get("paid_on")
+
+    @property
+    def revenue_payment_requests_and_moments(self):
+        """the (payment request, paid on) pairs whose summaries depend on this"""
+        return {
+            (self.payment_request_id, self.paid_on),
+            (
+                getattr(self, "_loaded_payment_request_id", None),
+                getattr(self, "_loaded_paid_on", None),
+            ),
+        }
+
+    @property
+    def balance_payment_request_ids(self):
+        """the payment requests whose balance depends on this payment"""
+        return {
+            self.payment_request_id,
+            getattr(self, "_loaded_payment_request_id", None),
+        } - {None}
+
 
 class EPCMoneyTransferPayment(Payment):
     from_iban = IBANField(include_countries=IBAN_SEPA_COUNTRIES, null=True, blank=True)
+    bank_reference = models.CharField(
+        verbose_name=_("bank reference"),
+        max_length=100,
+        blank=True,
+        db_index=True,
+        help_text=_("the reference of the bank statement line"),
+    )
+
+
+class MolliePayment(Payment):
+    class Status(models.TextChoices):
+        OPEN = "open", _("open")
+        PENDING = "pending", _("pending")
+        AUTHORIZED = "authorized", _("authorized")
+        PAID = "paid", _("paid")
+        CANCELED = "canceled", _("canceled")
+        EXPIRED = "expired", _("expired")
+        FAILED = "failed", _("failed")
+
+    FINAL_STATUSES = (Status.PAID, Status.CANCELED, Status.EXPIRED, Status.FAILED)
+
+    payment_method = models.ForeignKey(
+        "payments.MolliePaymentMethod",
+        on_delete=models.PROTECT,
+        verbose_name=_("payment method"),
+        related_name="payments",
+    )
+    amount = MoneyField(
+        verbose_name=_("amount"),
+        max_digits=15,
+        decimal_places=2,
+        default_currency="EUR",
+    )
+    mollie_id = models.CharField(
+        verbose_name=_("Mollie id"),
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+    )
+    status = models.CharField(
+        verbose_name=_("status"),
+        max_length=20,
+        choices=Status.choices,
+        default=Status.OPEN,
+        db_index=True,
+    )
+    status_changed_on = models.DateTimeField(
+        verbose_name=_("status changed on"),
+        null=True,
+        blank=True,
+    )
+    checkout_url = models.URLField(
+        verbose_name=_("checkout url"),
+        max_length=500,
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = _("Mollie payment")
+        verbose_name_plural = _("Mollie payments")
+
+    @property
+    def is_final(self):
+        return self.status in self.FINAL_STATUSES
+
+
+class PaymentRequestBalance(models.Model):  # noqa: DJ008
+    """
+    The amount to pay, the amount paid and the remaining amount of a payment
+    request in one currency, kept up to date on every payment and price change
+    """
+
+    payment_request = models.ForeignKey(
+        PaymentRequest,
+        verbose_name=_(
+            "payment request",
+        ),
+        related_name="balances",
+        on_delete=models.CASCADE,
+    )
+    currency = models.CharField(
+        verbose_name=_(
+            "currency",
+        ),
+        max_length=3,
+    )
+    to_pay = models.DecimalField(
+        verbose_name=_(
+            "to pay",
+        ),
+        max_digits=15,
+        decimal_places=2,
+        default=Decimal(0),
+    )
+    paid = models.DecimalField(
+        verbose_name=_(
+            "paid",
+        ),
+        max_digits=15,
+        decimal_places=2,
+        default=Decimal(0),
+    )
+    remaining = models.DecimalField(
+        verbose_name=_(
+            "remaining",
+        ),
+        max_digits=15,
+        decimal_places=2,
+        default=Decimal(0),
+    )
+    modified_on = models.DateTimeField(
+        verbose_name=_(
+            "modified on",
+        ),
+        auto_now=True,
+    )
+
+    objects = PaymentRequestBalanceManager()
+
+    class Meta:
+        verbose_name = _("payment request balance")
+        verbose_name_plural = _("payment request balances")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["payment_request", "currency"],
+                name="unique_payment_request_balance_currency",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["payment_request", "currency"],
+                condition=Q(remaining__gt=0),
+                name="payment_balance_outstanding",
+            ),
+        ]
+
+    AMOUNT_FIELDS = ["to_pay", "paid", "remaining"]
+
+    @property
+    def remaining_money(self):
+        return Money(self.remaining, self.currency)
+
+    @classmethod
+    def calculate(cls, payment_request_ids):
+        """
+        The amounts to pay and paid per payment request and currency,
+        from scratch, with one query for the prices and one for the payments.
+        """
+        content_type = ContentType.objects.get_for_model(PaymentRequest)
+        totals = {}
+        for payment_request_id, vat_included, currency in Price.objects.filter(
+            unique_origin_content_type=content_type,
+            unique_origin_object_id__in=payment_request_ids,
+            vat_included__isnull=False,
+        ).values_list(
+            "unique_origin_object_id",
+            "vat_included",
+            "vat_included_currency",
+        ):
+            amounts = totals.setdefault(payment_request_id, {}).setdefault(
+                currency,
+                {"to_pay": Decimal(0), "paid": Decimal(0)},
+            )
+            amounts["to_pay"] += vat_included
+
+        for row in (
+            Payment.objects.non_polymorphic()
+            .filter(
+                payment_request_id__in=payment_request_ids,
+                paid_amount__isnull=False,
+            )
+            .values("payment_request_id", "paid_amount_currency")
+            .annotate(paid=Sum("paid_amount"))
+            .order_by()
+        ):
+            amounts = totals.setdefault(row["payment_request_id"], {}).setdefault(
+                row["paid_amount_currency"],
+                {"to_pay": Decimal(0), "paid": Decimal(0)},
+            )
+            amounts["paid"] += row["paid"]
+
+        for currencies in totals.values():
+            for amounts in currencies.values():
+                amounts["remaining"] = amounts["to_pay"] - amounts["paid"]
+        return totals
+
+    @classmethod
+    def refresh_for_payment_requests(cls, payment_request_ids):
+        """
+        Recalculate the balances of the given payment requests only. The
+        rows are upserted, and the currencies that disappeared are removed.
+        """
+        payment_request_ids = {pk for pk in payment_request_ids if pk is not None}
+        if not payment_request_ids:
+            return []
+
+        totals = cls.calculate(payment_request_ids)
+        balances = [
+            cls(payment_request_id=payment_request_id, currency=currency, **amounts)
+            for payment_request_id, currencies in totals.items()
+            for currency, amounts in currencies.items()
+        ]
+        logger.debug("Refreshing %s payment request balances", len(balances))
+        with transaction.atomic():
+            cls.objects.bulk_create(
+                balances,
+                update_conflicts=True,
+                unique_fields=["payment_request", "currency"],
+                update_fields=[*cls.AMOUNT_FIELDS, "modified_on"],
+            )
+            stale_ids = [
+                pk
+                for pk, payment_request_id, currency in cls.objects.filter(
+                    payment_request_id__in=payment_request_ids,
+                ).values_list("pk", "payment_request_id", "currency")
+                if currency not in totals.get(payment_request_id, {})
+            ]
+            if stale_ids:
+                cls.objects.filter(pk__in=stale_ids).delete()
+        return balances
+
+
+class PaymentRevenueSummary(models.Model):  # noqa: DJ008
+    """
+    The payments of an organization per day, currency and payment method, so
+    year-to-date figures do not scan the payments. The table is only kept up
+    to date when the PAYMENTS_REVENUE_SUMMARY setting is on.
+    """
+
+    organization = models.ForeignKey(
+        "organizations.Organization",
+        verbose_name=_(
+            "organization",
+        ),
+        related_name="payment_revenue_summaries",
+        on_delete=models.CASCADE,
+    )
+    day = models.DateField(
+        verbose_name=_(
+            "day",
+        ),
+    )
+    currency = models.CharField(
+        verbose_name=_(
+            "currency",
+        ),
+        max_length=3,
+    )
+    payment_method = models.ForeignKey(
+        ContentType,
+        verbose_name=_(
+            "payment method",
+        ),
+        on_delete=models.CASCADE,
+        help_text=_("the kind of payment"),
+    )
+    received = models.DecimalField(
+        verbose_name=_(
+            "received",
+        ),
+        max_digits=15,
+        decimal_places=2,
+        default=Decimal(0),
+    )
+    refunded = models.DecimalField(
+        verbose_name=_(
+            "refunded",
+        ),
+        max_digits=15,
+        decimal_places=2,
+        default=Decimal(0),
+        help_text=_("the sum of the negative payments, as a positive amount"),
+    )
+    payments = models.PositiveIntegerField(
+        verbose_name=_(
+            "payments",
+        ),
+        default=0,
+    )
+    modified_on = models.DateTimeField(
+        verbose_name=_(
+            "modified on",
+        ),
+        auto_now=True,
+    )
+
+    class Meta:
+        verbose_name = _("payment revenue summary")
+        verbose_name_plural = _("payment revenue summaries")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["organization", "day", "currency", "payment_method"],
+                name="unique_payment_revenue_summary",
+            ),
+        ]
+
+    AMOUNT_FIELDS = ["received", "refunded", "payments"]
+
+    @classmethod
+    def enabled(cls):
+        return getattr(settings, "PAYMENTS_REVENUE_SUMMARY", False)
+
+    @classmethod
+    def refresh(cls, organization_days):
+        """recalculate the rows of the given (organization id, day) pairs"""
+        organization_days = {
+            (organization_id, day)
+            for organization_id, day in organization_days
+            if organization_id is not None and day is not None
+        }
+        if not organization_days:
+            return []
+
+        payments = Q()
+        for organization_id, day in organization_days:
+            payments |= Q(
+                payment_request__to_organization_id=organization_id,
+                paid_on__date=day,
+            )
+        summaries = [
+            cls(
+                organization_id=row["organization"],
+                day=row["period"],
+                currency=row["currency"],
+                payment_method_id=row["payment_method"],
+                received=row["received"].amount,
+                refunded=row["refunded"].amount,
+                payments=row["payments"],
+            )
+            for row in Payment.objects.filter(payments).revenue_series(
+                "day",
+                ["organization", "payment_method"],
+            )
+        ]
+        refreshed = {
+            (
+                summary.organization_id,
+                summary.day,
+                summary.currency,
+                summary.payment_method_id,
+            )
+            for summary in summaries
+        }
+
+        with transaction.atomic():
+            cls.objects.bulk_create(
+                summaries,
+                update_conflicts=True,
+                unique_fields=["organization", "day", "currency", "payment_method"],
+                update_fields=[*cls.AMOUNT_FIELDS, "modified_on"],
+            )
+            stale_ids = [
+                pk
+                for pk, *key in cls.objects.filter(
+                    organization_id__in={pair[0] for pair in organization_days},
+                    day__in={pair[1] for pair in organization_days},
+                ).values_list(
+                    "pk",
+                    "organization_id",
+                    "day",
+                    "currency",
+                    "payment_method_id",
+                )
+                if tuple(key[:2]) in organization_days and tuple(key) not in refreshed
+            ]
+            if stale_ids:
+                cls.objects.filter(pk__in=stale_ids).delete()
+        return summaries
+
+    @classmethod
+    def refresh_for_payments(cls, payments):
+        """recalculate the days of the payments, before and after the change"""
+        if not cls.enabled():
+            return []
+
+        pairs = {
+            pair
+            for payment in payments
+            for pair in payment.revenue_payment_requests_and_moments
+            if None not in pair
+        }
+        organizations = dict(
+            PaymentRequest.objects.filter(
+                pk__in={payment_request_id for payment_request_id, _ in pairs},
+            ).values_list("pk", "to_organization_id"),
+        )
+        return cls.refresh(
+            (organizations.get(payment_request_id), timezone.localdate(paid_on))
+            for payment_request_id, paid_on in pairs
+        )
+
+    @classmethod
+    def year_to_date(cls, organization_id, moment=None):
+        """
+        The received, refunded and net amounts and the number of payments
+        since new year, per currency. The summary table is used when it is
+        kept up to date, otherwise the payments are summed.
+        """
+        today = timezone.localdate(moment or clock.now())
+        new_year = today.replace(month=1, day=1)
+
+        if not cls.enabled():
+            return {
+                row["currency"]: row
+                for row in Payment.objects.filter(
+                    payment_request__to_organization_id=organization_id,
+                    paid_on__date__gte=new_year,
+                    paid_on__date__lte=today,
+                ).revenue_series("year")
+            }
+
+        totals = {}
+        for row in (
+            cls.objects.filter(
+                organization_id=organization_id,
+                day__gte=new_year,
+                day__lte=today,
+            )
+            .order_by()
+            .values("currency")
+            .annotate(
+                received_amount=Sum("received"),
+                refunded_amount=Sum("refunded"),
+                payment_count=Sum("payments"),
+            )
+        ):
+            currency = row["currency"]
+            totals[currency] = {
+                "period": new_year,
+                "currency": currency,
+                "received": Money(row["received_amount"], currency),
+                "refunded": Money(row["refunded_amount"], currency),
+                "net": Money(
+                    row["received_amount"] - row["refunded_amount"],
+                    currency,
+                ),
+                "payments": row["payment_count"],
+            }
+        return totals
 
 
 class EventReservationPaymentSettings(PaymentSettings):
@@ -739,6 +1538,11 @@ class EventReservationPaymentSettings(PaymentSettings):
         verbose_name = _("event reservation payment settings")
         verbose_name_plural = _("event reservation payment settings")
 
+    def get_payment_condition_plan(self):
+        from scaleos.payments.conditions import get_payment_condition_plan
+
+        return get_payment_condition_plan(self)
+
     def get_conditions(self, event_reservation=None):
         logger.info("getting conditions")
         if event_reservation is None:
@@ -746,16 +1550,8 @@ class EventReservationPaymentSettings(PaymentSettings):
             logger.info(msg)
             return None
 
-        conditions = {}
-        for current_condition in self.conditions.all():
-            logger.info(current_condition)
-            due_date = current_condition.get_due_date(event_reservation)
-            if due_date is None:
-                continue
-
-            conditions[due_date] = str(current_condition)
-
-        return dict(sorted(conditions.items()))
+        plan = self.get_payment_condition_plan()
+        return plan.conditions_text(plan.snapshot(event_reservation))
 
     def get_conditions_text(self, event_reservation=None):
         logger.info("getting conditions text")
@@ -786,22 +1582,18 @@ class EventReservationPaymentSettings(PaymentSettings):
 
     def apply_payment_conditions(self, event_reservation):
         logger.info("applying event reservation payment conditions")
-        total_conditions = self.conditions.count()
-        logger.info("total conditions: %s", total_conditions)
-        for idx, cond in enumerate(self.conditions.all(), start=1):
-            logger.info("handling condition %s", idx)
-            requesting_price = cond.get_price(event_reservation)
-            if requesting_price is None:
-                logger.info("The condition is not applicable.")
-                continue
+        plan = self.get_payment_condition_plan()
+        proposals = plan.evaluate(plan.snapshot(event_reservation))
+        logger.info("total proposals: %s", len(proposals))
+        for proposal in proposals:
             payment_proposal, created = PaymentProposal.objects.get_or_create(
                 payment_request=event_reservation.payment_request,
-                origin_content_type=ContentType.objects.get_for_model(cond),
-                origin_object_id=cond.pk,
+                origin_content_type_id=proposal.content_type_id,
+                origin_object_id=proposal.condition_id,
             )
-            due_datetime = cond.get_due_date(event_reservation)
-            logger.info("due date: %s", due_datetime)
-            payment_proposal.due_datetime = due_datetime
+            logger.info("due date: %s", proposal.due_datetime)
+            payment_proposal.due_datetime = proposal.due_datetime
+            requesting_price = proposal.to_price()
             requesting_price.organization_id = self.organization.pk
             logger.info("requesting price: %s", requesting_price)
             requesting_price.save()
@@ -978,158 +1770,58 @@ class EventReservationPaymentCondition(PaymentCondition):
     def current_price(self):
         return self.price.first()
 
-    def get_due_date(self, event_reservation):  # noqa: C901
-        logger.info("Getting the due date of the event")
-        if event_reservation is None:
-            event_reservation = self.get_example_event_reservation()
+    def compile(self, event_reservation, total_price_value=None):
+        """
+        The compiled condition, from the cached plan of its settings, and a
+        snapshot of the figures it needs
+        """
+        from scaleos.payments.conditions import CompiledCondition
+        from scaleos.payments.conditions import PaymentConditionPlan
 
-        the_date = ITS_NOW
-        before_the_event = True
-
-        if not hasattr(event_reservation, "event") or event_reservation.event is None:
-            logger.info("The event reservation has no event")
-            return None
-
-        event = event_reservation.event
-
-        the_moment = self.payment_moment
-        logger.info("To be paid on %s", the_moment)
-        match the_moment:
-            case self.PaymentMoment.AT_START_OF_EVENT:
-                return event.starting_at
-            case self.PaymentMoment.AT_END_OF_EVENT:
-                return event.ending_on
-            case self.PaymentMoment.BEFORE_START_OF_EVENT:
-                the_date = event.starting_at
-                before_the_event = True
-            case self.PaymentMoment.AFTER_START_OF_EVENT:
-                the_date = event.starting_at
-                before_the_event = False
-            case self.PaymentMoment.BEFORE_END_OF_EVENT:
-                the_date = event.ending_on
-                before_the_event = True
-            case self.PaymentMoment.AFTER_END_OF_EVENT:
-                the_date = event.ending_on
-                before_the_event = False
-
-        if the_date is None:
-            logger.info("The date is NONE, so we cannot calculate the due date.")
-            return None
-
-        pay_interval = self.to_be_paid_interval
-        pay_interval_amount = self.to_be_paid_time_amount
-        logger.info(
-            "To be paid %s %s relative to %s",
-            pay_interval_amount,
-            pay_interval,
-            the_date,
-        )
-
-        if before_the_event:
-            logger.info("The due date is before the event")
-            due_date = the_date - relativedelta(
-                **{self.to_be_paid_interval: self.to_be_paid_time_amount},
-            )
-            logger.info("The due date is %s", due_date)
-            return due_date
-
-        logger.info("The due date is after the event")
-        due_date = the_date + relativedelta(
-            **{self.to_be_paid_interval: self.to_be_paid_time_amount},
-        )
-        logger.info("The due date is %s", due_date)
-        return due_date
-
-    def get_price(self, event_reservation=None) -> Price | None:  # noqa: C901, PLR0911
         if event_reservation is None:
             event_reservation = self.get_example_event_reservation()
-
-        if not hasattr(event_reservation, "event") or event_reservation.event is None:
-            return None
-
-        if self.condition_applicable(event_reservation) is False:
-            return None
-
-        match self.prepayment_type:
-            case self.PrepaymentType.FULL_PRICE:
-                logger.info("Full price condition")
-                return event_reservation.get_total_price()
-            case self.PrepaymentType.FIXED_PRICE:
-                logger.info("Fixed price condition")
-                if self.current_price is None:
-                    return None
-                return self.current_price
-            case self.prepayment_type.FIXED_PRICE_PER_PERSON:
-                logger.info("Fixed price per person condition")
-                the_price = self.price.first()
-                if the_price:
-                    return the_price.multiply(event_reservation.total_amount)
-
-            case self.PrepaymentType.PERCENTAGE_OF_TOTAL_PRICE:
-                logger.info("Percentage of total price condition")
-                if self.percentage_of_total_price is None:
-                    return None
-                return event_reservation.get_total_price().get_percentage(
-                    self.percentage_of_total_price,
-                )
-            case self.PrepaymentType.REMAINING_PRICE:
-                return self.get_remaining_price(event_reservation)
-
-        return None
+        compiled = None
+        if self.pk and self.event_reservation_payment_settings_id:
+            # the current modification time picks the plan that has this condition
+            # as it is now, the settings loaded with the condition may be older
+            payment_settings = EventReservationPaymentSettings.objects.only(
+                "modified_on",
+            ).get(pk=self.event_reservation_payment_settings_id)
+            compiled = payment_settings.get_payment_condition_plan().get(self.pk)
+        if compiled is None:
+            compiled = CompiledCondition(self)
+        # the snapshot only reads the figures this condition needs
+        plan = PaymentConditionPlan([compiled])
+        return compiled, plan.snapshot(event_reservation, total_price_value)
+
+    def get_due_date(self, event_reservation):
+        logger.info("Getting the due date of the event")
+        compiled, snapshot = self.compile(event_reservation)
+        return compiled.due_date(snapshot)
+
+    def get_price(
+        self,
+        event_reservation=None,
+        total_price_value=None,
+    ) -> Price | Money | None:
+        """total_price_value can be given when the total is already known"""
+        compiled, snapshot = self.compile(event_reservation, total_price_value)
+        price = compiled.price(snapshot)
+        if isinstance(price, PriceValue):
+            return price.to_price()
+        return price
 
     def condition_applicable(self, event_reservation):
-        condition_only_when_exceeding = self.only_when_group_exceeds
-        if condition_only_when_exceeding:
-            logger.info(
-                "The condition should only be applied when exceeding %s persons",
-                condition_only_when_exceeding,
-            )
-            group_is_x_persons = event_reservation.total_amount
-            logger.info("The group has %s persons", group_is_x_persons)
-            if group_is_x_persons is None or group_is_x_persons == 0:
-                logger.info("The total amount of the reservation is 0 or None")
-                return False
-
-            if group_is_x_persons < condition_only_when_exceeding:
-                return False
-        return True
+        compiled, snapshot = self.compile(event_reservation)
+        return compiled.applicable(snapshot)
 
     def get_remaining_price(self, event_reservation):
         logger.debug("Remaining price condition")
-        if event_reservation.payment_request is None:
-            logger.info(
-                "we cannot calculate the remaining price \
-                    when teh payment request is None",
-            )
-            return None
-
-        if event_reservation.payment_request.to_pay is None:
-            logger.info(
-                "we cannot calculate the remaining price \
-                        if we do not know how much to pay",
-            )
-            return None
-
-        if event_reservation.payment_request.already_paid is None:
-            logger.info("Nothing is paid yet, returning the total price")
-            return event_reservation.get_total_price()
-
-        if event_reservation.payment_request.to_pay.vat_included is None:
-            logger.info(
-                "We do not know how much the price with VAT included is",
-            )
-
-        to_pay = event_reservation.payment_request.to_pay.vat_included
-        needed_currency = (
-            event_reservation.payment_request.to_pay.vat_included.currency.code
-        )
-        already_paid = event_reservation.payment_request.already_paid[needed_currency]
-
-        if already_paid >= to_pay:
-            logger.info("There is already more paid than needed")
-            return Money(0, needed_currency)
-
-        return to_pay - already_paid
+        compiled, snapshot = self.compile(event_reservation)
+        price = compiled.remaining_price(snapshot)
+        if isinstance(price, PriceValue):
+            return price.to_price()
+        return price
 
 
 class PaymentMethod(PolymorphicModel, AdminLinkMixin, LogInfoFields, PublicKeyField):
@@ -0,0 +1,297 @@
+"""
+Take payments with Mollie.
+
+The Mollie clients of a process share one pooled HTTP adapter, so the
+connections to the API are reused across requests and api keys. A webhook
+only adds the Mollie payment id to a Redis set. A worker pops the ids in
+batches, fetches their status without a database transaction, and applies
+the changes in one short transaction. An update only depends on the status
+Mollie returns, so duplicate and late webhooks change nothing.
+"""
+
+import datetime
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from mollie.api.client import Client
+from mollie.api.error import Error as MollieError
+from moneyed import Money
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+from scaleos.payments import models as payment_models
+from scaleos.shared import clock
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+# the webhooks of a burst are handled by one worker run after this delay
+FLUSH_DELAY = 2
+# the open payments without webhook are fetched after this time
+SYNC_AFTER = datetime.timedelta(minutes=10)
+SYNC_DAYS = 30
+TIMEOUT = (2, 10)
+
+MOLLIE_ID = re.compile(r"^tr_\w{1,60}$")
+WEBHOOK_QUEUE_KEY = "scaleos:payments:mollie:webhooks"
+WEBHOOK_FLUSH_KEY = "scaleos:payments:mollie:webhooks:flush"
+
+
+@lru_cache(maxsize=1)
+def get_http_adapter():
+    """
+    The connection pool of the process. The idempotency key of a create
+    makes a retried POST safe, so the unavailable responses are retried too.
+    """
+    retry = Retry(
+        total=3,
+        connect=3,
+        read=0,
+        status=3,
+        backoff_factor=0.5,
+        status_forcelist=(429, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "POST"}),
+        raise_on_status=False,
+    )
+    return HTTPAdapter(
+        pool_connections=2,
+        pool_maxsize=settings.MOLLIE_POOL_SIZE,
+        max_retries=retry,
+    )
+
+
+class MollieClient(Client):
+    """a Mollie client on the pooled connections of the process"""
+
+    def _setup_retry(self):
+        adapter = get_http_adapter()
+        self._client.mount("https://", adapter)
+        self._client.mount("http://", adapter)
+
+
+@lru_cache(maxsize=128)
+def _get_client(api_key, api_endpoint):
+    client = MollieClient(api_endpoint=api_endpoint, timeout=TIMEOUT)
+    client.set_api_key(api_key)
+    return client
+
+
+def get_client(api_key):
+    return _get_client(api_key, settings.MOLLIE_API_ENDPOINT)
+
+
+def create_payment(  # noqa: PLR0913
+    payment_method,
+    amount,
+    *,
+    redirect_url,
+    webhook_url=None,
+    payment_request=None,
+    description="",
+):
+    """
+    Store a new Mollie payment and create it at Mollie. The payment is saved
+    first, so its public key is the idempotency key of a retried request.
+    """
+    payment = payment_models.MolliePayment.objects.create(
+        payment_method=payment_method,
+        payment_request=payment_request,
+        amount=amount,
+    )
+
+    data = {
+        "amount": {
+            "currency": amount.currency.code,
+            "value": f"{amount.amount:.2f}",
+        },
+        "description": description or str(payment.public_key),
+        "redirectUrl": redirect_url,
+        "metadata": {"public_key": str(payment.public_key)},
+    }
+    if webhook_url:
+        data["webhookUrl"] = webhook_url
+
+    mollie_payment = get_client(payment_method.api_key).payments.create(
+        data,
+        idempotency_key=str(payment.public_key),
+    )
+    payment.mollie_id = mollie_payment.id
+    payment.status = mollie_payment.status
+    payment.checkout_url = mollie_payment.checkout_url or ""
+    payment.save(update_fields=["mollie_id", "status", "checkout_url"])
+    return payment
+
+
+@lru_cache(maxsize=1)
+def get_redis():
+    options = {"ssl_cert_reqs": None} if settings.REDIS_SSL else {}
+    return redis.Redis.from_url(settings.REDIS_URL, **options)
+
+
+def enqueue_webhook(mollie_id):
+    """
+    Remember the id and schedule one worker run for all the webhooks of a
+    burst. A duplicate webhook is the same member of the set.
+    """
+    with get_redis().pipeline() as pipe:
+        pipe.sadd(WEBHOOK_QUEUE_KEY, mollie_id)
+        pipe.set(WEBHOOK_FLUSH_KEY, 1, nx=True, ex=FLUSH_DELAY)
+        _, schedule = pipe.execute()
+
+    if schedule:
+        from scaleos.payments.tasks import process_mollie_webhooks
+
+        process_mollie_webhooks.apply_async(countdown=FLUSH_DELAY)
+
+
+def pop_webhooks(batch_size=BATCH_SIZE):
+    mollie_ids = get_redis().spop(WEBHOOK_QUEUE_KEY, batch_size) or []
+    return [mollie_id.decode() for mollie_id in mollie_ids]
+
+
+def requeue_webhooks(mollie_ids):
+    if mollie_ids:
+        get_redis().sadd(WEBHOOK_QUEUE_KEY, *mollie_ids)
+
+
+def fetch_payments(payments):
+    """
+    Fetch the Mollie payments concurrently over the pooled connections.
+    Returns the fetched payments by id and the ids that failed.
+    """
+    if not payments:
+        return {}, []
+
+    def fetch(payment):
+        return get_client(payment.payment_method.api_key).payments.get(
+            payment.mollie_id,
+        )
+
+    workers = min(settings.MOLLIE_POOL_SIZE, len(payments))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            payment.mollie_id: executor.submit(fetch, payment) for payment in payments
+        }
+
+    fetched = {}
+    failed = []
+    for mollie_id, future in futures.items():
+        try:
+            fetched[mollie_id] = future.result()
+        except MollieError:
+            logger.warning(
+                "Could not fetch Mollie payment %s",
+                mollie_id,
+                exc_info=True,
+            )
+            failed.append(mollie_id)
+    return fetched, failed
+
+
+def update_from_mollie(payment, mollie_payment):
+    """apply the status Mollie returned, False when nothing changes"""
+    status = mollie_payment.status
+    if status == payment.status or payment.is_final:
+        return False
+
+    its_now = clock.now()
+    payment.status = status
+    payment.status_changed_on = its_now
+    payment.modified_on = its_now
+    if status == payment_models.MolliePayment.Status.PAID:
+        amount = mollie_payment.amount
+        payment.paid_amount = Money(amount["value"], amount["currency"])
+        payment.paid_on = parse_datetime(mollie_payment.paid_at or "") or its_now
+    return True
+
+
+def apply_payments(fetched):
+    """store the changed statuses, returns the changed payments"""
+    if not fetched:
+        return []
+
+    with transaction.atomic():
+        changed = [
+            payment
+            for payment in payment_models.MolliePayment.objects.select_for_update()
+            .filter(mollie_id__in=fetched)
+            .order_by("pk")
+            if update_from_mollie(payment, fetched[payment.mollie_id])
+        ]
+        payment_models.MolliePayment.objects.bulk_update(
+            changed,
+            [
+                "status",
+                "status_changed_on",
+                "paid_amount",
+                "paid_amount_currency",
+                "paid_on",
+                "modified_on",
+            ],
+        )
+        # the bulk update bypasses the signals that keep the ledger up to date
+        payment_models.PaymentRequestBalance.refresh_for_payment_requests(
+            {
+                payment_request_id
+                for payment in changed
+                for payment_request_id in payment.balance_payment_request_ids
+            },
+        )
+        payment_models.PaymentRevenueSummary.refresh_for_payments(changed)
+
+    for payment in changed:
+        payment.set_loaded_state()
+    logger.info("%s of %s Mollie payments changed", len(changed), len(fetched))
+    return changed
+
+
+def sync_payments(mollie_ids):
+    """fetch and store the status of the payments, returns the failed ids"""
+    payments = list(
+        payment_models.MolliePayment.objects.filter(mollie_id__in=mollie_ids)
+        .exclude(status__in=payment_models.MolliePayment.FINAL_STATUSES)
+        .select_related("payment_method"),
+    )
+    fetched, failed = fetch_payments(payments)
+    apply_payments(fetched)
+    return failed
+
+
+def process_webhooks(batch_size=BATCH_SIZE):
+    """drain the webhook queue batch by batch, returns the failed ids"""
+    failed = []
+    while mollie_ids := pop_webhooks(batch_size):
+        failed += sync_payments(mollie_ids)
+    return failed
+
+
+def sync_open_payments(moment=None, batch_size=BATCH_SIZE):
+    """
+    Fetch the payments that are still open some time after their creation,
+    in case their webhook got lost. Returns the failed ids.
+    """
+    moment = moment or clock.now()
+    mollie_ids = (
+        payment_models.MolliePayment.objects.exclude(
+            status__in=payment_models.MolliePayment.FINAL_STATUSES,
+        )
+        .filter(
+            mollie_id__isnull=False,
+            created_on__lte=moment - SYNC_AFTER,
+            created_on__gte=moment - datetime.timedelta(days=SYNC_DAYS),
+        )
+        .values_list("mollie_id", flat=True)
+        .iterator(chunk_size=batch_size)
+    )
+
+    failed = []
+    while batch := list(islice(mollie_ids, batch_size)):
+        failed += sync_payments(batch)
+    return failed
@@ -0,0 +1,212 @@
+"""
+A local stand-in for the payments endpoints of the Mollie API.
+
+The payments are kept in memory. The server honours the idempotency keys,
+can answer the next requests with an error to exercise the retries, and
+calls the webhook of a payment, as often as asked, when its status changes.
+Point MOLLIE_API_ENDPOINT to it, or run `manage.py mollie_stub_server`.
+"""
+
+import json
+import logging
+import re
+import secrets
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+import requests
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_PATH = re.compile(r"^/v2/payments/(?P<mollie_id>tr_\w+)$")
+CHECKOUT_PATH = re.compile(r"^/checkout/(?P<mollie_id>tr_\w+)$")
+API_KEY = re.compile(r"^Bearer (live|test)_\w+$")
+
+
+class MollieStubHandler(BaseHTTPRequestHandler):
+    server_version = "MollieStub/1.0"
+
+    @property
+    def stub(self):
+        return self.server.stub
+
+    def log_message(self, format, *args):  # noqa: A002
+        logger.debug(format, *args)
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/hal+json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, detail):
+        status = HTTPStatus(status)
+        self.send_json(
+            status,
+            {"status": status.value, "title": status.phrase, "detail": detail},
+        )
+
+    def check_request(self):
+        """answer an injected failure or a bad api key, True when answered"""
+        self.stub.requests.append((self.command, self.path))
+        failure = self.stub.pop_failure()
+        if failure is not None:
+            self.send_error_json(failure, "injected failure")
+            return True
+
+        if not API_KEY.match(self.headers.get("Authorization", "")):
+            self.send_error_json(HTTPStatus.UNAUTHORIZED, "Missing authentication")
+            return True
+        return False
+
+    def do_POST(self):  # noqa: N802
+        if urlparse(self.path).path != "/v2/payments":
+            self.send_error_json(HTTPStatus.NOT_FOUND, "Unknown endpoint")
+            return
+
+        if self.check_request():
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        data = json.loads(self.rfile.read(length) or b"{}")
+        payment = self.stub.create_payment(
+            data,
+            self.headers.get("Idempotency-Key", ""),
+        )
+        self.send_json(HTTPStatus.CREATED, payment)
+
+    def do_GET(self):  # noqa: N802
+        url = urlparse(self.path)
+        if match := CHECKOUT_PATH.match(url.path):
+            self.checkout(match["mollie_id"], parse_qs(url.query))
+            return
+
+        match = PAYMENT_PATH.match(url.path)
+        if match is None:
+            self.send_error_json(HTTPStatus.NOT_FOUND, "Unknown endpoint")
+            return
+
+        if self.check_request():
+            return
+
+        payment = self.stub.payments.get(match["mollie_id"])
+        if payment is None:
+            self.send_error_json(HTTPStatus.NOT_FOUND, "No payment exists")
+            return
+        self.send_json(HTTPStatus.OK, payment)
+
+    def checkout(self, mollie_id, query):
+        """the hosted checkout, ?status=paid decides how it ends"""
+        if mollie_id not in self.stub.payments:
+            self.send_error_json(HTTPStatus.NOT_FOUND, "No payment exists")
+            return
+
+        status = query.get("status", ["paid"])[0]
+        payment = self.stub.set_status(mollie_id, status)
+        self.send_response(HTTPStatus.FOUND)
+        self.send_header("Location", payment.get("redirectUrl") or "/")
+        self.end_headers()
+
+
+class MollieStubServer:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.payments = {}
+        self.idempotency_keys = {}
+        self.failures = []
+        self.requests = []
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), MollieStubHandler)
+        self.httpd.stub = self
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def fail_next(self, *statuses):
+        """answer the next API requests with these error statuses"""
+        with self.lock:
+            self.failures.extend(statuses)
+
+    def pop_failure(self):
+        with self.lock:
+            return self.failures.pop(0) if self.failures else None
+
+    def create_payment(self, data, idempotency_key=""):
+        with self.lock:
+            if idempotency_key in self.idempotency_keys:
+                return self.payments[self.idempotency_keys[idempotency_key]]
+
+            mollie_id = f"tr_{secrets.token_hex(5)}"
+            self.payments[mollie_id] = {
+                "resource": "payment",
+                "id": mollie_id,
+                "mode": "test",
+                "createdAt": timezone.now().isoformat(timespec="seconds"),
+                "status": "open",
+                "amount": data.get("amount"),
+                "description": data.get("description", ""),
+                "redirectUrl": data.get("redirectUrl"),
+                "webhookUrl": data.get("webhookUrl"),
+                "metadata": data.get("metadata"),
+                "_links": {
+                    "self": {
+                        "href": f"{self.url}/v2/payments/{mollie_id}",
+                        "type": "application/hal+json",
+                    },
+                    "checkout": {
+                        "href": f"{self.url}/checkout/{mollie_id}",
+                        "type": "text/html",
+                    },
+                },
+            }
+            if idempotency_key:
+                self.idempotency_keys[idempotency_key] = mollie_id
+            return self.payments[mollie_id]
+
+    def set_status(self, mollie_id, status, *, webhooks=1):
+        """change the status and call the webhook, duplicates included"""
+        with self.lock:
+            payment = self.payments[mollie_id]
+            payment["status"] = status
+            if status == "paid":
+                payment["paidAt"] = timezone.now().isoformat(timespec="seconds")
+        for _ in range(webhooks):
+            self.call_webhook(mollie_id)
+        return payment
+
+    def call_webhook(self, mollie_id):
+        webhook_url = self.payments[mollie_id].get("webhookUrl")
+        if not webhook_url:
+            return None
+        try:
+            return requests.post(webhook_url, data={"id": mollie_id}, timeout=5)
+        except requests.RequestException:
+            logger.warning("The webhook of %s failed", mollie_id, exc_info=True)
+            return None
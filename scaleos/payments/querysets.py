@@ -1,32 +1,52 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import Count
+from django.db.models import Exists
+from django.db.models import F
+from django.db.models import OuterRef
+from django.db.models import Q
 from django.db.models import Sum
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.db.models.functions import Trunc
 from moneyed import Money
+from polymorphic.managers import PolymorphicManager
+from polymorphic.query import PolymorphicQuerySet
 
+from scaleos.shared import clock
 
-class PaymentRequestQuerySet(models.QuerySet):
-    def total_by_currency(
-        self,
-        expected_currencies=None,
-        payment_status=None,
-        date_from=None,
-        date_to=None,
-    ):
-        qs = self
+AMOUNT = models.DecimalField(max_digits=15, decimal_places=2)
 
-        if payment_status:
-            if isinstance(payment_status, (list, tuple)):
-                qs = qs.filter(payment__status__in=payment_status)
-            else:
-                qs = qs.filter(payment__status=payment_status)
 
-        if date_from:
-            qs = qs.filter(created_at__gte=date_from)
+class PaymentQuerySet(PolymorphicQuerySet):
+    PERIODS = ("day", "week", "month", "quarter", "year")
+
+    # the payments do not point to a payment method, so the payment method
+    # is the kind of payment, e.g. a money transfer
+    DIMENSIONS = {
+        "organization": "payment_request__to_organization_id",
+        "concept": "payment_request__reservation__eventreservation__event__concept_id",
+        "payment_method": "polymorphic_ctype_id",
+    }
 
+    def paid(self):
+        return self.filter(paid_on__isnull=False, paid_amount__isnull=False)
+
+    def paid_between(self, date_from=None, date_to=None):
+        qs = self.paid()
+        if date_from:
+            qs = qs.filter(paid_on__gte=date_from)
         if date_to:
-            qs = qs.filter(created_at__lte=date_to)
+            qs = qs.filter(paid_on__lte=date_to)
+        return qs
 
-        grouped = qs.values("paid_amount_currency").annotate(
-            total_amount=Sum("paid_amount"),
+    def total_by_currency(self, expected_currencies=None):
+        grouped = (
+            self.paid()
+            .order_by()
+            .values("paid_amount_currency")
+            .annotate(total_amount=Sum("paid_amount"))
         )
 
         result = {
@@ -44,6 +64,96 @@ class PaymentRequestQuerySet(models.QuerySet):
 
         return result
 
+    def revenue_series(self, period="day", dimensions=()):
+        """
+        The received, refunded and net amounts and the number of payments per
+        period, currency and the given dimensions, in one statement.
+        Returns dicts ordered by period.
+        """
+        if period not in self.PERIODS:
+            msg = f"Unknown period {period}, choose one of {', '.join(self.PERIODS)}"
+            raise ValueError(msg)
+
+        unknown = set(dimensions) - set(self.DIMENSIONS)
+        if unknown:
+            msg = f"Unknown dimensions {', '.join(sorted(unknown))}"
+            raise ValueError(msg)
+
+        rows = (
+            self.paid()
+            .annotate(
+                period=Trunc("paid_on", period, output_field=models.DateField()),
+            )
+            .order_by()
+            .values(
+                "period",
+                currency=F("paid_amount_currency"),
+                **{
+                    dimension: F(self.DIMENSIONS[dimension]) for dimension in dimensions
+                },
+            )
+            .annotate(
+                received=Coalesce(
+                    Sum("paid_amount", filter=Q(paid_amount__gt=0)),
+                    Value(Decimal(0)),
+                    output_field=AMOUNT,
+                ),
+                refunded=Coalesce(
+                    Sum("paid_amount", filter=Q(paid_amount__lt=0)),
+                    Value(Decimal(0)),
+                    output_field=AMOUNT,
+                ),
+                payments=Count("pk"),
+            )
+            .order_by("period", "currency", *dimensions)
+        )
+        return [
+            {
+                **row,
+                "received": Money(row["received"], row["currency"]),
+                "refunded": Money(-row["refunded"], row["currency"]),
+                "net": Money(row["received"] + row["refunded"], row["currency"]),
+            }
+            for row in rows
+        ]
+
+
+class PaymentManager(PolymorphicManager):
+    queryset_class = PaymentQuerySet
+
+    def paid_between(self, date_from=None, date_to=None):
+        return self.get_queryset().paid_between(date_from, date_to)
+
+    def revenue_series(self, period="day", dimensions=()):
+        return self.get_queryset().revenue_series(period, dimensions)
+
+
+class PaymentRequestQuerySet(models.QuerySet):
+    def payments(self):
+        from scaleos.payments.models import Payment
+
+        return Payment.objects.filter(payment_request__in=self)
+
+    def total_by_currency(
+        self,
+        expected_currencies=None,
+        date_from=None,
+        date_to=None,
+    ):
+        """the paid amounts of the payment requests, per currency"""
+        return (
+            self.payments()
+            .paid_between(date_from, date_to)
+            .total_by_currency(expected_currencies)
+        )
+
+    def revenue_series(self, period="day", dimensions=(), date_from=None, date_to=None):
+        return (
+            self.payments()
+            .paid_between(date_from, date_to)
+            .revenue_series(period, dimensions)
+        )
+
 
 class PaymentRequestManager(models.Manager):
     def get_queryset(self):
@@ -51,3 +161,53 @@ class PaymentRequestManager(models.Manager):
 
     def total_by_currency(self, *args, **kwargs):
         return self.get_queryset().total_by_currency(*args, **kwargs)
+
+    def revenue_series(self, *args, **kwargs):
+        return self.get_queryset().revenue_series(*args, **kwargs)
+
+
+class PaymentRequestBalanceQuerySet(models.QuerySet):
+    def outstanding(self):
+        return self.filter(remaining__gt=0)
+
+    def for_organization(self, organization):
+        return self.filter(payment_request__to_organization=organization)
+
+    def overdue(self, moment=None):
+        """
+        The balances that still have to be paid while a payment proposal of
+        their payment request is due, in one query.
+        """
+        from scaleos.payments.models import PaymentProposal
+
+        moment = moment or clock.now()
+        return self.outstanding().filter(
+            Exists(
+                PaymentProposal.objects.filter(
+                    payment_request_id=OuterRef("payment_request_id"),
+                    due_datetime__lte=moment,
+                ),
+            ),
+        )
+
+    def total_by_currency(self, field_name="remaining"):
+        return {
+            item["currency"]: Money(item["total_amount"], item["currency"])
+            for item in self.order_by()
+            .values("currency")
+            .annotate(total_amount=Sum(field_name))
+        }
+
+
+class PaymentRequestBalanceManager(models.Manager):
+    def get_queryset(self):
+        return PaymentRequestBalanceQuerySet(self.model, using=self._db)
+
+    def outstanding(self):
+        return self.get_queryset().outstanding()
+
+    def for_organization(self, organization):
+        return self.get_queryset().for_organization(organization)
+
+    def overdue(self, moment=None):
+        return self.get_queryset().overdue(moment)
@@ -0,0 +1,289 @@
+"""
+Remind the requesters of the payment proposals that are due soon or overdue.
+
+The reminders are sent in two passes, both keyset-paginated on an index so the
+memory use does not depend on the number of proposals. The first pass reads
+the due proposals ordered by due datetime and id, and stores one
+PaymentReminder a day per proposal, with the user and organization to remind.
+The second pass reads the reminders of the day without notification ordered
+by user, organization and id, and groups them in one user notification per
+user and organization. The group that is still open at the end of a batch is
+carried over to the next one, up to MAX_GROUP_SIZE reminders.
+"""
+
+import datetime
+import logging
+import operator
+from functools import reduce
+
+from django.db import transaction
+from django.db.models import Exists
+from django.db.models import OuterRef
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+from django.utils import formats
+from django.utils import timezone
+from django.utils.translation import gettext as _
+from moneyed import Money
+
+from scaleos.payments import models as payment_models
+from scaleos.shared import clock
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+MAX_GROUP_SIZE = 100
+REMIND_DAYS_BEFORE_DUE = 3
+REMIND_DAYS_AFTER_DUE = 30
+
+
+class DueReminder:
+    __slots__ = (
+        "amount",
+        "currency",
+        "due_datetime",
+        "organization_id",
+        "pk",
+        "reference",
+        "user_id",
+    )
+
+    FIELDS = (
+        "pk",
+        "user_id",
+        "organization_id",
+        "payment_proposal__due_datetime",
+        "payment_proposal__price__vat_included",
+        "payment_proposal__price__vat_included_currency",
+        "payment_proposal__payment_request__structured_reference_be",
+    )
+
+    def __init__(  # noqa: PLR0913
+        self,
+        pk,
+        user_id,
+        organization_id,
+        due_datetime,
+        amount,
+        currency,
+        reference,
+    ):
+        self.pk = pk
+        self.user_id = user_id
+        self.organization_id = organization_id
+        self.due_datetime = due_datetime
+        self.amount = amount
+        self.currency = currency
+        self.reference = reference
+
+    @property
+    def group(self):
+        return self.user_id, self.organization_id
+
+    def __str__(self):
+        due_on = formats.date_format(
+            timezone.localtime(self.due_datetime),
+            "SHORT_DATE_FORMAT",
+        )
+        line = f"{due_on}: "
+        if self.amount is not None:
+            line += f"{Money(self.amount, self.currency)} "
+        if self.reference:
+            line += f"({self.reference})"
+        return line.strip()
+
+
+def get_due_proposals(moment):
+    """the proposals of the unpaid payment requests around the moment"""
+    return (
+        payment_models.PaymentProposal.objects.filter(
+            due_datetime__gte=moment - datetime.timedelta(days=REMIND_DAYS_AFTER_DUE),
+            due_datetime__lte=moment + datetime.timedelta(days=REMIND_DAYS_BEFORE_DUE),
+        )
+        .filter(
+            Exists(
+                payment_models.PaymentRequestBalance.objects.outstanding().filter(
+                    payment_request_id=OuterRef("payment_request_id"),
+                ),
+            ),
+        )
+        .annotate(
+            reminded_user_id=Coalesce(
+                "payment_request__reservation__user_id",
+                "payment_request__to_person__user_id",
+            ),
+        )
+        .filter(reminded_user_id__isnull=False)
+        .order_by("due_datetime", "pk")
+    )
+
+
+def iter_due_proposal_batches(moment, batch_size=BATCH_SIZE):
+    """
+    Yield lists of (pk, due datetime, user id, organization id) rows. Every
+    batch continues after the last proposal of the previous batch instead of
+    using an offset.
+    """
+    due_proposals = get_due_proposals(moment)
+    last = None
+    while True:
+        queryset = due_proposals
+        if last is not None:
+            last_pk, last_due_datetime = last[:2]
+            queryset = queryset.filter(
+                Q(due_datetime__gt=last_due_datetime)
+                | Q(due_datetime=last_due_datetime, pk__gt=last_pk),
+            )
+        batch = list(
+            queryset.values_list(
+                "pk",
+                "due_datetime",
+                "reminded_user_id",
+                "payment_request__to_organization_id",
+            )[:batch_size],
+        )
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]
+
+
+def store_reminders(batch, reminded_on):
+    """store the reminders of the day, a proposal that is reminded is skipped"""
+    payment_models.PaymentReminder.objects.bulk_create(
+        [
+            payment_models.PaymentReminder(
+                payment_proposal_id=proposal_id,
+                reminded_on=reminded_on,
+                user_id=user_id,
+                organization_id=organization_id,
+            )
+            for proposal_id, _due_datetime, user_id, organization_id in batch
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def get_unsent_reminders(reminded_on):
+    return payment_models.PaymentReminder.objects.filter(
+        reminded_on=reminded_on,
+        notification__isnull=True,
+    ).order_by("user_id", "organization_id", "pk")
+
+
+def after_due_reminder(last):
+    """the reminders that come after the last one, in the order of the keyset"""
+    same_user = Q(user_id=last.user_id)
+    later = [Q(user_id__gt=last.user_id)]
+    if last.organization_id is None:
+        same_group = same_user & Q(organization_id__isnull=True)
+    else:
+        later.append(
+            same_user
+            & (
+                Q(organization_id__gt=last.organization_id)
+                | Q(organization_id__isnull=True)
+            ),
+        )
+        same_group = same_user & Q(organization_id=last.organization_id)
+    later.append(same_group & Q(pk__gt=last.pk))
+    return reduce(operator.or_, later)
+
+
+def iter_due_reminder_batches(reminded_on, batch_size=BATCH_SIZE):
+    """yield lists of the reminders of the day without notification"""
+    due_reminders = get_unsent_reminders(reminded_on)
+    last = None
+    while True:
+        queryset = due_reminders
+        if last is not None:
+            queryset = queryset.filter(after_due_reminder(last))
+        batch = [
+            DueReminder(*row)
+            for row in queryset.values_list(*DueReminder.FIELDS)[:batch_size]
+        ]
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]
+
+
+def send_reminder(user_id, organization_id, due_reminders):
+    from scaleos.notifications.models import Notification
+    from scaleos.notifications.models import UserNotification
+
+    lines = [str(due_reminder) for due_reminder in due_reminders]
+    return UserNotification.objects.create(
+        to_user_id=user_id,
+        sending_organization_id=organization_id,
+        notification_type=Notification.NotificationType.PAYMENT_DUE_REMINDER,
+        title=_("a payment is due").capitalize(),
+        message="\n".join(lines),
+    )
+
+
+def remind_batch(due_reminders):
+    """
+    Send the notifications of one batch, returns the number of notifications.
+    The reminders that are sent or locked by another worker are skipped.
+    """
+    groups = {}
+    for due_reminder in due_reminders:
+        groups.setdefault(due_reminder.group, []).append(due_reminder)
+
+    with transaction.atomic():
+        claimed = set(
+            payment_models.PaymentReminder.objects.select_for_update(skip_locked=True)
+            .filter(
+                pk__in=[due_reminder.pk for due_reminder in due_reminders],
+                notification__isnull=True,
+            )
+            .values_list("pk", flat=True),
+        )
+
+        notifications = 0
+        for (user_id, organization_id), group in groups.items():
+            group_reminders = [
+                due_reminder for due_reminder in group if due_reminder.pk in claimed
+            ]
+            if not group_reminders:
+                continue
+            notification = send_reminder(user_id, organization_id, group_reminders)
+            payment_models.PaymentReminder.objects.filter(
+                pk__in=[due_reminder.pk for due_reminder in group_reminders],
+            ).update(notification=notification)
+            notifications += 1
+    return notifications
+
+
+def send_payment_reminders(moment=None, batch_size=BATCH_SIZE):
+    """
+    Remind every user of the proposals that are due soon or overdue, at
+    most once a day per proposal. Returns the number of notifications.
+    """
+    moment = moment or clock.now()
+    reminded_on = timezone.localdate(moment)
+
+    for batch in iter_due_proposal_batches(moment, batch_size):
+        store_reminders(batch, reminded_on)
+
+    notifications = 0
+    pending = []
+    for batch in iter_due_reminder_batches(reminded_on, batch_size):
+        pending.extend(batch)
+        # the group of the last reminder may continue in the next batch
+        open_group = pending[-1].group
+        complete = [
+            due_reminder for due_reminder in pending if due_reminder.group != open_group
+        ]
+        pending = pending[len(complete) :]
+        if len(pending) >= MAX_GROUP_SIZE:
+            complete += pending
+            pending = []
+        if complete:
+            notifications += remind_batch(complete)
+    if pending:
+        notifications += remind_batch(pending)
+
+    logger.info("%s payment reminders sent for %s", notifications, reminded_on)
+    return notifications
@@ -1,52 +1,96 @@
+from django.contrib.contenttypes.models import ContentType
 from django.db.models.signals import post_delete
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
-from scaleos.payments.functions import ReferenceGenerator
-
+from .conditions import touch_payment_settings
+from .models import EventReservationPaymentCondition
+from .models import Payment
 from .models import PaymentRequest
+from .models import PaymentRequestBalance
+from .models import PaymentRevenueSummary
+from .models import Price
 from .models import VATPriceLine
 
 
 @receiver(post_save, sender=VATPriceLine)
 def recalculate_price_on_save(sender, instance, **kwargs):
-    if instance.price:
+    if instance.price_id:
         instance.price.recalculate_vat_totals()
 
 
 @receiver(post_delete, sender=VATPriceLine)
 def recalculate_price_on_delete(sender, instance, **kwargs):
-    if instance.price:
+    if instance.price_id:
         instance.price.recalculate_vat_totals()
 
 
-@receiver(post_save, sender=PaymentRequest)
-def generate_structured_references(sender, instance, created, **kwargs):
-    updated = False
+def deleted_together_with_payment_request(**kwargs):
+    # the balances are deleted together with the payment request
+    return isinstance(kwargs.get("origin"), PaymentRequest)
 
-    if not instance.structured_reference_be:
-        instance.structured_reference_be = (
-            ReferenceGenerator.generate_structured_reference(
-                base_number=instance.pk,
-                decorated=True,
-            )
-        )
-        updated = True
-    else:
-        ReferenceGenerator.validate_structured_reference(
-            instance.structured_reference_be,
-        )
-
-    if not instance.structured_reference_sepa:
-        instance.structured_reference_sepa = (
-            ReferenceGenerator.generate_iso11649_reference(
-                base_number=instance.pk,
+
+@receiver([post_save, post_delete], sender=EventReservationPaymentCondition)
+def recompile_payment_conditions(sender, instance, **kwargs):
+    touch_payment_settings([instance.event_reservation_payment_settings_id])
+
+
+@receiver([post_save, post_delete], sender=Price)
+def recompile_payment_conditions_for_price(sender, instance, **kwargs):
+    if (
+        instance.unique_origin_object_id is None
+        or instance.unique_origin_content_type_id
+        != ContentType.objects.get_for_model(EventReservationPaymentCondition).pk
+    ):
+        return
+
+    touch_payment_settings(
+        EventReservationPaymentCondition.objects.filter(
+            pk=instance.unique_origin_object_id,
+        ).values_list("event_reservation_payment_settings_id", flat=True),
+    )
+
+
+@receiver([post_save, post_delete], sender=Price)
+def refresh_payment_request_balance_for_price(sender, instance, **kwargs):
+    if deleted_together_with_payment_request(**kwargs):
+        return
+
+    if (
+        instance.unique_origin_object_id is None
+        or instance.unique_origin_content_type_id
+        != ContentType.objects.get_for_model(PaymentRequest).pk
+    ):
+        return
+
+    PaymentRequestBalance.refresh_for_payment_requests(
+        [instance.unique_origin_object_id],
+    )
+
+
+def get_payment_models(model=Payment):
+    yield model
+    for subclass in model.__subclasses__():
+        yield from get_payment_models(subclass)
+
+
+def register_signals_for_all_payment_subclasses():
+    # the payments are polymorphic, so every subclass is a different sender
+    for payment_model in get_payment_models():
+        for signal in (post_save, post_delete):
+            signal.connect(
+                refresh_payment_request_balance_for_payment,
+                sender=payment_model,
+                weak=False,
             )
-        )
-        updated = True
-
-    if updated:
-        # Save again only if we updated any fields
-        instance.save(
-            update_fields=["structured_reference_be", "structured_reference_sepa"],
-        )
+
+
+def refresh_payment_request_balance_for_payment(sender, instance, **kwargs):
+    if deleted_together_with_payment_request(**kwargs):
+        return
+
+    PaymentRequestBalance.refresh_for_payment_requests(
+        instance.balance_payment_request_ids,
+    )
+    PaymentRevenueSummary.refresh_for_payments([instance])
+    instance.set_loaded_state()
@@ -0,0 +1,477 @@
+"""
+Reconcile bank statements with the payment requests.
+
+The CAMT.053 and CODA files are read line by line and the report keeps
+counts and a bounded sample of the lines, so large statements are processed
+with constant memory. The statement lines are matched in chunks on
+the structured references of the payment requests, and a money transfer
+payment is created in bulk for every line that matches exactly one request.
+"""
+
+import datetime
+import hashlib
+import logging
+import re
+import uuid
+from decimal import Decimal
+from itertools import islice
+from pathlib import Path
+
+from defusedxml.ElementTree import iterparse
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from moneyed import Money
+
+from scaleos.payments import models as payment_models
+from scaleos.payments.functions import ReferenceGenerator
+from scaleos.shared.functions import bulk_create_multi_table
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+# the ambiguous and unmatched lines a report keeps, of each
+SAMPLE_SIZE = 100
+
+STRUCTURED_REFERENCE = re.compile(r"(?<!\d)\d{3}/?\d{4}/?\d{5}(?!\d)")
+ISO11649_REFERENCE = re.compile(r"\bRF\d{2}[0-9A-Z]{1,21}\b")
+
+
+class StatementLine:
+    __slots__ = (
+        "amount",
+        "bank_reference",
+        "booked_on",
+        "communication",
+        "counterparty_iban",
+        "counterparty_name",
+        "credit",
+        "currency",
+        "structured_reference",
+    )
+
+    def __init__(  # noqa: PLR0913
+        self,
+        *,
+        amount,
+        currency,
+        credit,
+        booked_on=None,
+        bank_reference="",
+        structured_reference="",
+        communication="",
+        counterparty_iban="",
+        counterparty_name="",
+    ):
+        self.amount = amount
+        self.currency = currency
+        self.credit = credit
+        self.booked_on = booked_on
+        self.bank_reference = bank_reference
+        self.structured_reference = structured_reference
+        self.communication = communication
+        self.counterparty_iban = counterparty_iban
+        self.counterparty_name = counterparty_name
+
+    def __repr__(self):
+        return f"<StatementLine {self.bank_reference} {self.amount} {self.currency}>"
+
+    @property
+    def money(self):
+        return Money(self.amount, self.currency)
+
+    @property
+    def import_reference(self):
+        """
+        What tells that the line is already imported: the reference of the
+        bank or, for a line without one, a digest of what the line says
+        """
+        if self.bank_reference:
+            return self.bank_reference
+
+        booked_on = self.booked_on.date().isoformat() if self.booked_on else ""
+        content = "|".join(
+            [
+                booked_on,
+                str(self.amount),
+                self.currency or "",
+                self.counterparty_iban,
+                self.structured_reference,
+                self.communication,
+            ],
+        )
+        return f"line:{hashlib.sha256(content.encode()).hexdigest()[:40]}"
+
+    @property
+    def references(self):
+        """
+        The valid references of the line: the structured reference if the bank
+        gave one, otherwise the references found in the free communication.
+        """
+        if self.structured_reference:
+            texts = [self.structured_reference]
+        else:
+            texts = [self.communication]
+
+        plain_references = set()
+        iso11649_references = set()
+        for text in texts:
+            for found in STRUCTURED_REFERENCE.findall(text):
+                plain_references.add(ReferenceGenerator.to_plain(found))
+            iso11649_references.update(ISO11649_REFERENCE.findall(text.upper()))
+
+        valid_references = plain_references - set(
+            ReferenceGenerator.invalid_structured_references(plain_references),
+        )
+        return valid_references, iso11649_references
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _find(element, path):
+    """find a child by the local names of the path, whatever the namespace"""
+    for name in path.split("/"):
+        if element is None:
+            return None
+        element = next(
+            (child for child in element if _local_name(child.tag) == name),
+            None,
+        )
+    return element
+
+
+def _text(element, path, default=""):
+    found = _find(element, path)
+    if found is None or found.text is None:
+        return default
+    return found.text.strip()
+
+
+def _camt_date(element):
+    moment = _text(element, "BookgDt/DtTm") or _text(element, "BookgDt/Dt")
+    if not moment:
+        return None
+    parsed = datetime.datetime.fromisoformat(moment)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _camt_amount(element):
+    amount = _find(element, "Amt")
+    if amount is None:
+        amount = _find(element, "AmtDtls/TxAmt/Amt")
+    if amount is None or amount.text is None:
+        return None, None
+    return Decimal(amount.text.strip()), amount.get("Ccy")
+
+
+def _camt_transaction_line(entry, transaction_details, booked_on, credit):
+    amount, currency = _camt_amount(transaction_details)
+    if amount is None:
+        amount, currency = _camt_amount(entry)
+
+    counterparty = "Dbtr" if credit else "Cdtr"
+    return StatementLine(
+        amount=amount,
+        currency=currency,
+        credit=credit,
+        booked_on=booked_on,
+        bank_reference=(
+            _text(transaction_details, "Refs/AcctSvcrRef")
+            or _text(entry, "AcctSvcrRef")
+            or _text(transaction_details, "Refs/EndToEndId")
+        ),
+        structured_reference=_text(
+            transaction_details,
+            "RmtInf/Strd/CdtrRefInf/Ref",
+        ),
+        communication=_text(transaction_details, "RmtInf/Ustrd"),
+        counterparty_iban=_text(
+            transaction_details,
+            f"RltdPties/{counterparty}Acct/Id/IBAN",
+        ),
+        counterparty_name=_text(transaction_details, f"RltdPties/{counterparty}/Nm"),
+    )
+
+
+def iter_camt053_lines(source):
+    """
+    Yield the statement lines of a CAMT.053 file. Every processed entry is
+    removed from the tree, so memory stays constant for large statements.
+    """
+    parents = []
+    for event, element in iterparse(source, events=("start", "end")):
+        if event == "start":
+            parents.append(element)
+            continue
+
+        parents.pop()
+        if _local_name(element.tag) != "Ntry":
+            continue
+
+        credit = _text(element, "CdtDbtInd") == "CRDT"
+        booked_on = _camt_date(element)
+        transactions = [
+            child for child in element.iter() if _local_name(child.tag) == "TxDtls"
+        ]
+        if not transactions:
+            transactions = [element]
+        for transaction_details in transactions:
+            yield _camt_transaction_line(
+                element,
+                transaction_details,
+                booked_on,
+                credit,
+            )
+
+        element.clear()
+        if parents:
+            parents[-1].remove(element)
+
+
+def _coda_date(value):
+    if not value.strip("0 "):
+        return None
+    return timezone.make_aware(datetime.datetime.strptime(value, "%d%m%y"))  # noqa: DTZ007
+
+
+def _coda_movement(record, currency):
+    """the first part of a CODA movement record (type 2.1)"""
+    communication = record[62:115]
+    structured_reference = ""
+    if record[61] == "1" and communication[:3] in ("101", "102"):
+        structured_reference = communication[3:15]
+        communication = ""
+
+    bank_reference = record[10:31].strip()
+    if record[6:10] != "0000":
+        bank_reference = f"{bank_reference}/{record[6:10]}"
+
+    return StatementLine(
+        amount=Decimal(int(record[32:47])) / 1000,
+        currency=currency,
+        credit=record[31] == "0",
+        booked_on=_coda_date(record[115:121]),
+        bank_reference=bank_reference,
+        structured_reference=structured_reference,
+        communication=communication.strip(),
+    )
+
+
+def _coda_currency(record):
+    """the currency of the old balance record, its position depends on the
+    structure of the account number"""
+    if record[1] in ("1", "2", "3"):
+        return record[39:42].strip()
+    return record[18:21].strip()
+
+
+def _complete_coda_movement(line, record):
+    """add the parts 2.2 and 2.3 of a movement record"""
+    if record[:2] == "22":
+        line.communication = f"{line.communication}{record[10:63].strip()}"
+    elif record[:2] == "23":
+        line.counterparty_iban = record[10:44].strip()
+        line.counterparty_name = record[47:82].strip()
+        line.communication = f"{line.communication}{record[82:125].strip()}"
+
+
+def iter_coda_lines(source, currency="EUR"):
+    """
+    Yield the statement lines of a Belgian CODA file, one movement at a time.
+    A movement is completed with the counterparty of its 2.3 record, the
+    global movements are skipped in favour of their details.
+    """
+    line = None
+    for raw_record in source:
+        record = raw_record.rstrip("\r\n").ljust(128)
+        record_type = record[:2]
+
+        if record[0] == "1":
+            currency = _coda_currency(record) or currency
+            continue
+
+        if record_type == "21":
+            if line is not None:
+                yield line
+            line = _coda_movement(record, currency)
+            if record[124] != "0" and record[6:10] == "0000":
+                logger.debug("global movement %s, using the details", record[2:6])
+                line = None
+            continue
+
+        if line is not None:
+            _complete_coda_movement(line, record)
+
+    if line is not None:
+        yield line
+
+
+def iter_statement_lines(path):
+    """the lines of a statement on disk, the format follows the extension"""
+    path = Path(path)
+    if path.suffix.lower() in (".cod", ".coda", ".txt"):
+        with path.open(encoding="latin-1") as source:
+            yield from iter_coda_lines(source)
+        return
+
+    with path.open("rb") as source:
+        yield from iter_camt053_lines(source)
+
+
+class ReconciliationReport:
+    """
+    The counts of a reconciliation. Of the ambiguous and the unmatched lines
+    only the first ones are kept, to report them.
+    """
+
+    def __init__(self, sample_size=SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self.matched = 0
+        self.matched_amount = {}
+        self.already_imported = 0
+        self.debits = 0
+        self.ambiguous = 0
+        self.unmatched = 0
+        self.ambiguous_lines = []
+        self.unmatched_lines = []
+
+    def add_match(self, line):
+        self.matched += 1
+        self.matched_amount[line.currency] = (
+            self.matched_amount.get(line.currency, Decimal(0)) + line.amount
+        )
+
+    def add_ambiguous(self, line):
+        self.ambiguous += 1
+        if len(self.ambiguous_lines) < self.sample_size:
+            self.ambiguous_lines.append(line)
+
+    def add_unmatched(self, line):
+        self.unmatched += 1
+        if len(self.unmatched_lines) < self.sample_size:
+            self.unmatched_lines.append(line)
+
+    @property
+    def lines(self):
+        return (
+            self.matched
+            + self.already_imported
+            + self.debits
+            + self.ambiguous
+            + self.unmatched
+        )
+
+    def __str__(self):
+        amounts = ", ".join(
+            str(Money(amount, currency))
+            for currency, amount in self.matched_amount.items()
+        )
+        return (
+            f"{self.lines} lines: {self.matched} matched ({amounts}), "
+            f"{self.ambiguous} ambiguous, {self.unmatched} unmatched, "
+            f"{self.already_imported} already imported, {self.debits} debits"
+        )
+
+
+def _find_payment_requests(lines):
+    """map every reference of the lines to the ids of the payment requests"""
+    plain_references = set()
+    iso11649_references = set()
+    for line in lines:
+        line_plain_references, line_iso11649_references = line.references
+        plain_references |= line_plain_references
+        iso11649_references |= line_iso11649_references
+
+    if not plain_references and not iso11649_references:
+        return {}
+
+    found = {}
+    for (
+        pk,
+        plain_reference,
+        iso11649_reference,
+    ) in payment_models.PaymentRequest.objects.filter(
+        Q(plain_reference__in=plain_references)
+        | Q(structured_reference_sepa__in=iso11649_references),
+    ).values_list("pk", "plain_reference", "structured_reference_sepa"):
+        found.setdefault(plain_reference, set()).add(pk)
+        found.setdefault(iso11649_reference, set()).add(pk)
+    return found
+
+
+def reconcile_lines(lines, report, *, dry_run=False):
+    """match one chunk of credit lines and create their payments in bulk"""
+    already_imported = set(
+        payment_models.EPCMoneyTransferPayment.objects.filter(
+            bank_reference__in={line.import_reference for line in lines},
+        ).values_list("bank_reference", flat=True),
+    )
+    payment_request_ids = _find_payment_requests(lines)
+
+    payments = []
+    for line in lines:
+        if line.import_reference in already_imported:
+            report.already_imported += 1
+            continue
+
+        plain_references, iso11649_references = line.references
+        candidates = set()
+        for reference in plain_references | iso11649_references:
+            candidates |= payment_request_ids.get(reference, set())
+
+        if not candidates:
+            report.add_unmatched(line)
+            continue
+
+        if len(candidates) > 1:
+            report.add_ambiguous(line)
+            continue
+
+        report.add_match(line)
+        payments.append(
+            payment_models.EPCMoneyTransferPayment(
+                payment_request_id=candidates.pop(),
+                paid_amount=line.money,
+                paid_on=line.booked_on,
+                from_iban=line.counterparty_iban or None,
+                bank_reference=line.import_reference,
+                public_key=uuid.uuid4(),
+            ),
+        )
+
+    if payments and not dry_run:
+        bulk_create_multi_table(payment_models.EPCMoneyTransferPayment, payments)
+        # the bulk insert bypasses the signals that keep the ledger up to date
+        payment_models.PaymentRequestBalance.refresh_for_payment_requests(
+            {payment.payment_request_id for payment in payments},
+        )
+        payment_models.PaymentRevenueSummary.refresh_for_payments(payments)
+
+
+def reconcile_statement(lines, *, dry_run=False, chunk_size=CHUNK_SIZE):
+    """
+    Reconcile an iterable of statement lines, chunk by chunk, and return the
+    report of the matched, ambiguous and unmatched lines. Every chunk is
+    committed on its own, a run that stops halfway is started again, as the
+    imported lines are skipped.
+    """
+    report = ReconciliationReport()
+    credit_lines = _credit_lines(lines, report)
+    while chunk := list(islice(credit_lines, chunk_size)):
+        with transaction.atomic():
+            reconcile_lines(chunk, report, dry_run=dry_run)
+
+    logger.info("Bank statement reconciled: %s", report)
+    return report
+
+
+def _credit_lines(lines, report):
+    for line in lines:
+        if line.credit:
+            yield line
+        else:
+            report.debits += 1
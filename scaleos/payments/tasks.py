@@ -0,0 +1,49 @@
+import logging
+
+from celery.exceptions import SoftTimeLimitExceeded
+
+from config import celery_app
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(bind=True, soft_time_limit=60 * 30, max_retries=3)
+def send_payment_reminders(self):
+    from scaleos.payments.reminders import send_payment_reminders
+
+    try:
+        send_payment_reminders()
+
+    except SoftTimeLimitExceeded:
+        # the reminders of the finished batches are stored, the next run
+        # continues with the rest
+        logger.warning("[TIMEOUT] Task exceeded soft time limit.")
+
+
+@celery_app.task(bind=True, soft_time_limit=60 * 5, max_retries=3)
+def process_mollie_webhooks(self):
+    from scaleos.payments import mollie
+
+    try:
+        failed = mollie.process_webhooks()
+
+    except SoftTimeLimitExceeded:
+        # the ids that were popped but not fetched are picked up by
+        # sync_open_mollie_payments
+        logger.warning("[TIMEOUT] Task exceeded soft time limit.")
+        return
+
+    if failed:
+        mollie.requeue_webhooks(failed)
+        raise self.retry(countdown=30 * (self.request.retries + 1))
+
+
+@celery_app.task(bind=True, soft_time_limit=60 * 10, max_retries=3)
+def sync_open_mollie_payments(self):
+    from scaleos.payments import mollie
+
+    try:
+        mollie.sync_open_payments()
+
+    except SoftTimeLimitExceeded:
+        logger.warning("[TIMEOUT] Task exceeded soft time limit.")
@@ -64,6 +64,13 @@ class EPCMoneyTransferPaymentFactory(
         model = payment_models.EPCMoneyTransferPayment
 
 
+class MolliePaymentFactory(
+    DjangoModelFactory[payment_models.MolliePayment],
+):
+    class Meta:
+        model = payment_models.MolliePayment
+
+
 class PriceMatrixItemFactory(
     DjangoModelFactory[payment_models.PriceMatrixItem],
 ):
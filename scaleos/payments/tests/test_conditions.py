@@ -0,0 +1,107 @@
+from datetime import UTC
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from moneyed import EUR
+from moneyed import Money
+
+from scaleos.payments import models as payment_models
+from scaleos.payments.conditions import PaymentConditionPlan
+from scaleos.payments.conditions import ReservationSnapshot
+from scaleos.payments.tests import model_factories as payment_factories
+from scaleos.payments.values import PriceValue
+
+Condition = payment_models.EventReservationPaymentCondition
+
+
+@pytest.mark.django_db
+def test_payment_condition_plan_is_evaluated_without_queries(
+    faker,
+    django_assert_num_queries,
+):
+    settings = payment_factories.EventReservationPaymentSettingsFactory()
+    payment_factories.EventReservationPaymentConditionFactory(
+        event_reservation_payment_settings=settings,
+        prepayment_type=Condition.PrepaymentType.PERCENTAGE_OF_TOTAL_PRICE,
+        percentage_of_total_price=30,
+        to_be_paid_time_amount=1,
+        to_be_paid_interval=Condition.ToBePaidInterval.WEEKS,
+        payment_moment=Condition.PaymentMoment.BEFORE_START_OF_EVENT,
+    )
+    payment_factories.EventReservationPaymentConditionFactory(
+        event_reservation_payment_settings=settings,
+        prepayment_type=Condition.PrepaymentType.REMAINING_PRICE,
+        only_when_group_exceeds=10,
+        to_be_paid_time_amount=2,
+        to_be_paid_interval=Condition.ToBePaidInterval.DAYS,
+        payment_moment=Condition.PaymentMoment.AFTER_END_OF_EVENT,
+    )
+    settings.refresh_from_db()
+
+    plan = settings.get_payment_condition_plan()
+    condition_ids = [condition.condition_id for condition in plan.conditions]
+    snapshot = ReservationSnapshot(
+        event_starting_at=datetime(2025, 6, 10, 18, 0, tzinfo=UTC),
+        event_ending_on=datetime(2025, 6, 10, 23, 0, tzinfo=UTC),
+        total_amount=12,
+        total_price_value=PriceValue({None: (Decimal(100), Decimal(100))}),
+        has_payment_request=True,
+        to_pay=Money(100, EUR),
+        already_paid={"EUR": Money(30, EUR)},
+    )
+    with django_assert_num_queries(0):
+        cached_plan = settings.get_payment_condition_plan()
+        assert [
+            condition.condition_id for condition in cached_plan.conditions
+        ] == condition_ids
+        proposals = plan.evaluate(snapshot)
+
+    assert [
+        (proposal.due_datetime, proposal.to_price().vat_included)
+        for proposal in sorted(proposals, key=lambda proposal: proposal.due_datetime)
+    ] == [
+        (datetime(2025, 6, 3, 18, 0, tzinfo=UTC), Money(30, EUR)),
+        (datetime(2025, 6, 12, 23, 0, tzinfo=UTC), Money(70, EUR)),
+    ]
+
+    snapshot.total_amount = 4
+    assert len(plan.evaluate(snapshot)) == 1
+
+
+@pytest.mark.django_db
+def test_payment_condition_plan_is_compiled_again_after_a_change(faker):
+    settings = payment_factories.EventReservationPaymentSettingsFactory()
+    condition = payment_factories.EventReservationPaymentConditionFactory(
+        event_reservation_payment_settings=settings,
+        prepayment_type=Condition.PrepaymentType.FIXED_PRICE,
+    )
+    settings.refresh_from_db()
+    assert settings.get_payment_condition_plan().conditions[0].fixed_price is None
+
+    payment_factories.PriceFactory(vat_included=Money(25, EUR), unique_origin=condition)
+    settings.refresh_from_db()
+    fixed_price = settings.get_payment_condition_plan().conditions[0].fixed_price
+    assert fixed_price.vat_included == Money(25, EUR)
+
+
+@pytest.mark.django_db
+def test_a_condition_uses_the_cached_plan_of_its_settings(faker, monkeypatch):
+    condition = payment_factories.EventReservationPaymentConditionFactory(
+        payment_moment=Condition.PaymentMoment.AT_START_OF_EVENT,
+    )
+    compiled = []
+    compile_plan = PaymentConditionPlan.compile.__func__
+    monkeypatch.setattr(
+        PaymentConditionPlan,
+        "compile",
+        classmethod(
+            lambda cls, payment_settings: compiled.append(payment_settings.pk)
+            or compile_plan(cls, payment_settings),
+        ),
+    )
+
+    due_dates = {condition.get_due_date(None) for _ in range(3)}
+    assert len(due_dates) == 1
+    assert condition.condition_applicable(None) is True
+    assert compiled == [condition.event_reservation_payment_settings_id]
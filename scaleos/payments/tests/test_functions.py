@@ -42,3 +42,32 @@ def test_iso11649_generation():
 def test_iso11649_too_long():
     with pytest.raises(ValueError):  # noqa: PT011
         ReferenceGenerator.generate_iso11649_reference("A" * 22)
+
+
+def test_structured_references_in_bulk():
+    base_numbers = [0, 96, 97, 1234567, 9_999_999_999]
+    references = ReferenceGenerator.generate_structured_references(
+        base_numbers,
+        decorated=True,
+    )
+    assert references == [
+        ReferenceGenerator.generate_structured_reference(
+            base_number=base_number,
+            decorated=True,
+        )
+        for base_number in base_numbers
+    ]
+    assert ReferenceGenerator.invalid_structured_references(
+        [*references, "+++111/1111/11111+++", "1234567"],
+    ) == ["+++111/1111/11111+++", "1234567"]
+
+    with pytest.raises(ValueError):  # noqa: PT011
+        ReferenceGenerator.generate_structured_references([10_000_000_000])
+
+
+def test_iso11649_references_in_bulk():
+    base_numbers = [1, 539007547034, 1234567]
+    assert ReferenceGenerator.generate_iso11649_references(base_numbers) == [
+        ReferenceGenerator.generate_iso11649_reference(base_number)
+        for base_number in base_numbers
+    ]
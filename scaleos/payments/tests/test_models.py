@@ -1,5 +1,6 @@
 from datetime import UTC
 from datetime import datetime
+from datetime import timedelta
 from decimal import Decimal
 
 import pytest
@@ -12,6 +13,7 @@ from scaleos.events.tests import model_factories as event_factories
 from scaleos.organizations.tests import model_factories as organization_factories
 from scaleos.payments import models as payment_models
 from scaleos.payments.tests import model_factories as payment_factories
+from scaleos.payments.values import PriceValue
 from scaleos.reservations.tests import model_factories as reservation_factories
 
 
@@ -196,6 +198,60 @@ def test_price_history(faker):
     assert price.previous_price
 
 
+@pytest.mark.django_db
+def test_price_history_is_only_written_when_the_price_changes(faker):
+    price = payment_factories.PriceFactory.create()
+    price = payment_models.Price.objects.get(pk=price.pk)
+
+    price.save(update_fields=["organization"])
+    price.save()
+    assert price.history.count() == 1
+
+    price.vat_included = Money(30, EUR)
+    price.save()
+    assert price.history.count() == 2
+
+
+@pytest.mark.django_db
+def test_price_matrix_update_prices(faker, django_assert_max_num_queries):
+    matrix = payment_factories.AgePriceMatrixFactory(name="brunch prijzen 2025")
+    baby = payment_factories.AgePriceMatrixItemFactory(
+        from_age=0,
+        till_age=3,
+        age_price_matrix_id=matrix.pk,
+    )
+    kid = payment_factories.AgePriceMatrixItemFactory(
+        from_age=3,
+        till_age=12,
+        age_price_matrix_id=matrix.pk,
+    )
+    adult = payment_factories.AgePriceMatrixItemFactory(
+        from_age=12,
+        age_price_matrix_id=matrix.pk,
+    )
+    payment_factories.PriceFactory(unique_origin=kid)
+    payment_factories.PriceFactory(unique_origin=adult)
+    unchanged = payment_models.Price.objects.get(
+        unique_origin_object_id=adult.pk,
+    ).value
+
+    with django_assert_max_num_queries(7):
+        updated = matrix.update_prices(
+            {
+                baby.pk: PriceValue({6: (Decimal("5.30"), Decimal(5))}),
+                kid.pk: PriceValue({6: (Decimal("10.60"), Decimal(10))}),
+                adult.pk: unchanged,
+            },
+        )
+
+    assert updated == 2
+    assert baby.current_price.vat_included == Money("5.30", EUR)
+    kid_price = kid.current_price
+    assert kid_price.vat_included == Money("10.60", EUR)
+    assert kid_price.history.count() == 2
+    assert adult.current_price.history.count() == 1
+
+
 @pytest.mark.django_db
 def test_age_price_matrix_item_to_string(faker):
     activate("en")
@@ -736,3 +792,67 @@ def test_price_recalculation_on_vat_line_save(faker):
     assert price.vat_included == Money(121, EUR)
     assert price.vat_excluded == Money(100, EUR)
     assert price.vat == Money(21, EUR)
+
+
+@pytest.mark.django_db
+def test_payment_request_references_are_set_before_the_insert(
+    faker,
+    django_assert_num_queries,
+):
+    payment_request = payment_models.PaymentRequest()
+    with django_assert_num_queries(2):
+        payment_request.save()
+
+    payment_request.refresh_from_db()
+    assert payment_models.ReferenceGenerator.validate_structured_reference(
+        payment_request.structured_reference_be,
+    )
+    assert payment_request.structured_reference_sepa
+
+    payment_requests = [payment_models.PaymentRequest() for _ in range(3)]
+    payment_models.PaymentRequest.set_structured_references_in_bulk(payment_requests)
+    payment_models.PaymentRequest.objects.bulk_create(payment_requests)
+    references = {
+        payment_request.structured_reference_sepa
+        for payment_request in payment_models.PaymentRequest.objects.all()
+    }
+    assert len(references) == 4
+
+
+@pytest.mark.django_db
+def test_payment_request_balance_follows_prices_and_payments(faker):
+    organization = organization_factories.OrganizationFactory()
+    payment_request = payment_factories.PaymentRequestFactory(
+        to_organization=organization,
+    )
+    payment_request.set_price_to_pay(payment_factories.PriceFactory())
+
+    balance = payment_request.balances.get()
+    assert balance.to_pay == Decimal(121)
+    assert balance.remaining == Decimal(121)
+    assert payment_request.fully_paid is False
+
+    payment = payment_factories.EPCMoneyTransferPaymentFactory(
+        payment_request=payment_request,
+        paid_amount=Money(100, EUR),
+    )
+    assert payment_request.still_to_pay == {"EUR": Money(21, EUR)}
+
+    yesterday = timezone.now() - timedelta(days=1)
+    payment_models.PaymentProposal.objects.create(
+        payment_request=payment_request,
+        due_datetime=yesterday,
+    )
+    overdue = payment_models.PaymentRequestBalance.objects.overdue()
+    assert list(overdue.values_list("payment_request_id", flat=True)) == [
+        payment_request.pk,
+    ]
+    assert overdue.total_by_currency() == {"EUR": Money(21, EUR)}
+
+    payment.paid_amount = Money(121, EUR)
+    payment.save()
+    assert payment_request.fully_paid is True
+    assert not payment_models.PaymentRequestBalance.objects.overdue().exists()
+
+    payment.delete()
+    assert payment_request.balances.get().paid == Decimal(0)
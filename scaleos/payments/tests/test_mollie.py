@@ -0,0 +1,83 @@
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+from moneyed import EUR
+from moneyed import Money
+
+from scaleos.payments import models as payment_models
+from scaleos.payments import mollie
+from scaleos.payments.mollie_stub import MollieStubServer
+from scaleos.payments.tests import model_factories as payment_factories
+
+API_KEY = "test_dHar4XY7LxsDOtmnkVtjNVWXLSlXsM"
+
+
+@pytest.fixture
+def mollie_stub(settings):
+    with MollieStubServer() as stub:
+        settings.MOLLIE_API_ENDPOINT = stub.url
+        yield stub
+
+
+def test_mollie_client_retries_and_is_idempotent(mollie_stub):
+    client = mollie.get_client(API_KEY)
+    data = {
+        "amount": {"currency": "EUR", "value": "10.00"},
+        "description": "test",
+        "redirectUrl": "https://example.com/",
+    }
+
+    mollie_stub.fail_next(503, 503)
+    created = client.payments.create(data, idempotency_key="same-key")
+    again = client.payments.create(data, idempotency_key="same-key")
+
+    assert created.id == again.id
+    assert len(mollie_stub.payments) == 1
+    assert len(mollie_stub.requests) == 4
+    assert client.payments.get(created.id).status == "open"
+    assert mollie.get_client(API_KEY) is client
+
+
+def test_mollie_webhook_only_enqueues(client, monkeypatch):
+    enqueued = []
+    monkeypatch.setattr(mollie, "enqueue_webhook", enqueued.append)
+    url = reverse("payments:mollie_webhook")
+
+    assert client.post(url, {"id": "tr_WDqYK6vllg"}).status_code == 200
+    assert client.post(url, {"id": "not a payment"}).status_code == 400
+    assert client.get(url).status_code == 405
+    assert enqueued == ["tr_WDqYK6vllg"]
+
+
+@pytest.mark.django_db
+def test_mollie_payment_status_is_synced_once(mollie_stub):
+    payment_method = payment_factories.MolliePaymentMethodFactory(api_key=API_KEY)
+    payment_request = payment_factories.PaymentRequestFactory()
+
+    payment = mollie.create_payment(
+        payment_method,
+        Money("45.50", EUR),
+        payment_request=payment_request,
+        redirect_url="https://example.com/thanks/",
+    )
+    assert payment.status == payment_models.MolliePayment.Status.OPEN
+    assert payment.checkout_url.startswith(mollie_stub.url)
+    assert mollie.sync_payments([payment.mollie_id]) == []
+    assert not payment_request.balances.filter(paid__gt=0).exists()
+
+    mollie_stub.set_status(payment.mollie_id, "paid")
+    mollie_stub.fail_next(502)
+    assert mollie.sync_payments([payment.mollie_id, payment.mollie_id]) == []
+
+    payment.refresh_from_db()
+    assert payment.status == payment_models.MolliePayment.Status.PAID
+    assert payment.paid_amount == Money("45.50", EUR)
+    assert payment.paid_on is not None
+    assert payment_request.balances.get(currency="EUR").paid == Decimal("45.50")
+
+    # a duplicate or late webhook changes nothing
+    mollie_stub.set_status(payment.mollie_id, "expired")
+    assert mollie.sync_payments([payment.mollie_id]) == []
+    payment.refresh_from_db()
+    assert payment.status == payment_models.MolliePayment.Status.PAID
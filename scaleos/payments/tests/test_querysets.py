@@ -0,0 +1,110 @@
+from datetime import UTC
+from datetime import date
+from datetime import datetime
+
+import pytest
+from moneyed import EUR
+from moneyed import USD
+from moneyed import Money
+
+from scaleos.organizations.tests import model_factories as organization_factories
+from scaleos.payments import models as payment_models
+from scaleos.payments.tests import model_factories as payment_factories
+
+
+@pytest.fixture
+def paid_requests(faker):
+    organization = organization_factories.OrganizationFactory()
+    payment_request = payment_factories.PaymentRequestFactory(
+        to_organization=organization,
+    )
+    for paid_on, paid_amount in (
+        (datetime(2025, 1, 6, 10, 0, tzinfo=UTC), Money(100, EUR)),
+        (datetime(2025, 1, 7, 10, 0, tzinfo=UTC), Money(50, EUR)),
+        (datetime(2025, 1, 7, 11, 0, tzinfo=UTC), Money(-20, EUR)),
+        (datetime(2025, 2, 3, 10, 0, tzinfo=UTC), Money(10, USD)),
+    ):
+        payment_factories.EPCMoneyTransferPaymentFactory(
+            payment_request=payment_request,
+            paid_amount=paid_amount,
+            paid_on=paid_on,
+        )
+    return organization
+
+
+@pytest.mark.django_db
+def test_revenue_series_per_month_and_organization(
+    paid_requests,
+    django_assert_num_queries,
+):
+    with django_assert_num_queries(1):
+        series = payment_models.Payment.objects.revenue_series(
+            "month",
+            ["organization"],
+        )
+
+    assert [
+        (row["period"], row["organization"], row["net"], row["payments"])
+        for row in series
+    ] == [
+        (date(2025, 1, 1), paid_requests.pk, Money(130, EUR), 3),
+        (date(2025, 2, 1), paid_requests.pk, Money(10, USD), 1),
+    ]
+    assert series[0]["refunded"] == Money(20, EUR)
+    assert payment_models.PaymentRequest.objects.filter(
+        to_organization=paid_requests,
+    ).total_by_currency() == {"EUR": Money(130, EUR), "USD": Money(10, USD)}
+
+    with pytest.raises(ValueError, match="Unknown dimensions"):
+        payment_models.Payment.objects.revenue_series("month", ["colour"])
+
+
+@pytest.mark.django_db
+def test_year_to_date_from_the_summary_table(settings, faker):
+    settings.PAYMENTS_REVENUE_SUMMARY = True
+    organization = organization_factories.OrganizationFactory()
+    payment_request = payment_factories.PaymentRequestFactory(
+        to_organization=organization,
+    )
+    payment = payment_factories.EPCMoneyTransferPaymentFactory(
+        payment_request=payment_request,
+        paid_amount=Money(100, EUR),
+        paid_on=datetime(2025, 3, 1, 10, 0, tzinfo=UTC),
+    )
+    moment = datetime(2025, 6, 1, tzinfo=UTC)
+
+    assert payment_models.PaymentRevenueSummary.objects.count() == 1
+    assert payment_models.PaymentRevenueSummary.year_to_date(
+        organization.pk,
+        moment,
+    )["EUR"]["net"] == Money(100, EUR)
+
+    payment.paid_on = datetime(2025, 3, 2, 10, 0, tzinfo=UTC)
+    payment.save()
+    assert list(
+        payment_models.PaymentRevenueSummary.objects.values_list("day", flat=True),
+    ) == [date(2025, 3, 2)]
+
+    settings.PAYMENTS_REVENUE_SUMMARY = False
+    assert payment_models.PaymentRevenueSummary.year_to_date(
+        organization.pk,
+        moment,
+    )["EUR"]["net"] == Money(100, EUR)
+
+
+@pytest.mark.django_db
+def test_balances_for_organization(paid_requests):
+    other_request = payment_factories.PaymentRequestFactory(
+        to_organization=organization_factories.OrganizationFactory(),
+    )
+    payment_factories.EPCMoneyTransferPaymentFactory(
+        payment_request=other_request,
+        paid_amount=Money(5, EUR),
+        paid_on=datetime(2025, 1, 6, 10, 0, tzinfo=UTC),
+    )
+
+    balances = payment_models.PaymentRequestBalance.objects.for_organization(
+        paid_requests,
+    )
+    assert {balance.currency for balance in balances} == {"EUR", "USD"}
+    assert not balances.filter(payment_request=other_request).exists()
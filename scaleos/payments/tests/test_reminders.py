@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from scaleos.notifications import models as notification_models
+from scaleos.payments import models as payment_models
+from scaleos.payments import reminders
+from scaleos.payments.reminders import send_payment_reminders
+from scaleos.payments.tests import model_factories as payment_factories
+from scaleos.reservations.tests import model_factories as reservation_factories
+
+
+@pytest.mark.django_db
+def test_payment_reminders_are_grouped_and_sent_once_a_day(faker):
+    reservation = reservation_factories.ReservationFactory()
+    payment_request = payment_factories.PaymentRequestFactory(
+        to_organization=reservation.organization,
+    )
+    payment_request.set_price_to_pay(payment_factories.PriceFactory())
+    reservation.payment_request = payment_request
+    reservation.save()
+
+    now = timezone.now()
+    for due_datetime in (now - timedelta(days=2), now + timedelta(days=1)):
+        payment_models.PaymentProposal.objects.create(
+            payment_request=payment_request,
+            price=payment_factories.PriceFactory(),
+            due_datetime=due_datetime,
+        )
+    payment_models.PaymentProposal.objects.create(
+        payment_request=payment_request,
+        due_datetime=now + timedelta(days=60),
+    )
+
+    # the proposals of one user and organization span the batches
+    assert send_payment_reminders(now, batch_size=1) == 1
+    assert send_payment_reminders(now) == 0
+    assert payment_models.PaymentReminder.objects.count() == 2
+
+    notification = notification_models.UserNotification.objects.filter(
+        to_user=reservation.user,
+        notification_type=notification_models.Notification.NotificationType.PAYMENT_DUE_REMINDER,
+    ).first()
+    assert notification is not None
+    assert notification.payment_reminders.count() == 2
+
+    assert send_payment_reminders(now + timedelta(days=1)) == 1
+
+
+@pytest.mark.django_db
+def test_a_large_group_of_payment_reminders_is_split(monkeypatch):
+    monkeypatch.setattr(reminders, "MAX_GROUP_SIZE", 1)
+    reservation = reservation_factories.ReservationFactory()
+    payment_request = payment_factories.PaymentRequestFactory(
+        to_organization=reservation.organization,
+    )
+    payment_request.set_price_to_pay(payment_factories.PriceFactory())
+    reservation.payment_request = payment_request
+    reservation.save()
+
+    now = timezone.now()
+    for due_datetime in (now - timedelta(days=2), now + timedelta(days=1)):
+        payment_models.PaymentProposal.objects.create(
+            payment_request=payment_request,
+            price=payment_factories.PriceFactory(),
+            due_datetime=due_datetime,
+        )
+
+    assert send_payment_reminders(now, batch_size=1) == 2
+    assert not payment_models.PaymentReminder.objects.filter(
+        notification__isnull=True,
+    ).exists()
@@ -0,0 +1,181 @@
+import io
+from decimal import Decimal
+
+import pytest
+from moneyed import EUR
+from moneyed import Money
+
+from scaleos.payments import models as payment_models
+from scaleos.payments.functions import ReferenceGenerator
+from scaleos.payments.statements import StatementLine
+from scaleos.payments.statements import _coda_currency
+from scaleos.payments.statements import iter_camt053_lines
+from scaleos.payments.statements import iter_coda_lines
+from scaleos.payments.statements import reconcile_statement
+from scaleos.payments.tests import model_factories as payment_factories
+
+CAMT053 = """<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:camt.053.001.02">
+  <BkToCstmrStmt>
+    <Stmt>
+      <Ntry>
+        <Amt Ccy="EUR">45.50</Amt>
+        <CdtDbtInd>CRDT</CdtDbtInd>
+        <BookgDt><Dt>2025-03-01</Dt></BookgDt>
+        <AcctSvcrRef>BANK-001</AcctSvcrRef>
+        <NtryDtls>
+          <TxDtls>
+            <RltdPties>
+              <Dbtr><Nm>Jane Doe</Nm></Dbtr>
+              <DbtrAcct><Id><IBAN>BE68539007547034</IBAN></Id></DbtrAcct>
+            </RltdPties>
+            <RmtInf>
+              <Strd><CdtrRefInf><Ref>{reference}</Ref></CdtrRefInf></Strd>
+            </RmtInf>
+          </TxDtls>
+        </NtryDtls>
+      </Ntry>
+      <Ntry>
+        <Amt Ccy="EUR">10.00</Amt>
+        <CdtDbtInd>DBIT</CdtDbtInd>
+        <BookgDt><Dt>2025-03-02</Dt></BookgDt>
+        <AcctSvcrRef>BANK-002</AcctSvcrRef>
+        <NtryDtls><TxDtls><RmtInf><Ustrd>bank costs</Ustrd></RmtInf></TxDtls></NtryDtls>
+      </Ntry>
+    </Stmt>
+  </BkToCstmrStmt>
+</Document>
+"""
+
+
+def coda_movement(sequence, amount_in_cents, communication, *, structured=False):
+    record = (
+        f"21{sequence:04}0000"
+        f"{'BANKREF' + str(sequence):<21}"
+        "0"
+        f"{amount_in_cents * 10:015}"
+        "010325"
+        "00150000"
+        f"{'1' if structured else '0'}"
+        f"{communication:<53}"
+        "010325"
+        "001"
+        "0"
+        "1"
+        " "
+        "0"
+    )
+    assert len(record) == 128
+    return record
+
+
+def coda_counterparty(sequence, iban, name):
+    record = f"23{sequence:04}0000{iban:<37}{name:<35}{'':<43}0 0"
+    assert len(record) == 128
+    return record
+
+
+def test_camt053_lines_are_streamed():
+    reference = ReferenceGenerator.generate_structured_reference(1234, decorated=True)
+    lines = list(
+        iter_camt053_lines(io.BytesIO(CAMT053.format(reference=reference).encode())),
+    )
+
+    assert len(lines) == 2
+    assert lines[0].credit is True
+    assert lines[0].money == Money("45.50", EUR)
+    assert lines[0].bank_reference == "BANK-001"
+    assert lines[0].counterparty_iban == "BE68539007547034"
+    assert lines[0].references == ({ReferenceGenerator.to_plain(reference)}, set())
+    assert lines[1].credit is False
+    assert lines[1].communication == "bank costs"
+
+
+def test_coda_lines_are_streamed():
+    reference = ReferenceGenerator.to_plain(
+        ReferenceGenerator.generate_structured_reference(1234),
+    )
+    records = [
+        "0" * 128,
+        coda_movement(1, 4550, f"101{reference}", structured=True),
+        coda_counterparty(1, "BE68539007547034", "Jane Doe"),
+        coda_movement(2, 1000, "invoice RF18539007547034 thanks"),
+    ]
+    lines = list(iter_coda_lines(io.StringIO("\n".join(records))))
+
+    assert len(lines) == 2
+    assert lines[0].amount == Decimal("45.50")
+    assert lines[0].structured_reference == reference
+    assert lines[0].counterparty_name == "Jane Doe"
+    assert lines[1].references == (set(), {"RF18539007547034"})
+
+
+def test_coda_currency_follows_the_account_structure():
+    belgian = ("10" + "0" * 16 + "EUR").ljust(128)
+    foreign = ("11" + "0" * 37 + "USD").ljust(128)
+
+    assert _coda_currency(belgian) == "EUR"
+    assert _coda_currency(foreign) == "USD"
+
+
+@pytest.mark.django_db
+def test_reconcile_statement():
+    payment_request = payment_factories.PaymentRequestFactory()
+    payment_request.refresh_from_db()
+
+    def statement():
+        yield StatementLine(
+            amount=Decimal("45.50"),
+            currency="EUR",
+            credit=True,
+            bank_reference="BANK-001",
+            structured_reference=payment_request.structured_reference_be,
+        )
+        yield StatementLine(
+            amount=Decimal(10),
+            currency="EUR",
+            credit=True,
+            bank_reference="BANK-002",
+            communication="no reference at all",
+        )
+        yield StatementLine(
+            amount=Decimal(10),
+            currency="EUR",
+            credit=False,
+            bank_reference="BANK-003",
+        )
+
+    report = reconcile_statement(statement())
+
+    assert report.matched == 1
+    assert report.unmatched == 1
+    assert report.unmatched_lines[0].bank_reference == "BANK-002"
+    assert report.debits == 1
+    payment = payment_models.EPCMoneyTransferPayment.objects.get()
+    assert payment.payment_request_id == payment_request.pk
+    assert payment.paid_amount == Money("45.50", EUR)
+
+    report = reconcile_statement(statement())
+    assert report.already_imported == 1
+    assert payment_models.EPCMoneyTransferPayment.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_a_line_without_bank_reference_is_imported_once():
+    payment_request = payment_factories.PaymentRequestFactory()
+    payment_request.refresh_from_db()
+
+    def statement():
+        yield StatementLine(
+            amount=Decimal("45.50"),
+            currency="EUR",
+            credit=True,
+            counterparty_iban="BE68539007547034",
+            structured_reference=payment_request.structured_reference_be,
+        )
+
+    assert reconcile_statement(statement()).matched == 1
+    report = reconcile_statement(statement())
+    assert report.matched == 0
+    assert report.already_imported == 1
+    assert payment_models.EPCMoneyTransferPayment.objects.count() == 1
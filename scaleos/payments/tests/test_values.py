@@ -0,0 +1,72 @@
+import pickle
+from decimal import Decimal
+
+import pytest
+from moneyed import EUR
+from moneyed import USD
+from moneyed import Money
+
+from scaleos.payments import models as payment_models
+from scaleos.payments.values import PriceValue
+
+
+def test_price_values_are_summed_per_vat_percentage():
+    food = PriceValue({6: (Decimal("10.60"), Decimal(10))})
+    drinks = PriceValue({21: (Decimal("12.10"), Decimal(10))})
+    more_food = PriceValue({6: (Decimal("21.20"), Decimal(20))})
+
+    total = PriceValue.sum([food, drinks, None, more_food])
+
+    assert total == food + drinks + more_food
+    assert total.vat_included == Money("43.90", EUR)
+    assert total.vat_excluded == Money(40, EUR)
+    assert total.vat == Money("3.90", EUR)
+    assert total.vat_lines == {
+        6: (Money("31.80", EUR), Money(30, EUR)),
+        21: (Money("12.10", EUR), Money(10, EUR)),
+    }
+
+
+def test_price_value_multiply_and_percentage():
+    a_price = PriceValue({21: (Decimal(121), Decimal(100))})
+
+    assert a_price.multiply(3).vat_included == Money(363, EUR)
+    assert a_price.percentage(50).vat_excluded == Money(50, EUR)
+    assert a_price.vat_included == Money(121, EUR)
+
+
+def test_price_value_is_immutable():
+    a_price = PriceValue.zero()
+
+    assert not a_price
+    with pytest.raises(AttributeError):
+        a_price.currency = USD
+
+
+def test_price_values_with_other_currencies_cannot_be_summed():
+    with pytest.raises(TypeError):
+        PriceValue.sum(
+            [
+                PriceValue({None: (1, 1)}, EUR),
+                PriceValue({None: (1, 1)}, USD),
+            ],
+        )
+
+
+def test_price_value_becomes_an_unsaved_price():
+    a_price = payment_models.Price(
+        vat_included=Money(121, EUR),
+        vat_excluded=Money(100, EUR),
+    )
+
+    doubled = a_price.value.multiply(2).to_price()
+
+    assert doubled.pk is None
+    assert doubled.vat_included == Money(242, EUR)
+    assert doubled.vat == Money(42, EUR)
+
+
+def test_price_value_can_be_pickled():
+    a_price = PriceValue({6: (Decimal("10.60"), Decimal(10))})
+
+    assert pickle.loads(pickle.dumps(a_price)) == a_price  # noqa: S301
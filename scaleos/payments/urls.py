@@ -0,0 +1,12 @@
+from django.urls import path
+
+from scaleos.payments import views as payment_views
+
+app_name = "payments"
+urlpatterns = [
+    path(
+        "mollie/webhook/",
+        view=payment_views.mollie_webhook,
+        name="mollie_webhook",
+    ),
+]
@@ -0,0 +1,199 @@
+"""
+Price arithmetic without the ORM.
+
+A PriceValue is an immutable amount, split per VAT percentage, so totals of
+reservation lines, percentages and multiplications are plain arithmetic.
+It only becomes a Price row when it needs to be persisted.
+"""
+
+import logging
+from decimal import Decimal
+
+from moneyed import EUR
+from moneyed import Money
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal(0)
+
+
+class PriceValue:
+    """
+    The VAT included and VAT excluded amounts of a price, grouped by VAT
+    percentage. The VAT percentage is None when it is unknown,
+    e.g. for a price without VAT lines.
+    """
+
+    __slots__ = ("_lines", "currency")
+
+    def __init__(self, lines=None, currency=EUR):
+        """lines maps a VAT percentage to a (vat included, vat excluded) tuple"""
+        lines = lines or {}
+        object.__setattr__(self, "currency", currency)
+        object.__setattr__(
+            self,
+            "_lines",
+            tuple(
+                sorted(
+                    (
+                        (percentage, Decimal(included), Decimal(excluded))
+                        for percentage, (included, excluded) in lines.items()
+                    ),
+                    key=lambda line: (line[0] is not None, line[0] or 0),
+                ),
+            ),
+        )
+
+    def __setattr__(self, name, value):
+        msg = f"{self.__class__.__name__} is immutable"
+        raise AttributeError(msg)
+
+    def __delattr__(self, name):
+        msg = f"{self.__class__.__name__} is immutable"
+        raise AttributeError(msg)
+
+    def __reduce__(self):
+        # the immutable attributes cannot be restored one by one
+        return (
+            PriceValue,
+            (
+                {
+                    percentage: (included, excluded)
+                    for percentage, included, excluded in self._lines
+                },
+                self.currency,
+            ),
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, PriceValue):
+            return NotImplemented
+        return self.currency == other.currency and self._lines == other._lines
+
+    def __hash__(self):
+        return hash((self.currency, self._lines))
+
+    def __repr__(self):
+        return f"<PriceValue {self.vat_included} ({len(self._lines)} VAT lines)>"
+
+    def __bool__(self):
+        return any(included or excluded for _, included, excluded in self._lines)
+
+    def __add__(self, other):
+        if not isinstance(other, PriceValue):
+            return NotImplemented
+        return PriceValue.sum([self, other])
+
+    def __radd__(self, other):
+        # sum() starts with 0
+        if other == 0:
+            return self
+        return NotImplemented
+
+    @classmethod
+    def zero(cls, currency=EUR):
+        return cls(currency=currency)
+
+    @classmethod
+    def from_price(cls, price):
+        """
+        Read the amounts of a Price row. The VAT lines are only used when they
+        are prefetched, so this never queries the database.
+        """
+        if price is None:
+            return cls.zero()
+
+        currency = EUR
+        if price.vat_included is not None:
+            currency = price.vat_included.currency
+
+        prefetched = getattr(price, "_prefetched_objects_cache", {})
+        vat_lines = prefetched.get("vat_lines")
+        if vat_lines:
+            lines = {}
+            for vat_line in vat_lines:
+                included, excluded = lines.get(vat_line.vat_percentage, (ZERO, ZERO))
+                lines[vat_line.vat_percentage] = (
+                    included + _amount(vat_line.vat_included),
+                    excluded + _amount(vat_line.vat_excluded),
+                )
+            return cls(lines, currency)
+
+        return cls(
+            {None: (_amount(price.vat_included), _amount(price.vat_excluded))},
+            currency,
+        )
+
+    @classmethod
+    def sum(cls, values):
+        """Add up all the values in one pass, per VAT percentage."""
+        lines = {}
+        currency = None
+        for value in values:
+            if value is None:
+                continue
+            if currency is None:
+                currency = value.currency
+            elif value.currency != currency:
+                msg = f"Cannot add {value.currency} to {currency}"
+                raise TypeError(msg)
+            for percentage, included, excluded in value._lines:  # noqa: SLF001
+                total_included, total_excluded = lines.get(percentage, (ZERO, ZERO))
+                lines[percentage] = (
+                    total_included + included,
+                    total_excluded + excluded,
+                )
+        return cls(lines, currency or EUR)
+
+    def multiply(self, factor):
+        factor = Decimal(str(factor))
+        return PriceValue(
+            {
+                percentage: (included * factor, excluded * factor)
+                for percentage, included, excluded in self._lines
+            },
+            self.currency,
+        )
+
+    def percentage(self, percentage):
+        return self.multiply(Decimal(str(percentage)) / 100)
+
+    @property
+    def vat_included(self):
+        return Money(sum((line[1] for line in self._lines), ZERO), self.currency)
+
+    @property
+    def vat_excluded(self):
+        return Money(sum((line[2] for line in self._lines), ZERO), self.currency)
+
+    @property
+    def vat(self):
+        return self.vat_included - self.vat_excluded
+
+    @property
+    def vat_lines(self):
+        """The VAT included and VAT excluded money per VAT percentage."""
+        return {
+            percentage: (
+                Money(included, self.currency),
+                Money(excluded, self.currency),
+            )
+            for percentage, included, excluded in self._lines
+        }
+
+    def to_price(self, **kwargs):
+        """A new, unsaved Price with these amounts."""
+        from scaleos.payments.models import Price
+
+        return Price(
+            vat_included=self.vat_included,
+            vat_excluded=self.vat_excluded,
+            vat=self.vat,
+            **kwargs,
+        )
+
+
+def _amount(money):
+    if money is None:
+        return ZERO
+    return money.amount
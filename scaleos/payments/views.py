@@ -1 +1,28 @@
-# Create your views here.
+import logging
+
+from django.db import transaction
+from django.http import HttpResponse
+from django.http import HttpResponseBadRequest
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from scaleos.payments import mollie
+
+logger = logging.getLogger(__name__)
+
+
+@csrf_exempt
+@require_POST
+@transaction.non_atomic_requests
+def mollie_webhook(request):
+    """
+    Mollie calls this on every status change of a payment. Only the id is
+    queued, a worker fetches the status, so the database is not touched.
+    When the queue is unavailable the error makes Mollie retry later.
+    """
+    mollie_id = request.POST.get("id", "")
+    if not mollie.MOLLIE_ID.match(mollie_id):
+        return HttpResponseBadRequest()
+
+    mollie.enqueue_webhook(mollie_id)
+    return HttpResponse()
@@ -122,7 +122,7 @@ class ReservationAdmin(PolymorphicInlineSupportMixin, PolymorphicParentModelAdmi
         reservation_models.Reservation,  # Delete once a submodel has been added.
         reservation_models.EventReservation,
     ]
-    list_filter = [PolymorphicChildModelFilter]
+    list_filter = [PolymorphicChildModelFilter, "confirmation_state"]
     readonly_fields = [
         "created_on",
         "modified_on",
@@ -261,3 +261,30 @@ class ReservationSettingsAdmin(PolymorphicParentModelAdmin):
 class EventReservationSettingsAdmin(PolymorphicChildModelAdmin):
     base_model = reservation_models.ReservationSettings  # Explicitly set here!
     # define custom features here
+
+
+class EventReservationSummaryItemInlineAdmin(admin.TabularInline):
+    model = reservation_models.EventReservationSummaryItem
+    extra = 0
+    readonly_fields = ["price_matrix_item", "confirmed_spots", "pending_spots"]
+
+
+@admin.register(reservation_models.EventReservationSummary)
+class EventReservationSummaryAdmin(admin.ModelAdmin):
+    inlines = [EventReservationSummaryItemInlineAdmin]
+    readonly_fields = [
+        "event",
+        "confirmed_spots",
+        "pending_spots",
+        "waitinglist_spots",
+        "waitinglist_size",
+        "modified_on",
+    ]
+    list_display = [
+        "event",
+        "confirmed_spots",
+        "pending_spots",
+        "waitinglist_spots",
+        "waitinglist_size",
+        "modified_on",
+    ]
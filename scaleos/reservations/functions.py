@@ -1,6 +1,19 @@
 import logging
+import uuid
+from itertools import groupby
 
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Q
+from django.db.models import prefetch_related_objects
+from django.utils.translation import gettext_lazy as _
+
+from scaleos.notifications import models as notification_models
+from scaleos.payments import models as payment_models
 from scaleos.reservations import models as reservation_models
+from scaleos.shared import clock
+from scaleos.shared.functions import bulk_create_multi_table
+from scaleos.users.models import User
 
 logger = logging.getLogger(__name__)
 
@@ -30,3 +43,353 @@ def get_organization_id_from_reservation(reservation):
 
     logger.warning("We cannot get the organization from the reservation")
     return None
+
+
+def confirm_open_reservations(user_id):  # noqa: C901
+    """
+    Confirm all open reservations of a user at once, e.g. right after the
+    user verified the email address: the transitions are decided in memory,
+    the updates are inserted in bulk and the user gets one notification.
+    """
+    ConfirmationState = reservation_models.Reservation.ConfirmationState  # noqa: N806
+    RejectReason = reservation_models.OrganizationTemporarilyRejected.RejectReason  # noqa: N806
+    user = User.objects.get(pk=user_id)
+    its_now = clock.now()
+    reservations = list(
+        reservation_models.Reservation.objects.filter(
+            Q(user_id=user_id)
+            & (Q(expired_on__isnull=True) | Q(expired_on__gt=its_now)),
+        )
+        .select_related("organization")
+        .prefetch_related("lines")
+        .order_by("pk"),
+    )
+    event_reservations = [
+        reservation
+        for reservation in reservations
+        if isinstance(reservation, reservation_models.EventReservation)
+    ]
+    prefetch_related_objects(event_reservations, "event")
+    email_verified = user.is_email_verified
+
+    updates = []
+    confirmed_reservations = []
+    waiting_reservations = []
+    with transaction.atomic():
+        for reservation in reservations:
+            if reservation.requester_state != ConfirmationState.CONFIRMED:
+                reservation.requester_state = ConfirmationState.CONFIRMED
+                updates.append(
+                    reservation_models.RequesterConfirm(
+                        reservation=reservation,
+                        send_notification=False,
+                    ),
+                )
+
+            if (
+                email_verified
+                and isinstance(reservation, reservation_models.EventReservation)
+                and reservation.event is not None
+                and reservation.organization_id is not None
+                and reservation.organization_state != ConfirmationState.CONFIRMED
+                and not reservation.is_in_waiting_list
+            ):
+                if reservation.claim_spots():
+                    reservation.organization_state = ConfirmationState.CONFIRMED
+                    updates.append(
+                        reservation_models.OrganizationConfirm(
+                            reservation=reservation,
+                            send_notification=False,
+                        ),
+                    )
+                else:
+                    logger.info("Event of reservation %s is full", reservation.pk)
+                    reservation.on_waitinglist_since = its_now
+                    waiting_reservations.append(reservation)
+                    updates.append(
+                        reservation_models.OrganizationTemporarilyRejected(
+                            reservation=reservation,
+                            send_notification=False,
+                            reason=RejectReason.EVENT_FULL,
+                        ),
+                    )
+
+            was_confirmed = reservation.is_confirmed
+            reservation.confirmation_state = reservation.combine_confirmation_states(
+                reservation.organization_state,
+                reservation.requester_state,
+            )
+            if (
+                reservation.confirmation_state == ConfirmationState.CONFIRMED
+                and not was_confirmed
+            ):
+                reservation.confirmed_on = its_now
+                confirmed_reservations.append(reservation)
+
+        for update_class, class_updates in groupby(
+            sorted(updates, key=lambda update: type(update).__name__),
+            key=type,
+        ):
+            bulk_create_multi_table(update_class, list(class_updates))
+
+        reservation_models.Reservation.objects.bulk_update(
+            reservations,
+            [
+                "requester_state",
+                "organization_state",
+                "confirmation_state",
+                "confirmed_on",
+                "on_waitinglist_since",
+            ],
+        )
+
+        for reservation in confirmed_reservations:
+            if isinstance(reservation, reservation_models.EventReservation):
+                reservation.sync_claimed_spots()
+        update_payment_requests(confirmed_reservations)
+
+        for reservation in event_reservations:
+            reservation.refresh_summary()
+
+        if confirmed_reservations or waiting_reservations:
+            transaction.on_commit(
+                lambda: notify_confirmed_reservations(
+                    user,
+                    confirmed_reservations,
+                    waiting_reservations,
+                ),
+            )
+
+    logger.info(
+        "%s reservations checked, %s confirmed, %s on the waitinglist",
+        len(reservations),
+        len(confirmed_reservations),
+        len(waiting_reservations),
+    )
+    return confirmed_reservations
+
+
+def notify_confirmed_reservations(user, confirmed_reservations, waiting_reservations):
+    lines = [str(reservation) for reservation in confirmed_reservations]
+    if waiting_reservations:
+        lines.append(str(_("on the waitinglist")).capitalize() + ":")
+        lines.extend(str(reservation) for reservation in waiting_reservations)
+
+    organization_ids = {
+        reservation.organization_id
+        for reservation in [*confirmed_reservations, *waiting_reservations]
+    }
+    notification_models.UserNotification.objects.create(
+        sending_organization_id=(
+            organization_ids.pop() if len(organization_ids) == 1 else None
+        ),
+        to_user=user,
+        title=str(_("your reservations have been updated")).capitalize(),
+        message="\n".join(lines),
+    )
+
+
+def update_payment_requests(reservations):
+    """
+    Create or update the payment requests of many reservations at once,
+    e.g. when an organization confirms a whole group event: the totals, the
+    prices to pay, the structured references and the payment proposals are
+    written with a fixed number of bulk statements.
+    """
+    reservations = [reservation for reservation in reservations if reservation.pk]
+    prefetch_related_objects(reservations, "lines", "payment_request")
+    current_prices = payment_models.PriceMatrixItem.get_current_prices(
+        {
+            line.price_matrix_item_id
+            for reservation in reservations
+            for line in reservation.lines.all()
+            if line.price_matrix_item_id is not None
+        },
+    )
+
+    totals = {}
+    for reservation in reservations:
+        total_price_value = reservation.get_total_price_value(current_prices)
+        if total_price_value.vat_included.amount == 0:
+            logger.info("No total price for the reservation %s", reservation.pk)
+            continue
+        totals[reservation] = total_price_value
+
+    if not totals:
+        return []
+
+    prefetch_related_objects(
+        [
+            reservation
+            for reservation in totals
+            if isinstance(reservation, reservation_models.EventReservation)
+        ],
+        "event__event_reservation_payment_settings",
+        "event__concept__event_reservation_payment_settings",
+    )
+
+    with transaction.atomic():
+        payment_requests = create_payment_requests(totals)
+        store_prices_to_pay(totals)
+        store_payment_proposals(totals)
+        # the bulk statements bypass the signals that keep the ledger up to date
+        payment_models.PaymentRequestBalance.refresh_for_payment_requests(
+            [payment_request.pk for payment_request in payment_requests],
+        )
+
+    logger.info("%s payment requests updated", len(payment_requests))
+    return payment_requests
+
+
+def create_payment_requests(totals):
+    new_payment_requests = []
+    existing_payment_requests = []
+    new_reservations = []
+    for reservation in totals:
+        payment_request = reservation.payment_request
+        if payment_request is None:
+            payment_request = payment_models.PaymentRequest(public_key=uuid.uuid4())
+            new_payment_requests.append(payment_request)
+            new_reservations.append(reservation)
+        else:
+            existing_payment_requests.append(payment_request)
+
+        if reservation.organization_id:
+            payment_request.to_organization_id = reservation.organization_id
+
+        payment_request.origin = reservation
+        payment_settings = reservation.applicable_payment_settings
+        if payment_settings:
+            payment_request.payment_settings = payment_settings
+        reservation.payment_request = payment_request
+
+    payment_models.PaymentRequest.set_structured_references_in_bulk(
+        new_payment_requests,
+    )
+    payment_models.PaymentRequest.objects.bulk_create(new_payment_requests)
+
+    payment_models.PaymentRequest.objects.bulk_update(
+        existing_payment_requests,
+        [
+            "to_organization",
+            "payment_settings",
+            "origin_content_type",
+            "origin_object_id",
+        ],
+    )
+
+    for reservation in new_reservations:
+        reservation.payment_request_id = reservation.payment_request.pk
+    reservation_models.Reservation.objects.bulk_update(
+        new_reservations,
+        ["payment_request"],
+    )
+    return [reservation.payment_request for reservation in totals]
+
+
+def store_prices_to_pay(totals):
+    content_type = ContentType.objects.get_for_model(payment_models.PaymentRequest)
+    existing_prices = {
+        price.unique_origin_object_id: price
+        for price in payment_models.Price.objects.filter(
+            unique_origin_content_type=content_type,
+            unique_origin_object_id__in=[
+                reservation.payment_request_id for reservation in totals
+            ],
+        )
+    }
+
+    prices = []
+    for reservation, total_price_value in totals.items():
+        price = existing_prices.get(reservation.payment_request_id)
+        if price is None:
+            price = total_price_value.to_price(
+                unique_origin_content_type=content_type,
+                unique_origin_object_id=reservation.payment_request_id,
+                organization_id=reservation.organization_id,
+            )
+        else:
+            price.set_value(total_price_value)
+        prices.append(price)
+
+    payment_models.Price.bulk_store(prices)
+
+
+def get_requested_payments(totals):
+    """the payment request, condition proposal and price of each proposal"""
+    requested = []
+    for reservation, total_price_value in totals.items():
+        payment_settings = reservation.applicable_payment_settings
+        if payment_settings is None:
+            logger.info("no payment settings to apply")
+            continue
+
+        if not isinstance(
+            reservation,
+            reservation_models.EventReservation,
+        ) or not isinstance(
+            payment_settings,
+            payment_models.EventReservationPaymentSettings,
+        ):
+            msg = _("%s has no %s", reservation, payment_settings)
+            raise NotImplementedError(msg)
+
+        plan = payment_settings.get_payment_condition_plan()
+        for proposal in plan.evaluate(plan.snapshot(reservation, total_price_value)):
+            requesting_price = proposal.to_price()
+            requesting_price.organization_id = payment_settings.organization_id
+            requested.append((reservation.payment_request, proposal, requesting_price))
+    return requested
+
+
+def store_payment_proposals(totals):
+    existing_proposals = {
+        (
+            proposal.payment_request_id,
+            proposal.origin_content_type_id,
+            proposal.origin_object_id,
+        ): proposal
+        for proposal in payment_models.PaymentProposal.objects.filter(
+            payment_request_id__in=[
+                reservation.payment_request_id for reservation in totals
+            ],
+        ).select_related("price")
+    }
+
+    new_proposals = []
+    changed_proposals = []
+    for payment_request, condition_proposal, requesting_price in get_requested_payments(
+        totals,
+    ):
+        proposal = existing_proposals.get(
+            (
+                payment_request.pk,
+                condition_proposal.content_type_id,
+                condition_proposal.condition_id,
+            ),
+        )
+        if proposal is None:
+            proposal = payment_models.PaymentProposal(
+                payment_request=payment_request,
+                origin_content_type_id=condition_proposal.content_type_id,
+                origin_object_id=condition_proposal.condition_id,
+            )
+            new_proposals.append(proposal)
+        else:
+            changed_proposals.append(proposal)
+
+        proposal.due_datetime = condition_proposal.due_datetime
+        if proposal.price is None:
+            proposal.price = requesting_price
+        else:
+            proposal.price.set_value(requesting_price.value)
+
+    proposals = new_proposals + changed_proposals
+    payment_models.Price.bulk_store([proposal.price for proposal in proposals])
+    for proposal in proposals:
+        proposal.price_id = proposal.price.pk
+    payment_models.PaymentProposal.objects.bulk_create(new_proposals)
+    payment_models.PaymentProposal.objects.bulk_update(
+        changed_proposals,
+        ["due_datetime", "price"],
+    )
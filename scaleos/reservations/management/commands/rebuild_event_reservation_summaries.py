@@ -0,0 +1,53 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from scaleos.events.models import Event
+from scaleos.reservations.models import EventReservationSummary
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Rebuild the reservation summaries of the events from scratch"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="only report the summaries that drifted, without rebuilding them",
+        )
+
+    def handle(self, *args, **options):
+        check_only = options.get("check")
+        summaries = {
+            summary.event_id: summary
+            for summary in EventReservationSummary.objects.all()
+        }
+        event_ids = Event.objects.filter(reservations__isnull=False).values_list(
+            "id",
+            flat=True,
+        )
+
+        drifted = 0
+        for event_id in sorted(set(event_ids) | set(summaries)):
+            summary = summaries.get(event_id)
+            drifted_fields = (
+                summary.drifted_fields() if summary else ["missing summary"]
+            )
+            if drifted_fields:
+                drifted += 1
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"Event {event_id} drifted: {', '.join(drifted_fields)}",
+                    ),
+                )
+
+            if not check_only:
+                EventReservationSummary.rebuild_for_event(event_id)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{len(summaries)} summaries checked, {drifted} drifted",
+            ),
+        )
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.12 on 2026-10-18 12:19
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def store_claimed_spots(apps, schema_editor):
+    """the confirmed event reservations already added their amount to the event"""
+    Reservation = apps.get_model("reservations", "Reservation")
+    ReservationLine = apps.get_model("reservations", "ReservationLine")
+
+    line_totals = (
+        ReservationLine.objects.filter(reservation_id=OuterRef("pk"))
+        .order_by()
+        .values("reservation_id")
+        .annotate(total=Sum("amount"))
+        .values("total")
+    )
+    Reservation.objects.filter(
+        eventreservation__isnull=False,
+        confirmed_on__isnull=False,
+    ).update(
+        claimed_spots=Coalesce(Subquery(line_totals), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0078_remove_reservationsettings_requester_updates_allowed_until_interval_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='claimed_spots',
+            field=models.IntegerField(default=0, editable=False, help_text='the spots of the event that are held for this reservation', verbose_name='claimed spots'),
+        ),
+        migrations.RunPython(store_claimed_spots, migrations.RunPython.noop),
+    ]
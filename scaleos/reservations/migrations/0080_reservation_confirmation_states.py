@@ -0,0 +1,89 @@
+# Generated by Django 5.0.12 on 2026-10-18 12:29
+
+from django.db import migrations, models
+
+ORGANIZATION_STATES = {
+    "organizationconfirm": "CONFIRMED",
+    "organizationrefuse": "REFUSED",
+    "organizationcancel": "CANCELED",
+}
+REQUESTER_STATES = {
+    "requesterconfirm": "CONFIRMED",
+    "requestercancel": "CANCELED",
+}
+
+
+def combine_confirmation_states(organization_state, requester_state):
+    if organization_state == "CONFIRMED" and requester_state == "CONFIRMED":
+        return "CONFIRMED"
+    if organization_state in ("REFUSED", "CANCELED"):
+        return organization_state
+    if requester_state == "CANCELED":
+        return requester_state
+    return "PENDING"
+
+
+def store_confirmation_states(apps, schema_editor):
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    Reservation = apps.get_model("reservations", "Reservation")
+    ReservationUpdate = apps.get_model("reservations", "ReservationUpdate")
+
+    content_types = dict(
+        ContentType.objects.filter(
+            app_label="reservations",
+            model__in=[*ORGANIZATION_STATES, *REQUESTER_STATES],
+        ).values_list("pk", "model"),
+    )
+
+    states = {}
+    updates = (
+        ReservationUpdate.objects.filter(
+            reservation_id__isnull=False,
+            polymorphic_ctype_id__in=content_types,
+        )
+        .order_by("created_on")
+        .values_list("reservation_id", "polymorphic_ctype_id")
+    )
+    for reservation_id, content_type_id in updates.iterator():
+        model = content_types[content_type_id]
+        reservation_states = states.setdefault(
+            reservation_id,
+            {"organization_state": "PENDING", "requester_state": "PENDING"},
+        )
+        if model in ORGANIZATION_STATES:
+            reservation_states["organization_state"] = ORGANIZATION_STATES[model]
+        else:
+            reservation_states["requester_state"] = REQUESTER_STATES[model]
+
+    for reservation_id, reservation_states in states.items():
+        Reservation.objects.filter(pk=reservation_id).update(
+            confirmation_state=combine_confirmation_states(**reservation_states),
+            **reservation_states,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('reservations', '0079_reservation_claimed_spots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='confirmation_state',
+            field=models.CharField(choices=[('PENDING', 'pending'), ('CONFIRMED', 'confirmed'), ('REFUSED', 'refused'), ('CANCELED', 'canceled')], db_index=True, default='PENDING', editable=False, help_text='the state of the reservation for both parties together', max_length=20, verbose_name='confirmation state'),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='organization_state',
+            field=models.CharField(choices=[('PENDING', 'pending'), ('CONFIRMED', 'confirmed'), ('REFUSED', 'refused'), ('CANCELED', 'canceled')], db_index=True, default='PENDING', editable=False, help_text='the state of the latest organization update', max_length=20, verbose_name='organization state'),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='requester_state',
+            field=models.CharField(choices=[('PENDING', 'pending'), ('CONFIRMED', 'confirmed'), ('REFUSED', 'refused'), ('CANCELED', 'canceled')], db_index=True, default='PENDING', editable=False, help_text='the state of the latest requester update', max_length=20, verbose_name='requester state'),
+        ),
+        migrations.RunPython(store_confirmation_states, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.12 on 2026-10-18 12:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0114_eventduplicator_events_skipped'),
+        ('payments', '0126_alter_epcmoneytransferpaymentmethod_options'),
+        ('reservations', '0080_reservation_confirmation_states'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventReservationSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('confirmed_spots', models.IntegerField(default=0, verbose_name='confirmed spots')),
+                ('pending_spots', models.IntegerField(default=0, help_text='the spots of finished reservations waiting for a confirmation', verbose_name='pending spots')),
+                ('waitinglist_spots', models.IntegerField(default=0, verbose_name='waitinglist spots')),
+                ('waitinglist_size', models.IntegerField(default=0, help_text='the number of reservations on the waitinglist', verbose_name='waitinglist size')),
+                ('modified_on', models.DateTimeField(auto_now=True, verbose_name='modified on')),
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reservation_summary', to='events.event', verbose_name='event')),
+            ],
+            options={
+                'verbose_name': 'event reservation summary',
+                'verbose_name_plural': 'event reservation summaries',
+            },
+        ),
+        migrations.CreateModel(
+            name='EventReservationSummaryItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('confirmed_spots', models.IntegerField(default=0, verbose_name='confirmed spots')),
+                ('pending_spots', models.IntegerField(default=0, verbose_name='pending spots')),
+                ('price_matrix_item', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='payments.pricematrixitem', verbose_name='price matrix item')),
+                ('summary', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='reservations.eventreservationsummary', verbose_name='summary')),
+            ],
+            options={
+                'verbose_name': 'event reservation summary item',
+                'verbose_name_plural': 'event reservation summary items',
+            },
+        ),
+    ]
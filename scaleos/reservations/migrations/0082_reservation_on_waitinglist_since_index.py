@@ -0,0 +1,18 @@
+# Generated by Django 5.0.12 on 2026-10-18 12:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0081_eventreservationsummary'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reservation',
+            name='on_waitinglist_since',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='the moment the reservation has been added to the waitinglist', null=True, verbose_name='on waitinglist since'),
+        ),
+    ]
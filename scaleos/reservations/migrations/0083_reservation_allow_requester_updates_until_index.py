@@ -0,0 +1,18 @@
+# Generated by Django 5.0.12 on 2026-10-18 12:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0082_reservation_on_waitinglist_since_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reservation',
+            name='allow_requester_updates_until',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='the moment until the requester can update the reservation', null=True, verbose_name='allow requester updates until'),
+        ),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 5.0.12 on 2026-10-18 13:29
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Case, Count, Sum, Value, When
+
+
+def count_summaries(apps, schema_editor):
+    """
+    The summaries are kept up to date with the changes from now on, so they
+    and the buckets of the reservations are counted once from scratch.
+    """
+    Reservation = apps.get_model("reservations", "Reservation")
+    ReservationLine = apps.get_model("reservations", "ReservationLine")
+    EventReservationSummary = apps.get_model("reservations", "EventReservationSummary")
+    EventReservationSummaryItem = apps.get_model(
+        "reservations", "EventReservationSummaryItem"
+    )
+
+    Reservation.objects.filter(eventreservation__isnull=False).update(
+        summary_bucket=Case(
+            When(confirmed_on__isnull=False, then=Value("confirmed")),
+            When(
+                confirmation_state__in=["REFUSED", "CANCELED"],
+                then=Value("canceled"),
+            ),
+            When(on_waitinglist_since__isnull=False, then=Value("waitinglist")),
+            When(finished_on__isnull=False, then=Value("pending")),
+            default=Value("in_progress"),
+        ),
+    )
+
+    EventReservation = apps.get_model("reservations", "EventReservation")
+    totals = {
+        event_id: {}
+        for event_id in EventReservation.objects.filter(event__isnull=False)
+        .order_by()
+        .values_list("event_id", flat=True)
+        .distinct()
+    }
+    items = defaultdict(dict)
+    for row in (
+        ReservationLine.objects.filter(
+            reservation__summary_bucket__in=["confirmed", "pending", "waitinglist"],
+            reservation__eventreservation__event__isnull=False,
+        )
+        .values(
+            "reservation__eventreservation__event_id",
+            "reservation__summary_bucket",
+            "price_matrix_item_id",
+        )
+        .annotate(spots=Sum("amount"))
+        .order_by()
+    ):
+        event_id = row["reservation__eventreservation__event_id"]
+        field_name = f"{row['reservation__summary_bucket']}_spots"
+        spots = row["spots"] or 0
+        totals[event_id][field_name] = totals[event_id].get(field_name, 0) + spots
+        if field_name != "waitinglist_spots":
+            item = items[event_id].setdefault(row["price_matrix_item_id"], {})
+            item[field_name] = item.get(field_name, 0) + spots
+
+    for row in (
+        Reservation.objects.filter(
+            summary_bucket="waitinglist",
+            eventreservation__event__isnull=False,
+        )
+        .values("eventreservation__event_id")
+        .annotate(size=Count("pk"))
+        .order_by()
+    ):
+        totals[row["eventreservation__event_id"]]["waitinglist_size"] = row["size"]
+
+    EventReservationSummary.objects.all().delete()
+    summaries = EventReservationSummary.objects.bulk_create(
+        EventReservationSummary(event_id=event_id, **fields)
+        for event_id, fields in totals.items()
+    )
+    EventReservationSummaryItem.objects.bulk_create(
+        EventReservationSummaryItem(
+            summary=summary,
+            price_matrix_item_id=price_matrix_item_id,
+            **spots,
+        )
+        for summary in summaries
+        for price_matrix_item_id, spots in items[summary.event_id].items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0083_reservation_allow_requester_updates_until_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='summary_bucket',
+            field=models.CharField(choices=[('in_progress', 'in progress'), ('pending', 'pending'), ('waitinglist', 'waitinglist'), ('confirmed', 'confirmed'), ('canceled', 'canceled')], default='in_progress', editable=False, help_text='the totals of the event summary the lines are counted in', max_length=20, verbose_name='summary bucket'),
+        ),
+        migrations.RunPython(count_summaries, migrations.RunPython.noop),
+    ]
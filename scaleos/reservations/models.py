@@ -1,29 +1,35 @@
 import datetime
 import logging
-from datetime import timedelta
 
 from allauth.account.models import EmailAddress
 from allauth.account.models import EmailConfirmation
+from dateutil.relativedelta import relativedelta
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.fields import GenericRelation
 from django.db import models
+from django.db import transaction
+from django.db.models import Case
+from django.db.models import F
 from django.db.models import Sum
+from django.db.models import Value
+from django.db.models import When
 from django.urls import reverse
 from django.utils import translation
 from django.utils.translation import gettext_lazy as _
-from moneyed import EUR
-from moneyed import Money
 from polymorphic.models import PolymorphicModel
 
 from scaleos.notifications import models as notification_models
 from scaleos.organizations import models as organization_models
 from scaleos.organizations.models import Organization
 from scaleos.payments.models import Price
+from scaleos.payments.values import PriceValue
+from scaleos.reservations.tasks import promote_waitinglist_reservations
 from scaleos.reservations.tasks import send_reservation_update_notification
+from scaleos.reservations.tasks import send_reservation_update_notifications
+from scaleos.shared import clock
 from scaleos.shared.fields import LogInfoFields
 from scaleos.shared.fields import PublicKeyField
 from scaleos.shared.functions import valid_email_address
-from scaleos.shared.mixins import ITS_NOW
 from scaleos.shared.mixins import AdminLinkMixin
 from scaleos.shared.models import CardModel
 from scaleos.users.models import User
@@ -63,6 +69,19 @@ class Reservation(
         ENDED = "ENDED", _("ended")
         UNKNOWN = "UNKNOWN", _("unknown")
 
+    class ConfirmationState(models.TextChoices):
+        PENDING = "PENDING", _("pending")
+        CONFIRMED = "CONFIRMED", _("confirmed")
+        REFUSED = "REFUSED", _("refused")
+        CANCELED = "CANCELED", _("canceled")
+
+    class SummaryBucket(models.TextChoices):
+        IN_PROGRESS = "in_progress", _("in progress")
+        PENDING = "pending", _("pending")
+        WAITINGLIST = "waitinglist", _("waitinglist")
+        CONFIRMED = "confirmed", _("confirmed")
+        CANCELED = "canceled", _("canceled")
+
     organization = models.ForeignKey(
         "organizations.Organization",
         verbose_name=_(
@@ -107,6 +126,7 @@ class Reservation(
         ),
         null=True,
         blank=True,
+        db_index=True,
         help_text=_("the moment until the requester can update the reservation"),
     )
     expired_on = models.DateTimeField(
@@ -128,9 +148,63 @@ class Reservation(
         ),
         null=True,
         blank=True,
+        db_index=True,
         help_text=_("the moment the reservation has been added to the waitinglist"),
     )
 
+    organization_state = models.CharField(
+        verbose_name=_(
+            "organization state",
+        ),
+        max_length=20,
+        choices=ConfirmationState.choices,
+        default=ConfirmationState.PENDING,
+        db_index=True,
+        editable=False,
+        help_text=_("the state of the latest organization update"),
+    )
+    requester_state = models.CharField(
+        verbose_name=_(
+            "requester state",
+        ),
+        max_length=20,
+        choices=ConfirmationState.choices,
+        default=ConfirmationState.PENDING,
+        db_index=True,
+        editable=False,
+        help_text=_("the state of the latest requester update"),
+    )
+    confirmation_state = models.CharField(
+        verbose_name=_(
+            "confirmation state",
+        ),
+        max_length=20,
+        choices=ConfirmationState.choices,
+        default=ConfirmationState.PENDING,
+        db_index=True,
+        editable=False,
+        help_text=_("the state of the reservation for both parties together"),
+    )
+
+    claimed_spots = models.IntegerField(
+        verbose_name=_(
+            "claimed spots",
+        ),
+        default=0,
+        editable=False,
+        help_text=_("the spots of the event that are held for this reservation"),
+    )
+    summary_bucket = models.CharField(
+        verbose_name=_(
+            "summary bucket",
+        ),
+        max_length=20,
+        choices=SummaryBucket.choices,
+        default=SummaryBucket.IN_PROGRESS,
+        editable=False,
+        help_text=_("the totals of the event summary the lines are counted in"),
+    )
+
     payment_request = models.OneToOneField(
         "payments.PaymentRequest",
         on_delete=models.SET_NULL,
@@ -150,30 +224,34 @@ class Reservation(
         verbose_name_plural = _("reservations")
 
     def get_total_price(self) -> Price:
-        """return the total price VAT included
+        """return the total price VAT included, as a new unsaved price"""
+        return self.get_total_price_value().to_price()
+
+    def get_total_price_value(self, current_prices=None) -> PriceValue:
+        """return the total of the lines, per VAT percentage
         A reservation line can have another VAT percentage
+        current_prices can map the price matrix items to their loaded price
         """
         logger.debug("Getting the total price for the reservation %s", self.pk)
-        total_price = Price(
-            vat_included=Money(0, EUR),
-        )
-        for idx, line in enumerate(self.lines.all()):
-            logger.info("Current reservation line %s", idx)
-            if line.total_price:
-                total_price.plus(line.total_price)
-                logger.info(
-                    "The total price is now %s",
-                    total_price.vat_included,
+        if current_prices is None:
+            line_values = (line.total_price_value for line in self.lines.all())
+        else:
+            line_values = (
+                line.calculate_price_value(
+                    current_prices.get(line.price_matrix_item_id),
                 )
-        logger.debug("Total price is calculated.")
-
-        # We dont want to set the VAT stuff, because we are talking about different prices with different VATs  # noqa: E501
-
-        logger.info("The total price is: %s", str(total_price))
+                for line in self.lines.all()
+                if line.price_matrix_item_id is not None
+            )
+        total_price = PriceValue.sum(line_values)
+        logger.info("The total price is: %s", total_price.vat_included)
         return total_price
 
     @property
     def total_amount(self):
+        if "lines" in getattr(self, "_prefetched_objects_cache", {}):
+            return sum(line.amount or 0 for line in self.lines.all())
+
         the_result = self.lines.all().aggregate(total=Sum("amount"))["total"]
         if the_result:
             return the_result
@@ -232,7 +310,7 @@ class Reservation(
                     email_confirmation_link = request.build_absolute_uri(
                         reverse("account_confirm_email", args=[email_confirmation.key]),
                     )
-                email_confirmation.sent = ITS_NOW
+                email_confirmation.sent = clock.now()
                 email_confirmation.save()
 
                 WaitingUserEmailConfirmation.objects.create(
@@ -254,20 +332,76 @@ class Reservation(
                 user.save(update_fields=["website_language"])
         self.save(update_fields=["user_id"])
 
+    @classmethod
+    def get_summary_bucket(
+        cls,
+        confirmed_on,
+        confirmation_state,
+        on_waitinglist_since,
+        finished_on,
+    ):
+        """the totals of the event summary a reservation in this state counts in"""
+        if confirmed_on is not None:
+            return cls.SummaryBucket.CONFIRMED
+        if confirmation_state in (
+            cls.ConfirmationState.REFUSED,
+            cls.ConfirmationState.CANCELED,
+        ):
+            return cls.SummaryBucket.CANCELED
+        if on_waitinglist_since is not None:
+            return cls.SummaryBucket.WAITINGLIST
+        if finished_on is not None:
+            return cls.SummaryBucket.PENDING
+        return cls.SummaryBucket.IN_PROGRESS
+
+    @classmethod
+    def summary_bucket_expression(cls, prefix=""):
+        """get_summary_bucket as a database expression"""
+        return Case(
+            When(
+                **{f"{prefix}confirmed_on__isnull": False},
+                then=Value(cls.SummaryBucket.CONFIRMED),
+            ),
+            When(
+                **{
+                    f"{prefix}confirmation_state__in": [
+                        cls.ConfirmationState.REFUSED,
+                        cls.ConfirmationState.CANCELED,
+                    ],
+                },
+                then=Value(cls.SummaryBucket.CANCELED),
+            ),
+            When(
+                **{f"{prefix}on_waitinglist_since__isnull": False},
+                then=Value(cls.SummaryBucket.WAITINGLIST),
+            ),
+            When(
+                **{f"{prefix}finished_on__isnull": False},
+                then=Value(cls.SummaryBucket.PENDING),
+            ),
+            default=Value(cls.SummaryBucket.IN_PROGRESS),
+            output_field=models.CharField(),
+        )
+
     def update_confirmation_moment(self):
         logger.debug("Trying to update the confirmation moment for the reservation")
         confrimation_state = self.get_confirmation_state()
         if confrimation_state:
             logger.debug("Updating the reservation confirmation moment")
-            confirmed_on = ITS_NOW
+            confirmed_on = clock.now()
             if isinstance(self, EventReservation):
-                self.event.add_reserved_spots(self.total_amount)
+                self.sync_claimed_spots()
             self.update_payment_request()
         else:
             logger.debug("Removing the confirmation moment")
             confirmed_on = None
+            if isinstance(self, EventReservation) and self.is_canceled:
+                self.release_claimed_spots()
 
         Reservation.objects.filter(id=self.pk).update(confirmed_on=confirmed_on)
+        self.confirmed_on = confirmed_on
+        if isinstance(self, EventReservation):
+            self.refresh_summary()
 
     def organization_auto_confirm(self):
         logger.debug("Trying to auto confirm the reserveration for the organization")
@@ -286,21 +420,19 @@ class Reservation(
                 msg = _("we need an event for an event reservation")
                 raise ValueError(msg)
 
-            unlimited_spots = self.event.has_unlimited_spots
-            logger.debug("Event has unlimited spots? %s", unlimited_spots)
-
-            free_spots = self.event.free_spots
-            logger.debug("Free spots: %s", free_spots)
+            if self.organization is None or self.organization_confirmed:
+                logger.info("The organization cannot confirm the reservation")
+                return False
 
-            logger.debug("Total to reserve: %s", self.total_amount)
+            if self.claim_spots():
+                if self.organization_confirm(send_notification=send_notification):
+                    return True
 
-            event = self.event
-            if event.has_capacity_for(self):
-                self.organization_confirm(send_notification=send_notification)
-                return True
+                self.release_claimed_spots()
+                return False
 
             logger.warning("The event is full, so if cannot be confirmed automatically")
-            self.on_waitinglist_since = ITS_NOW
+            self.on_waitinglist_since = clock.now()
             self.save(update_fields=["on_waitinglist_since"])
             logger.debug("Create an update")
             OrganizationTemporarilyRejected.objects.create(
@@ -313,12 +445,13 @@ class Reservation(
         logger.info("The reservation cannot be auto confirmed")
         return False
 
+    def set_claimed_spots(self, the_amount):
+        self.claimed_spots = the_amount
+        Reservation.objects.filter(id=self.pk).update(claimed_spots=the_amount)
+
     @property
     def organization_confirmed(self):
-        the_update = self.latest_organization_update
-        if the_update:
-            return the_update.is_confirmed
-        return False
+        return self.organization_state == self.ConfirmationState.CONFIRMED
 
     def organization_confirm(self, *, send_notification=True):
         if self.organization is None:
@@ -336,7 +469,7 @@ class Reservation(
             return False
 
         OrganizationConfirm.objects.create(
-            reservation_id=self.pk,
+            reservation=self,
             send_notification=send_notification,
         )
 
@@ -350,11 +483,7 @@ class Reservation(
     @property
     def requester_confirmed(self):
         logger.debug("Checking if the requester confirmed the reservation")
-        the_update = self.latest_requester_update
-        if the_update:
-            return the_update.is_confirmed
-        logger.debug("The reservation is not yet confirmed")
-        return False
+        return self.requester_state == self.ConfirmationState.CONFIRMED
 
     def requester_auto_confirm(self, request=None):
         if self.created_by is None:
@@ -399,7 +528,7 @@ class Reservation(
 
         logger.debug("Creating the requester confirm object")
         RequesterConfirm.objects.create(
-            reservation_id=self.pk,
+            reservation=self,
             send_notification=send_notification,
         )
 
@@ -454,39 +583,10 @@ class Reservation(
         return None
 
     def update_payment_request(self):
-        from scaleos.payments.models import PaymentRequest
+        from scaleos.reservations.functions import update_payment_requests
 
         logger.info("Updating payment request for the reservation with id: %s", self.pk)
-
-        the_total_price = self.get_total_price()
-        logger.debug("Total price: %s", the_total_price)
-        if (
-            the_total_price is None
-            or the_total_price.vat_included is None
-            or the_total_price.vat_included.amount == 0
-        ):
-            logger.info("No total price with VAT included for the reservation")
-            return
-
-        payment_request, created = PaymentRequest.objects.get_or_create(
-            id=self.payment_request_id,
-        )
-        if created:
-            logger.info("New payment request created")
-
-        if self.organization:
-            payment_request.to_organization_id = self.organization.pk
-            the_total_price.organization_id = self.organization.pk
-
-        payment_request.origin = self
-
-        if self.applicable_payment_settings:
-            payment_request.payment_settings_id = self.applicable_payment_settings.pk
-        payment_request.save()
-        self.payment_request_id = payment_request.pk
-        self.save()
-        payment_request.set_price_to_pay(the_total_price)
-        payment_request.apply_payment_settings()  # needs to be the last line, otherwise the payment conditions are not created  # noqa: E501
+        update_payment_requests([self])
 
     @property
     def latest_organization_update(self):
@@ -505,14 +605,7 @@ class Reservation(
 
     @property
     def organization_status(self):
-        the_update = self.latest_organization_update
-        if isinstance(the_update, OrganizationConfirm):
-            return _("confirmed")
-        if isinstance(the_update, OrganizationRefuse):
-            return _("refused")
-        if isinstance(the_update, OrganizationCancel):
-            return _("canceled")
-        return _("pending")
+        return self.get_organization_state_display()
 
     @property
     def latest_requester_update(self):
@@ -527,38 +620,75 @@ class Reservation(
 
     @property
     def requester_status(self):
-        the_update = self.latest_requester_update
-        if isinstance(the_update, RequesterConfirm):
-            return _("confirmed")
-        if isinstance(the_update, RequesterCancel):
-            return _("canceled")
-        return _("pending")
+        return self.get_requester_state_display()
+
+    @property
+    def is_canceled(self):
+        return self.confirmation_state in (
+            self.ConfirmationState.REFUSED,
+            self.ConfirmationState.CANCELED,
+        )
 
     def get_confirmation_state(self):
         logger.debug("getting the confirmation state for the reservation")
-        org_status = self.latest_organization_update
-        req_status = self.latest_requester_update
-
-        if org_status and req_status:
-            logger.debug("org confirmed? %s", org_status.is_confirmed)
-            logger.debug("req confirmed? %s", req_status.is_confirmed)
-            logger.debug(
-                "both confirmed? %s",
-                org_status.is_confirmed and req_status.is_confirmed,
-            )
-            if org_status.is_confirmed and req_status.is_confirmed:
-                logger.debug("The reservation is confirmed from both parties")
-                return True
+        if self.confirmation_state == self.ConfirmationState.CONFIRMED:
+            logger.debug("The reservation is confirmed from both parties")
+            return True
         logger.debug("The reservation is not confirmed")
         return False
 
+    @classmethod
+    def combine_confirmation_states(cls, organization_state, requester_state):
+        if (
+            organization_state == cls.ConfirmationState.CONFIRMED
+            and requester_state == cls.ConfirmationState.CONFIRMED
+        ):
+            return cls.ConfirmationState.CONFIRMED
+
+        if organization_state in (
+            cls.ConfirmationState.REFUSED,
+            cls.ConfirmationState.CANCELED,
+        ):
+            return organization_state
+
+        if requester_state == cls.ConfirmationState.CANCELED:
+            return requester_state
+
+        return cls.ConfirmationState.PENDING
+
+    def apply_confirmation_update(self, update):
+        """
+        Store the state of a new organization or requester update. The states
+        of this instance are refreshed with the stored ones, which an other
+        instance of the reservation may have updated.
+        """
+        if update.organization_state is None and update.requester_state is None:
+            return
+
+        states = (
+            Reservation.objects.select_for_update()
+            .filter(pk=self.pk)
+            .values("organization_state", "requester_state")
+            .get()
+        )
+        if update.organization_state is not None:
+            states["organization_state"] = update.organization_state
+        if update.requester_state is not None:
+            states["requester_state"] = update.requester_state
+        states["confirmation_state"] = self.combine_confirmation_states(**states)
+
+        logger.debug("New confirmation states for reservation %s: %s", self.pk, states)
+        Reservation.objects.filter(pk=self.pk).update(**states)
+        for field_name, value in states.items():
+            setattr(self, field_name, value)
+
     @property
     def is_confirmed(self):
         return self.confirmed_on is not None
 
     @property
     def requester_can_update(self):
-        return self.requester_can_update_on(ITS_NOW)
+        return self.requester_can_update_on(clock.now())
 
     def can_be_checked_in_by(self, user):
         logger.debug("Checking if reservation can be checked in by user.")
@@ -597,35 +727,48 @@ class Reservation(
 
     def set_allow_requester_updates_until_datetime(self):
         logger.debug("Setting the allow requester updates until datetime")
-        reservation_settings = self.applicable_reservation_settings
+        calculated_time = self.calculate_allow_requester_updates_until(
+            self.applicable_reservation_settings,
+        )
+        if calculated_time is None:
+            return
+
+        logger.debug("Calculated time: %s", calculated_time)
+        self.allow_requester_updates_until = calculated_time
+        Reservation.objects.filter(id=self.pk).update(
+            allow_requester_updates_until=calculated_time,
+        )
+
+    def calculate_allow_requester_updates_until(self, reservation_settings):
         if reservation_settings is None:
             logger.info(
                 "we cannot update the date untill wich the \
 requester is allowed to do updates if \
 we do not have the settings",
             )
-            return
+            return None
 
         if self.start is None:
             logger.info("without start date, we cannot calculate the right moment")
-            return
+            return None
 
         time_amount = reservation_settings.allow_requester_updates_until_time_amount
         time_interval = reservation_settings.allow_requester_updates_until_interval
-        if time_amount is None or time_interval is None:
+        intervals = ReservationSettings.AllowRequesterUpdatesUntillInterval
+        if time_interval == intervals.AT_START:
+            return self.start
+
+        if time_interval == intervals.WHEN_ENDED:
+            return self.end
+
+        if time_amount is None or not time_interval:
             logger.info(
                 "we cannot calculate the right moment \
 because we have no interval or amount",
             )
+            return None
 
-        calculated_time = self.start - timedelta(
-            **{time_interval: time_amount},
-        )
-        logger.debug("Calculated time: %s", calculated_time)
-        self.allow_requester_updates_until = calculated_time
-        Reservation.objects.filter(id=self.pk).update(
-            allow_requester_updates_until=calculated_time,
-        )
+        return self.start - relativedelta(**{time_interval: time_amount})
 
     def requester_can_update_on(self, a_moment: datetime.datetime):
         logger.debug("Checking if the requester can update on %s", a_moment)
@@ -666,9 +809,153 @@ class EventReservation(Reservation):
 
         return f"{str_event} {str_for} {self.user}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.set_loaded_state()
+        return instance
+
+    def set_loaded_state(self):
+        """remember the event the summary counts the reservation for"""
+        self._loaded_event_id = self.__dict__.get("event_id")
+
+    def refresh_summary(self, *, deleted=False):
+        """
+        Move the lines of the reservation to the totals of the summary that
+        match its current state, or out of the summary when it is deleted.
+        The stored summary bucket tells where they are counted now, so a
+        repeated call moves nothing.
+        """
+        counted_event_id = getattr(self, "_loaded_event_id", None) or self.event_id
+        with transaction.atomic():
+            state = (
+                Reservation.objects.select_for_update()
+                .filter(pk=self.pk)
+                .values(
+                    "confirmed_on",
+                    "confirmation_state",
+                    "on_waitinglist_since",
+                    "finished_on",
+                    "summary_bucket",
+                )
+                .first()
+            )
+            if state is None:
+                return
+
+            counted_bucket = state.pop("summary_bucket")
+            bucket = (
+                self.SummaryBucket.IN_PROGRESS
+                if deleted
+                else self.get_summary_bucket(**state)
+            )
+            if bucket != counted_bucket or counted_event_id != self.event_id:
+                EventReservationSummary.move_reservation(
+                    self.pk,
+                    (counted_event_id, counted_bucket),
+                    (self.event_id, bucket),
+                )
+                Reservation.objects.filter(pk=self.pk).update(summary_bucket=bucket)
+        self.summary_bucket = bucket
+        self.set_loaded_state()
+
+    def claim_spots(self):
+        """Hold the spots of the event for this reservation, if they still fit"""
+        to_claim = self.total_amount - self.claimed_spots
+        logger.debug("Spots to claim: %s", to_claim)
+        if to_claim <= 0:
+            return True
+
+        if not self.event.claim_spots(to_claim):
+            return False
+
+        self.set_claimed_spots(self.claimed_spots + to_claim)
+        return True
+
+    def sync_claimed_spots(self):
+        """Make the claimed spots match the amount of a confirmed reservation"""
+        the_difference = self.total_amount - self.claimed_spots
+        if the_difference == 0:
+            logger.debug("The claimed spots are already up to date")
+            return
+
+        self.event.add_reserved_spots(the_difference)
+        self.set_claimed_spots(self.claimed_spots + the_difference)
+
+    def release_claimed_spots(self):
+        if self.claimed_spots == 0:
+            return
+
+        logger.info("Releasing %s spots of reservation %s", self.claimed_spots, self.pk)
+        self.event.release_spots(self.claimed_spots)
+        self.set_claimed_spots(0)
+        event_id = self.event_id
+        transaction.on_commit(
+            lambda: promote_waitinglist_reservations.delay(event_id),
+        )
+
+    @classmethod
+    def promote_waitinglist(cls, event_id):
+        """
+        Confirm the oldest reservations on the waitinglist of the event that
+        still fit in the free spots. A reservation that is too big stays on the
+        waitinglist, while smaller ones after it can still be promoted.
+        """
+        promoted_updates = []
+        with transaction.atomic():
+            waiting_reservations = (
+                cls.objects.select_for_update(of=("self", "reservation_ptr"))
+                .filter(
+                    event_id=event_id,
+                    on_waitinglist_since__isnull=False,
+                    organization_state=Reservation.ConfirmationState.PENDING,
+                )
+                .exclude(
+                    confirmation_state__in=[
+                        Reservation.ConfirmationState.REFUSED,
+                        Reservation.ConfirmationState.CANCELED,
+                    ],
+                )
+                .select_related("event")
+                .prefetch_related("lines")
+                .order_by("on_waitinglist_since")
+            )
+
+            for reservation in waiting_reservations:
+                if not reservation.claim_spots():
+                    logger.debug("Reservation %s does not fit yet", reservation.pk)
+                    continue
+
+                logger.info("Promoting reservation %s", reservation.pk)
+                reservation.on_waitinglist_since = None
+                reservation.save(update_fields=["on_waitinglist_since"])
+                update = OrganizationConfirm.objects.create(
+                    reservation=reservation,
+                    send_notification=False,
+                )
+                promoted_updates.append(update.pk)
+
+                if reservation.event.is_full:
+                    logger.debug("No free spots left on event %s", event_id)
+                    break
+
+            if promoted_updates:
+                OrganizationConfirm.objects.filter(pk__in=promoted_updates).update(
+                    send_notification=True,
+                )
+                transaction.on_commit(
+                    lambda: send_reservation_update_notifications.delay(
+                        promoted_updates,
+                    ),
+                )
+
+        return len(promoted_updates)
+
 
 class ReservationUpdate(PolymorphicModel, LogInfoFields, AdminLinkMixin):
     is_confirmed = False
+    organization_state = None
+    requester_state = None
     notification_button_text_translation = _("open reservation")
     notification_button_text = notification_button_text_translation.upper()
 
@@ -719,7 +1006,10 @@ class ReservationUpdate(PolymorphicModel, LogInfoFields, AdminLinkMixin):
 
     def save(self, *args, **kwargs):
         is_new = self._state.adding  # True if this is a new object
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if is_new and self.reservation_id is not None:
+                self.reservation.apply_confirmation_update(self)
+            super().save(*args, **kwargs)
 
         if is_new and self.send_notification:
             send_reservation_update_notification.apply_async((self.id,), countdown=5)
@@ -785,6 +1075,7 @@ class ReservationUpdate(PolymorphicModel, LogInfoFields, AdminLinkMixin):
 class OrganizationConfirm(ReservationUpdate):
     passed_action = _("organization confirmed")
     is_confirmed = True
+    organization_state = Reservation.ConfirmationState.CONFIRMED
     notification_title_translation = _("your reservation has been confirmed")
     notification_title = f"{notification_title_translation}. ✅".capitalize()
     notification_button_text_translation = _("open reservation")
@@ -804,6 +1095,7 @@ class OrganizationConfirm(ReservationUpdate):
 class OrganizationCancel(ReservationUpdate):
     passed_action = _("organization canceled")
     is_confirmed = False
+    organization_state = Reservation.ConfirmationState.CANCELED
     notification_title_translation = _("your reservation has been canceled")
     notification_title = f"{notification_title_translation}. ✘".capitalize()
 
@@ -843,6 +1135,7 @@ class OrganizationTemporarilyRejected(ReservationUpdate):
 class OrganizationRefuse(ReservationUpdate):
     passed_action = _("organization refused")
     is_confirmed = False
+    organization_state = Reservation.ConfirmationState.REFUSED
     notification_title_translation = _("a reservation has been refused")
     notification_title = f"{notification_title_translation}. ✘".capitalize()
 
@@ -875,6 +1168,7 @@ class OrganizationRefuse(ReservationUpdate):
 class RequesterConfirm(ReservationUpdate):
     passed_action = _("requester confirmed")
     is_confirmed = True
+    requester_state = Reservation.ConfirmationState.CONFIRMED
     notification_title_translation = _("the requester has confirmed his reservation")
     notification_title = f"{notification_title_translation}. ✅".capitalize()
 
@@ -888,6 +1182,7 @@ class RequesterConfirm(ReservationUpdate):
 class RequesterCancel(ReservationUpdate):
     passed_action = _("requester canceled")
     is_confirmed = False
+    requester_state = Reservation.ConfirmationState.CANCELED
     notification_title_translation = _("the requester has canceled his reservation")
     notification_title = f"{notification_title_translation}. ✘".capitalize()
 
@@ -1128,36 +1423,94 @@ class ReservationLine(AdminLinkMixin, PublicKeyField):
     class Meta:
         ordering = ["pk"]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.set_loaded_state()
+        return instance
+
+    def set_loaded_state(self):
+        """remember the spots the summary of the event counts for this line"""
+        self._loaded_spots = (
+            self.__dict__.get("reservation_id"),
+            self.__dict__.get("price_matrix_item_id"),
+            self.__dict__.get("amount") or 0,
+        )
+
+    def refresh_summary(self, *, deleted=False):
+        """Apply the change of the line to the summary of its event"""
+        old_spots = getattr(self, "_loaded_spots", None)
+        new_spots = (
+            None
+            if deleted
+            else (self.reservation_id, self.price_matrix_item_id, self.amount or 0)
+        )
+        if old_spots == new_spots:
+            return
+
+        changes = []
+        for spots, sign in ((old_spots, -1), (new_spots, 1)):
+            if spots is None or spots[0] is None or not spots[2]:
+                continue
+            reservation_id, price_matrix_item_id, amount = spots
+            changes.append((reservation_id, price_matrix_item_id, sign * amount))
+
+        with transaction.atomic():
+            # the lock keeps the reservation in its bucket until the line is counted
+            counted_in = {
+                reservation["pk"]: reservation
+                for reservation in (
+                    Reservation.objects.select_for_update(of=("self",))
+                    .filter(
+                        pk__in={reservation_id for reservation_id, _, _ in changes},
+                        eventreservation__isnull=False,
+                    )
+                    .values("pk", "summary_bucket", "eventreservation__event_id")
+                )
+            }
+            for reservation_id, price_matrix_item_id, spots in changes:
+                reservation = counted_in.get(reservation_id)
+                if reservation is None:
+                    continue
+                EventReservationSummary.add_spots(
+                    reservation["eventreservation__event_id"],
+                    reservation["summary_bucket"],
+                    {price_matrix_item_id: spots},
+                )
+        self.set_loaded_state()
+
+    @property
+    def total_price(self) -> Price | None:
+        total_price_value = self.total_price_value
+        if total_price_value is None:
+            return None
+
+        return total_price_value.to_price()
+
     @property
-    def total_price(self) -> Price | None:  # noqa: PLR0911
-        if self.amount == 0:
+    def total_price_value(self) -> PriceValue | None:
+        if not self.amount:
             logger.info("The amount of persons is 0, thus returning an empty price")
             return None
 
         if self.price_matrix_item is None:
             return None
 
-        a_price = self.price_matrix_item.current_price
-        if a_price is None:
+        return self.calculate_price_value(self.price_matrix_item.current_price)
+
+    def calculate_price_value(self, a_price) -> PriceValue | None:
+        if not self.amount:
+            logger.info("The amount of persons is 0, thus returning an empty price")
+            return None
+
+        if a_price is None or a_price.vat_included is None:
             return None
 
         if a_price.vat_included.amount == 0:
             logger.info("The price is 0, thus returning an empty price")
             return None
 
-        if self.amount == 1:
-            return a_price
-
-        try:
-            result = a_price.multiply(self.amount)
-            logger.info("The multiplied price is %s", result)
-
-        except AttributeError as e:
-            logger.warning(e)
-        else:
-            return result
-
-        return Price(input_price=Money(0, EUR))
+        return a_price.value.multiply(self.amount)
 
     @property
     def minimum_amount(self):
@@ -1188,3 +1541,251 @@ class ReservationLine(AdminLinkMixin, PublicKeyField):
         if self.price_matrix_item and self.price_matrix_item.maximum_persons:
             return self.price_matrix_item.maximum_persons
         return 10
+
+
+class EventReservationSummary(models.Model):  # noqa: DJ008
+    """
+    The reservation totals of one event for the dashboards, kept up to date on
+    every change. The capacity is held by Event.reserved_spots.
+    """
+
+    event = models.OneToOneField(
+        "events.Event",
+        verbose_name=_(
+            "event",
+        ),
+        related_name="reservation_summary",
+        on_delete=models.CASCADE,
+    )
+    confirmed_spots = models.IntegerField(
+        verbose_name=_(
+            "confirmed spots",
+        ),
+        default=0,
+    )
+    pending_spots = models.IntegerField(
+        verbose_name=_(
+            "pending spots",
+        ),
+        default=0,
+        help_text=_("the spots of finished reservations waiting for a confirmation"),
+    )
+    waitinglist_spots = models.IntegerField(
+        verbose_name=_(
+            "waitinglist spots",
+        ),
+        default=0,
+    )
+    waitinglist_size = models.IntegerField(
+        verbose_name=_(
+            "waitinglist size",
+        ),
+        default=0,
+        help_text=_("the number of reservations on the waitinglist"),
+    )
+    modified_on = models.DateTimeField(
+        verbose_name=_(
+            "modified on",
+        ),
+        auto_now=True,
+    )
+
+    class Meta:
+        verbose_name = _("event reservation summary")
+        verbose_name_plural = _("event reservation summaries")
+
+    SPOT_FIELDS = [
+        "confirmed_spots",
+        "pending_spots",
+        "waitinglist_spots",
+        "waitinglist_size",
+    ]
+
+    BUCKET_FIELDS = {
+        Reservation.SummaryBucket.CONFIRMED: "confirmed_spots",
+        Reservation.SummaryBucket.PENDING: "pending_spots",
+        Reservation.SummaryBucket.WAITINGLIST: "waitinglist_spots",
+    }
+    ITEM_BUCKETS = [
+        Reservation.SummaryBucket.CONFIRMED,
+        Reservation.SummaryBucket.PENDING,
+    ]
+
+    @classmethod
+    def calculate(cls, event_id):
+        """
+        Count the reservations of the event from scratch.
+        Returns the spot fields and the spots per price matrix item.
+        """
+        rows = (
+            ReservationLine.objects.filter(
+                reservation__eventreservation__event_id=event_id,
+            )
+            .annotate(bucket=Reservation.summary_bucket_expression("reservation__"))
+            .values("bucket", "price_matrix_item_id")
+            .annotate(spots=Sum("amount"))
+            .order_by()
+        )
+
+        totals = dict.fromkeys(cls.SPOT_FIELDS, 0)
+        items = {}
+        for row in rows:
+            spots = row["spots"] or 0
+            field_name = cls.BUCKET_FIELDS.get(row["bucket"])
+            if field_name:
+                totals[field_name] += spots
+
+            if row["bucket"] in cls.ITEM_BUCKETS:
+                item = items.setdefault(
+                    row["price_matrix_item_id"],
+                    {"confirmed_spots": 0, "pending_spots": 0},
+                )
+                item[field_name] += spots
+
+        totals["waitinglist_size"] = (
+            EventReservation.objects.filter(event_id=event_id)
+            .annotate(bucket=Reservation.summary_bucket_expression())
+            .filter(bucket=Reservation.SummaryBucket.WAITINGLIST)
+            .count()
+        )
+        return totals, items
+
+    @classmethod
+    def add_spots(cls, event_id, bucket, spots_per_item, reservations=0):
+        """
+        Add spots, negative ones to remove them, and reservations to one
+        bucket of the summary of the event.
+        """
+        field_name = cls.BUCKET_FIELDS.get(bucket)
+        spots = sum(spots_per_item.values())
+        if bucket != Reservation.SummaryBucket.WAITINGLIST:
+            reservations = 0
+        if event_id is None or field_name is None or not (spots or reservations):
+            return
+
+        changes = {field_name: F(field_name) + spots}
+        if reservations:
+            changes["waitinglist_size"] = F("waitinglist_size") + reservations
+        summary, _created = cls.objects.get_or_create(event_id=event_id)
+        # the update locks the summary, which keeps the items in line as well
+        cls.objects.filter(pk=summary.pk).update(modified_on=clock.now(), **changes)
+        if bucket not in cls.ITEM_BUCKETS:
+            return
+
+        for price_matrix_item_id, item_spots in spots_per_item.items():
+            if not item_spots:
+                continue
+            updated = EventReservationSummaryItem.objects.filter(
+                summary_id=summary.pk,
+                price_matrix_item_id=price_matrix_item_id,
+            ).update(**{field_name: F(field_name) + item_spots})
+            if not updated:
+                EventReservationSummaryItem.objects.create(
+                    summary_id=summary.pk,
+                    price_matrix_item_id=price_matrix_item_id,
+                    **{field_name: item_spots},
+                )
+
+    @classmethod
+    def move_reservation(cls, reservation_id, source, target):
+        """
+        Move the lines of a reservation from one (event, bucket) of the
+        summaries to another.
+        """
+        spots_per_item = {
+            price_matrix_item_id: spots or 0
+            for price_matrix_item_id, spots in (
+                ReservationLine.objects.filter(reservation_id=reservation_id)
+                .values("price_matrix_item_id")
+                .annotate(spots=Sum("amount"))
+                .order_by()
+                .values_list("price_matrix_item_id", "spots")
+            )
+        }
+        logger.debug(
+            "Moving the spots of reservation %s from %s to %s",
+            reservation_id,
+            source,
+            target,
+        )
+        cls.add_spots(
+            *source,
+            {item_id: -spots for item_id, spots in spots_per_item.items()},
+            reservations=-1,
+        )
+        cls.add_spots(*target, spots_per_item, reservations=1)
+
+    @classmethod
+    def rebuild_for_event(cls, event_id):
+        """Count the summary of the event from scratch, to repair a drift"""
+        if event_id is None:
+            return None
+
+        with transaction.atomic():
+            summary, _created = cls.objects.select_for_update().get_or_create(
+                event_id=event_id,
+            )
+            # the update locks the reservations, none moves while they are counted
+            Reservation.objects.filter(
+                eventreservation__event_id=event_id,
+            ).update(summary_bucket=Reservation.summary_bucket_expression())
+            totals, items = cls.calculate(event_id)
+            logger.debug("Reservation totals for event %s: %s", event_id, totals)
+            for field_name, value in totals.items():
+                setattr(summary, field_name, value)
+            summary.save()
+
+            summary.items.all().delete()
+            EventReservationSummaryItem.objects.bulk_create(
+                EventReservationSummaryItem(
+                    summary=summary,
+                    price_matrix_item_id=price_matrix_item_id,
+                    **spots,
+                )
+                for price_matrix_item_id, spots in items.items()
+            )
+        return summary
+
+    def drifted_fields(self):
+        """The spot fields that no longer match a count from scratch"""
+        totals, _items = self.calculate(self.event_id)
+        return [
+            field_name
+            for field_name, value in totals.items()
+            if getattr(self, field_name) != value
+        ]
+
+
+class EventReservationSummaryItem(models.Model):  # noqa: DJ008
+    summary = models.ForeignKey(
+        EventReservationSummary,
+        verbose_name=_(
+            "summary",
+        ),
+        related_name="items",
+        on_delete=models.CASCADE,
+    )
+    price_matrix_item = models.ForeignKey(
+        "payments.PriceMatrixItem",
+        verbose_name=_(
+            "price matrix item",
+        ),
+        on_delete=models.CASCADE,
+        null=True,
+    )
+    confirmed_spots = models.IntegerField(
+        verbose_name=_(
+            "confirmed spots",
+        ),
+        default=0,
+    )
+    pending_spots = models.IntegerField(
+        verbose_name=_(
+            "pending spots",
+        ),
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = _("event reservation summary item")
+        verbose_name_plural = _("event reservation summary items")
@@ -1,6 +1,8 @@
 import logging
 
+from django.db.models.signals import post_delete
 from django.db.models.signals import post_save
+from django.db.models.signals import pre_delete
 from django.db.models.signals import pre_save
 from django.dispatch import receiver
 
@@ -43,3 +45,41 @@ def update_confirmation_moment_signal(sender, instance, **kwargs):
 def set_update_allow_requester_updates_until_datetime(sender, instance, **kwargs):
     logger.info("Signal to set the allowed requester updates datetime")
     instance.set_allow_requester_updates_until_datetime()
+
+
+def deleted_together_with_event(**kwargs):
+    # the summary is deleted together with the event
+    from scaleos.events.models import Event
+
+    return isinstance(kwargs.get("origin"), Event)
+
+
+@receiver(post_save, sender=reservation_models.EventReservation)
+def refresh_event_reservation_summary(sender, instance, created, **kwargs):
+    if created and instance.event_id:
+        reservation_models.EventReservationSummary.objects.get_or_create(
+            event_id=instance.event_id,
+        )
+    instance.refresh_summary()
+
+
+@receiver(pre_delete, sender=reservation_models.EventReservation)
+def remove_event_reservation_from_summary(sender, instance, **kwargs):
+    if deleted_together_with_event(**kwargs):
+        return
+
+    # the lines deleted together with the reservation are no longer counted
+    instance.refresh_summary(deleted=True)
+
+
+@receiver(post_save, sender=reservation_models.ReservationLine)
+def refresh_event_reservation_summary_for_line(sender, instance, **kwargs):
+    instance.refresh_summary()
+
+
+@receiver(post_delete, sender=reservation_models.ReservationLine)
+def remove_line_from_event_reservation_summary(sender, instance, **kwargs):
+    if deleted_together_with_event(**kwargs):
+        return
+
+    instance.refresh_summary(deleted=True)
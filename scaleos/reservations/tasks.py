@@ -5,11 +5,9 @@ from celery.exceptions import SoftTimeLimitExceeded
 # myapp/utils.py
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Q
 
 from config import celery_app
 from scaleos.reservations import models as reservation_models
-from scaleos.shared.mixins import ITS_NOW
 
 User = get_user_model()
 logger = logging.getLogger()
@@ -49,10 +47,37 @@ def send_reservation_update_notification(self, reservation_update_id):
 
 @celery_app.task(bind=True, soft_time_limit=60 * 60, max_retries=3)
 def confirm_open_reservations_for_user(self, user_id):
-    reservations = reservation_models.Reservation.objects.filter(
-        Q(user_id=user_id) & (Q(expired_on__isnull=True) | Q(expired_on__gt=ITS_NOW)),
-    )
+    from scaleos.reservations.functions import confirm_open_reservations
 
-    for reservation in reservations:
-        reservation.requester_confirm()
-        reservation.organization_auto_confirm()
+    confirm_open_reservations(user_id)
+
+
+@celery_app.task(bind=True, soft_time_limit=60 * 60, max_retries=3)
+def send_reservation_update_notifications(self, reservation_update_ids):
+    updates = reservation_models.ReservationUpdate.objects.filter(
+        id__in=reservation_update_ids,
+    ).select_related("reservation")
+
+    for update in updates:
+        if hasattr(update, "send_notification_logic"):
+            update.send_notification_logic()
+
+    logger.info("[NOTIFY] %s reservation updates notified", len(updates))
+
+
+@celery_app.task(bind=True, soft_time_limit=60 * 5, max_retries=3)
+def promote_waitinglist_reservations(self, event_id):
+    try:
+        promoted = reservation_models.EventReservation.promote_waitinglist(event_id)
+        logger.info(
+            "%s reservations promoted from the waitinglist of event %s",
+            promoted,
+            event_id,
+        )
+
+    except SoftTimeLimitExceeded:
+        logger.warning("[TIMEOUT] Task exceeded soft time limit.")
+
+    except Exception as e:
+        logger.exception("[RETRY] Task failed: {e}, retrying...")
+        raise self.retry(exc=e, countdown=60 * (self.request.retries + 1)) from e
@@ -1,15 +1,22 @@
 # /opt/scaleos/scaleos/reservations/tests/test_functions.py
 
+import datetime
 import logging
 
 import pytest
+from moneyed import EUR
+from moneyed import Money
 
 from scaleos.events.tests import model_factories as event_factories
 from scaleos.organizations.tests import model_factories as organization_factories
+from scaleos.payments import models as payment_models
+from scaleos.payments.tests import model_factories as payment_factories
 
 # Assuming the function is in scaleos.reservations.functions
 from scaleos.reservations.functions import get_organization_id_from_reservation
+from scaleos.reservations.functions import update_payment_requests
 from scaleos.reservations.tests import model_factories as reservation_factories
+from scaleos.shared import clock
 
 logger = logging.getLogger(__name__)
 
@@ -184,3 +191,52 @@ class TestGetOrganizationFromReservation:
 
         org_id = get_organization_id_from_reservation(reservation)
         assert org_id == organizer.pk  # Should fallback to event.organization
+
+
+def test_update_payment_requests_for_a_group_at_once(django_assert_max_num_queries):
+    organization = organization_factories.OrganizationFactory.create()
+    payment_settings = payment_factories.EventReservationPaymentSettingsFactory(
+        organization=organization,
+    )
+    payment_factories.EventReservationPaymentConditionFactory(
+        event_reservation_payment_settings=payment_settings,
+        prepayment_type=payment_models.EventReservationPaymentCondition.PrepaymentType.PERCENTAGE_OF_TOTAL_PRICE,
+        percentage_of_total_price=30,
+        payment_moment=payment_models.EventReservationPaymentCondition.PaymentMoment.BEFORE_START_OF_EVENT,
+    )
+    event = event_factories.BrunchEventFactory.create(
+        concept__organizer=organization,
+        starting_at=clock.now() + datetime.timedelta(days=30),
+        ending_on=clock.now() + datetime.timedelta(days=30, hours=3),
+        event_reservation_payment_settings=payment_settings,
+    )
+    adult = payment_factories.AgePriceMatrixItemFactory(from_age=12)
+    payment_factories.PriceFactory(vat_included=Money(20, EUR), unique_origin=adult)
+    reservations = reservation_factories.EventReservationFactory.create_batch(
+        3,
+        event=event,
+        organization=organization,
+    )
+    for reservation in reservations:
+        reservation_factories.ReservationLineFactory(
+            reservation=reservation,
+            amount=5,
+            price_matrix_item_id=adult.pk,
+        )
+
+    with django_assert_max_num_queries(30):
+        payment_requests = update_payment_requests(reservations)
+
+    assert len(payment_requests) == 3
+    for reservation in reservations:
+        payment_request = payment_models.PaymentRequest.objects.get(
+            pk=reservation.payment_request_id,
+        )
+        assert payment_request.structured_reference_be
+        assert payment_request.structured_reference_sepa
+        assert payment_request.to_pay.vat_included == Money(100, EUR)
+        proposal = payment_request.payment_proposals.get()
+        assert proposal.price.vat_included == Money(30, EUR)
+
+    update_payment_requests(reservations)
+    assert payment_models.PaymentProposal.objects.count() == 3
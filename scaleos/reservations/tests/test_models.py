@@ -2,6 +2,7 @@ import datetime
 import logging
 
 import pytest
+from django.core.management import call_command
 from moneyed import EUR
 from moneyed import Decimal
 from moneyed import Money
@@ -14,6 +15,7 @@ from scaleos.organizations.tests import model_factories as organization_factorie
 from scaleos.payments.tests import model_factories as payment_factories
 from scaleos.reservations import models as reservation_models
 from scaleos.reservations.tests import model_factories as reservation_factories
+from scaleos.shared import clock
 from scaleos.users.models import User
 from scaleos.users.tests import model_factories as user_factories
 
@@ -560,6 +562,27 @@ def test_event_can_have_a_waitlist(faker, verified_user):
     assert event_reservation_big_group.is_confirmed is False
 
 
+def test_organization_auto_confirm_claims_no_spots_without_organization(
+    faker,
+    verified_user,
+):
+    event = event_factories.BrunchEventFactory.create(maximum_number_of_guests=10)
+    event_reservation = reservation_factories.EventReservationFactory(
+        event_id=event.pk,
+        user_id=verified_user.pk,
+        organization=None,
+    )
+    reservation_factories.ReservationLineFactory(
+        reservation_id=event_reservation.pk,
+        amount=4,
+    )
+
+    assert event_reservation.organization_auto_confirm() is False
+    assert event_reservation.claimed_spots == 0
+    event.refresh_from_db()
+    assert event.reserved_spots == 0
+
+
 @pytest.mark.django_db
 def test_organization_cannot_autoconfirm_when_user_not_verified(faker):
     event = event_factories.BirthdayEventFactory()
@@ -605,3 +628,188 @@ def test_reservation_can_be_checked_in_by_organization_owner(faker, verified_use
     result, result_type = reservation.can_be_checked_in_by(organization_owner)
     assert result
     assert result_type == organization_models.OrganizationOwner
+
+
+@pytest.mark.django_db
+def test_event_reservation_releases_its_spots_when_canceled(faker, verified_user):
+    event = event_factories.BrunchEventFactory.create(maximum_number_of_guests=10)
+    event_reservation = reservation_factories.EventReservationFactory(
+        event_id=event.pk,
+        user_id=verified_user.pk,
+    )
+    reservation_factories.ReservationLineFactory(
+        reservation_id=event_reservation.pk,
+        amount=4,
+    )
+    assert event_reservation.requester_confirm() is True
+    assert event_reservation.organization_auto_confirm() is True
+    event_reservation.refresh_from_db()
+    assert event_reservation.claimed_spots == 4
+    event.refresh_from_db()
+    assert event.reserved_spots == 4
+    # without claims waiting for a requester, the summary agrees
+    summary = event.reservation_summary
+    assert summary.confirmed_spots == event.get_reserved_spots()
+
+    reservation_factories.RequesterCancelFactory(reservation=event_reservation)
+    event_reservation.refresh_from_db()
+    assert event_reservation.claimed_spots == 0
+    assert event_reservation.is_confirmed is False
+    event.refresh_from_db()
+    assert event.reserved_spots == 0
+    summary.refresh_from_db()
+    assert summary.confirmed_spots == event.get_reserved_spots() == 0
+
+
+def test_reservation_stores_its_confirmation_states(faker):
+    reservation = reservation_factories.ReservationFactory()
+    states = reservation_models.Reservation.ConfirmationState
+    assert reservation.organization_state == states.PENDING
+    assert reservation.requester_state == states.PENDING
+    assert reservation.confirmation_state == states.PENDING
+
+    assert reservation.requester_confirm() is True
+    assert reservation.requester_state == states.CONFIRMED
+    assert reservation.confirmation_state == states.PENDING
+    assert reservation.requester_status == "confirmed"
+    assert reservation.organization_status == "pending"
+
+    assert reservation.organization_confirm() is True
+    assert reservation.confirmation_state == states.CONFIRMED
+    assert (
+        reservation_models.Reservation.objects.filter(
+            confirmation_state=states.CONFIRMED,
+        ).get()
+        == reservation
+    )
+
+    reservation_factories.OrganizationRefuseFactory(reservation_id=reservation.pk)
+    reservation.refresh_from_db()
+    assert reservation.organization_state == states.REFUSED
+    assert reservation.confirmation_state == states.REFUSED
+    assert reservation.is_canceled
+    assert reservation.is_confirmed is False
+
+
+def test_event_reservation_summary_follows_the_reservations(faker, verified_user):
+    event = event_factories.BrunchEventFactory.create(maximum_number_of_guests=10)
+    price_matrix_item = payment_factories.AgePriceMatrixItemFactory()
+    event_reservation = reservation_factories.EventReservationFactory(
+        event_id=event.pk,
+        user_id=verified_user.pk,
+    )
+    reservation_factories.ReservationLineFactory(
+        reservation_id=event_reservation.pk,
+        price_matrix_item=price_matrix_item,
+        amount=3,
+    )
+    summary = reservation_models.EventReservationSummary.objects.get(
+        event_id=event.pk,
+    )
+    assert summary.confirmed_spots == 0
+    assert summary.pending_spots == 0
+
+    event_reservation.finished_on = clock.now()
+    event_reservation.save()
+    summary.refresh_from_db()
+    assert summary.pending_spots == 3
+
+    assert event_reservation.requester_confirm() is True
+    assert event_reservation.organization_confirm() is True
+    summary.refresh_from_db()
+    assert summary.confirmed_spots == 3
+    assert summary.pending_spots == 0
+    assert summary.items.get().price_matrix_item == price_matrix_item
+    assert event.get_reserved_spots() == 3
+    assert summary.drifted_fields() == []
+
+    reservation_models.ReservationLine.objects.filter(
+        reservation_id=event_reservation.pk,
+    ).update(amount=5)
+    assert summary.drifted_fields() == ["confirmed_spots"]
+
+    call_command("rebuild_event_reservation_summaries")
+    summary.refresh_from_db()
+    assert summary.confirmed_spots == 5
+
+
+def test_event_reservation_summary_applies_the_changes(faker):
+    event = event_factories.BrunchEventFactory.create(maximum_number_of_guests=10)
+    price_matrix_item = payment_factories.AgePriceMatrixItemFactory()
+    event_reservation = reservation_factories.EventReservationFactory(
+        event_id=event.pk,
+        finished_on=clock.now(),
+    )
+    line = reservation_factories.ReservationLineFactory(
+        reservation_id=event_reservation.pk,
+        price_matrix_item=price_matrix_item,
+        amount=2,
+    )
+    summary = reservation_models.EventReservationSummary.objects.get(
+        event_id=event.pk,
+    )
+    assert summary.pending_spots == 2
+
+    line.amount = 4
+    line.save()
+    summary.refresh_from_db()
+    assert summary.pending_spots == 4
+    assert summary.items.get().pending_spots == 4
+
+    event_reservation.on_waitinglist_since = clock.now()
+    event_reservation.save()
+    summary.refresh_from_db()
+    assert summary.pending_spots == 0
+    assert summary.waitinglist_spots == 4
+    assert summary.waitinglist_size == 1
+    assert summary.items.get().pending_spots == 0
+
+    line.delete()
+    summary.refresh_from_db()
+    assert summary.waitinglist_spots == 0
+    assert summary.drifted_fields() == []
+
+    event_reservation.delete()
+    summary.refresh_from_db()
+    assert summary.waitinglist_size == 0
+    assert summary.drifted_fields() == []
+
+
+def test_waitinglist_promotes_the_oldest_reservations_that_fit(faker):
+    event = event_factories.BrunchEventFactory.create(maximum_number_of_guests=10)
+
+    def make_reservation(amount):
+        reservation = reservation_factories.EventReservationFactory(event_id=event.pk)
+        reservation_factories.ReservationLineFactory(
+            reservation_id=reservation.pk,
+            amount=amount,
+        )
+        reservation.requester_confirm()
+        return reservation
+
+    confirmed_reservation = make_reservation(8)
+    confirmed_reservation.organization_confirm()
+    event.refresh_from_db()
+    assert event.reserved_spots == 8
+
+    too_big_reservation = make_reservation(5)
+    fitting_reservation = make_reservation(2)
+    for reservation in (too_big_reservation, fitting_reservation):
+        reservation.on_waitinglist_since = clock.now()
+        reservation.save()
+
+    assert reservation_models.EventReservation.promote_waitinglist(event.pk) == 1
+    too_big_reservation.refresh_from_db()
+    fitting_reservation.refresh_from_db()
+    assert too_big_reservation.is_in_waiting_list
+    assert fitting_reservation.is_in_waiting_list is False
+    assert fitting_reservation.is_confirmed
+    event.refresh_from_db()
+    assert event.is_full
+
+    reservation_factories.RequesterCancelFactory(reservation=confirmed_reservation)
+    assert reservation_models.EventReservation.promote_waitinglist(event.pk) == 1
+    too_big_reservation.refresh_from_db()
+    assert too_big_reservation.is_confirmed
+    event.refresh_from_db()
+    assert event.reserved_spots == 7
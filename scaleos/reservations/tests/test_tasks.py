@@ -5,6 +5,7 @@ from celery.result import EagerResult
 from django.core import mail
 from django.utils import timezone
 
+from scaleos.events.tests import model_factories as event_factories
 from scaleos.reservations import tasks as reservation_tasks
 from scaleos.reservations.tests import model_factories as reservation_factories
 from scaleos.users.tests.model_factories import UserFactory
@@ -34,5 +35,40 @@ def test_confirm_open_reservations_for_user(faker):
         expired_on=past_date,
     )
     reservation_tasks.confirm_open_reservations_for_user.delay(user.pk)
+    reservation.refresh_from_db()
+    expired_reservation.refresh_from_db()
     assert reservation.requester_confirmed
     assert expired_reservation.requester_confirmed is False
+
+
+def test_confirm_open_reservations_for_user_in_one_batch(
+    verified_user,
+    django_capture_on_commit_callbacks,
+):
+    event = event_factories.BrunchEventFactory.create(maximum_number_of_guests=3)
+    reservations = reservation_factories.EventReservationFactory.create_batch(
+        2,
+        event=event,
+        user=verified_user,
+    )
+    for reservation in reservations:
+        reservation_factories.ReservationLineFactory.create(
+            reservation=reservation,
+            amount=2,
+        )
+
+    with django_capture_on_commit_callbacks() as callbacks:
+        reservation_tasks.confirm_open_reservations_for_user.delay(verified_user.pk)
+    assert len(callbacks) == 1, "one consolidated notification"
+
+    confirmed_reservation, waiting_reservation = reservations
+    confirmed_reservation.refresh_from_db()
+    waiting_reservation.refresh_from_db()
+    assert confirmed_reservation.is_confirmed
+    assert confirmed_reservation.claimed_spots == 2
+    assert waiting_reservation.requester_confirmed
+    assert waiting_reservation.is_in_waiting_list
+    assert waiting_reservation.is_confirmed is False
+    assert waiting_reservation.updates.count() == 2
+    event.refresh_from_db()
+    assert event.reserved_spots == 2
@@ -11,10 +11,10 @@ from scaleos.events import models as event_models
 from scaleos.organizations.context_processors import organization_context
 from scaleos.reservations import models as reservation_models
 from scaleos.reservations.functions import get_organization_id_from_reservation
+from scaleos.shared import clock
 from scaleos.shared import views_htmx as shared_htmx
 from scaleos.shared.decorators import limit_unauthenticated_submissions
 from scaleos.shared.functions import valid_email_address
-from scaleos.shared.mixins import ITS_NOW
 from scaleos.shared.views_htmx import htmx_response
 
 logger = logging.getLogger("scaleos")
@@ -293,7 +293,7 @@ def finish_reservation(request, reservation_public_key):
         reservation.requester_auto_confirm(request)
         reservation.organization_auto_confirm()
 
-        reservation.finished_on = ITS_NOW
+        reservation.finished_on = clock.now()
         reservation.save()
 
     except ValidationError as e:
@@ -0,0 +1,56 @@
+"""
+The moment "now" for the running request or celery task.
+
+Use clock.now() instead of the time of import, so long-running workers
+never work with a frozen moment, while every property evaluated during the
+same request or task still agrees on one and the same "now".
+"""
+
+import contextlib
+from contextvars import ContextVar
+
+from django.utils import timezone
+
+_scoped_now = ContextVar("scoped_now", default=None)
+_frozen_now = ContextVar("frozen_now", default=None)
+
+
+def now():
+    frozen_now = _frozen_now.get()
+    if frozen_now is not None:
+        return frozen_now
+
+    scoped_now = _scoped_now.get()
+    if scoped_now is not None:
+        return scoped_now
+
+    return timezone.now()
+
+
+def start_scope():
+    return _scoped_now.set(timezone.now())
+
+
+def end_scope(token):
+    _scoped_now.reset(token)
+
+
+@contextlib.contextmanager
+def scope():
+    token = start_scope()
+    try:
+        yield now()
+    finally:
+        end_scope(token)
+
+
+@contextlib.contextmanager
+def freeze(moment):
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, timezone.get_default_timezone())
+
+    token = _frozen_now.set(moment)
+    try:
+        yield moment
+    finally:
+        _frozen_now.reset(token)
@@ -9,7 +9,7 @@ from django.utils.translation import gettext_lazy as _
 from email_validator import EmailNotValidError
 from email_validator import validate_email
 
-from scaleos.shared.mixins import ITS_NOW
+from scaleos.shared import clock
 
 logger = logging.getLogger(__name__)
 
@@ -103,10 +103,10 @@ def birthday_cleaning(birthday_string):
             date_object = datetime.strptime(birthday_string, fmt)  # noqa: DTZ007
 
             # Check for unlikely years (outside a reasonable range)
-            if date_object.year > ITS_NOW.year or date_object.year < max_year:
+            if date_object.year > clock.now().year or date_object.year < max_year:
                 logger.debug("Unlikely birthday: %s", date_object)
                 new_result = date_object - relativedelta(years=100)
-                if new_result.year > ITS_NOW.year:
+                if new_result.year > clock.now().year:
                     return None
                 return new_result.strftime("%Y-%m-%d")
 
@@ -228,3 +228,43 @@ def get_client_ip(request):
     )
 
 
+def bulk_create_multi_table(model, objs, batch_size=None):
+    """
+    bulk_create for multi-table inherited models, like the polymorphic ones:
+    one insert per table of the inheritance chain instead of a save per object.
+    save() is not called and no signals are sent.
+    """
+    if not objs:
+        return objs
+
+    chain = [model]
+    while chain[-1]._meta.parents:  # noqa: SLF001
+        chain.append(next(iter(chain[-1]._meta.parents)))  # noqa: SLF001
+    root_model, *child_models = reversed(chain)
+
+    for obj in objs:
+        if hasattr(obj, "pre_save_polymorphic"):
+            # store the real class before the root table is written
+            obj.pre_save_polymorphic()
+
+    fields = root_model._meta.local_concrete_fields  # noqa: SLF001
+    roots = [
+        root_model(**{field.attname: getattr(obj, field.attname) for field in fields})
+        for obj in objs
+    ]
+    root_model._base_manager.bulk_create(roots, batch_size=batch_size)  # noqa: SLF001
+    for obj, root in zip(objs, roots, strict=True):
+        for chain_model in chain:
+            setattr(obj, chain_model._meta.pk.attname, root.pk)  # noqa: SLF001
+        obj._state.adding = False  # noqa: SLF001
+        obj._state.db = root._state.db  # noqa: SLF001
+
+    for child_model in child_models:
+        logger.debug("Inserting %s rows for %s", len(objs), child_model.__name__)
+        child_model._base_manager.all()._batched_insert(  # noqa: SLF001
+            objs,
+            child_model._meta.local_concrete_fields,  # noqa: SLF001
+            batch_size,
+        )
+
+    return objs
@@ -0,0 +1,10 @@
+from scaleos.shared import clock
+
+
+class ClockMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with clock.scope():
+            return self.get_response(request)
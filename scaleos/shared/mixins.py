@@ -1,17 +1,13 @@
-import datetime
 import logging
 from uuid import uuid4
 
 from django.db import models
 from django.urls import reverse
-from django.utils import timezone
 from django.utils.functional import cached_property
 from django.utils.safestring import mark_safe
 
 logger = logging.getLogger(__name__)
 
-ITS_NOW = timezone.make_aware(datetime.datetime.now(), timezone.get_default_timezone())  # noqa: DTZ005
-
 
 class AdminLinkMixin(models.Model):
     class Meta:
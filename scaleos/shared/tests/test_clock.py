@@ -0,0 +1,29 @@
+import datetime
+
+from django.utils import timezone
+
+from scaleos.shared import clock
+
+
+def test_clock_moves_outside_a_scope():
+    first = clock.now()
+    assert timezone.is_aware(first)
+    assert clock.now() >= first
+
+
+def test_clock_is_evaluated_once_per_scope():
+    with clock.scope() as scoped_now:
+        assert clock.now() == scoped_now
+        assert clock.now() == scoped_now
+
+    assert clock.now() >= scoped_now
+
+
+def test_clock_can_be_frozen():
+    moment = datetime.datetime(2025, 3, 6, 11, 0)
+    with clock.freeze(moment) as frozen_now:
+        assert timezone.is_aware(frozen_now)
+        with clock.scope():
+            assert clock.now() == frozen_now
+
+    assert clock.now() != frozen_now
@@ -13,7 +13,7 @@ from django.utils.translation import gettext_lazy as _
 
 from scaleos.notifications.models import UserNotification
 from scaleos.reservations.tasks import confirm_open_reservations_for_user
-from scaleos.shared.mixins import ITS_NOW
+from scaleos.shared import clock
 
 if typing.TYPE_CHECKING:
     from allauth.socialaccount.models import SocialLogin
@@ -102,7 +102,7 @@ class AccountAdapter(DefaultAccountAdapter):
                     "activate_url": activate_url,
                 },
             )
-        emailconfirmation.sent = ITS_NOW
+        emailconfirmation.sent = clock.now()
         emailconfirmation.save(update_fields=["sent"])
 
         if signup:
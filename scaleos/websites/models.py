@@ -1,6 +1,7 @@
 # scaleos/websites/models.py
 
 import logging
+from urllib.parse import urlparse
 
 from admin_ordering.models import OrderableModel
 from colorfield.fields import ColorField
@@ -10,12 +11,12 @@ from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 from django_extensions.db.models import TimeStampedModel
 from polymorphic.models import PolymorphicModel
-from urllib.parse import urlparse
+
 from scaleos.events import models as event_models
+from scaleos.shared import clock
 from scaleos.shared.fields import NameField
 from scaleos.shared.fields import PublicKeyField
 from scaleos.shared.fields import SegmentField
-from scaleos.shared.mixins import ITS_NOW
 from scaleos.shared.mixins import AdminLinkMixin
 
 logger = logging.getLogger("scaleos")
@@ -196,8 +197,8 @@ class Website(
     @property
     def published_pages(self):
         return self.pages.filter(
-            Q(publish_from__lte=ITS_NOW)
-            & (Q(publish_till__isnull=True) | Q(publish_till__gte=ITS_NOW)),
+            Q(publish_from__lte=clock.now())
+            & (Q(publish_till__isnull=True) | Q(publish_till__gte=clock.now())),
         ).order_by("ordering")
     
 
@@ -345,10 +346,10 @@ class Page(
     @property
     def published_blocks(self):
         return self.blocks.filter(
-            Q(block__publish_from__lte=ITS_NOW)
+            Q(block__publish_from__lte=clock.now())
             & (
                 Q(block__publish_till__isnull=True)
-                | Q(block__publish_till__gte=ITS_NOW)
+                | Q(block__publish_till__gte=clock.now())
             ),
         ).order_by("ordering")
 
@@ -445,9 +446,13 @@ class EventsBlock(Block):
             organizer_id=organization.pk,
         ).values_list("id", flat=True)
 
-        result = event_models.Event.objects.filter(
-            concept__organizer_id=organization.pk,
-        ).exclude(concept_id__in=customer_concept_ids)
+        result = (
+            event_models.Event.objects.filter(
+                concept__organizer_id=organization.pk,
+            )
+            .exclude(concept_id__in=customer_concept_ids)
+            .with_listing_data()
+        )
         logger.debug("Results found: %s", result.count())
         return result
 